@@ -0,0 +1,35 @@
+from crud.subscriptions import extend_subscription, create_subscription
+from crud.users import get_user_by_telegram_id
+from constants import CHAT_ID, PERIOD_DAYS
+from outbox import outbox
+
+
+async def activate_subscription(session, bot, transaction) -> str:
+    """
+    Выдаёт подписку по оплаченной транзакции и возвращает текст для пользователя.
+    Используется и кнопкой "Проверить оплату", и фоновым наблюдателем за кошельками.
+    """
+    user = await get_user_by_telegram_id(session, transaction.initiator)
+
+    # Если у пользователя есть пригласивший, продлеваем подписку пригласившему.
+    # Старые записи могут ссылаться на несуществующего пользователя: подписку ему не создать (внешний ключ)
+    if user and user.invited_by and await get_user_by_telegram_id(session, user.invited_by):
+        await extend_subscription(session, user.invited_by)
+        outbox.send_message(user.invited_by, "Ваша подписка была продлена благодаря рефералу!")
+
+    # Определяем тип подписки
+    subscription_type = "Без чата" if not transaction.with_chat else "С чатом"
+
+    days = PERIOD_DAYS.get(transaction.period, 30)
+
+    # Создаем подписку
+    subscription = await create_subscription(session, transaction.initiator, subscription_type, days)
+
+    # Отправляем ссылку на чат, если подписка "С чатом"
+    invite_link = await bot.create_chat_invite_link(CHAT_ID, expire_date=None, member_limit=1)
+    if subscription_type == "С чатом":
+        return f"Оплата успешно выполнена! Вот ваша одноразовая ссылка на чат:\n\n{invite_link.invite_link}"
+    return (
+        f"Оплата успешно выполнена! Ваша подписка без возможности писать активирована до {subscription.expiration_date.strftime('%Y-%m-%d')}."
+        f"\n\nСсылка: {invite_link.invite_link}"
+    )
@@ -0,0 +1,158 @@
+import bisect
+import time
+from collections import defaultdict
+
+from constants import PAYMENT_TOLERANCE
+
+# Во сколько раз расстояние между соседними суммами больше допуска.
+# Окна допуска соседних сумм занимают 2 * tolerance, поэтому берём с запасом.
+SLOT_SPACING_FACTOR = 3
+# Шаг плотных сумм (доля), которые выдаются, когда суммы с непересекающимися окнами кончились
+DENSE_SLOT_SPACING = 0.0001
+# Насколько выданная сумма может отличаться от цены (доля), чтобы не переплачивать.
+# У одной цены в паре (блокчейн, валюта) помещается 1 + 2 * int(0.05 / 0.003) = 33 суммы
+# с непересекающимися окнами и всего 1 + 2 * int(0.05 / 0.0001) = 1001 сумма с плотными
+MAX_SLOT_DEVIATION = 0.05
+# Точность суммы, которую показываем пользователю
+AMOUNT_PRECISION = 6
+# Сколько секунд держать выданную сумму, которой ещё нет в снимке базы (время жизни оплаты)
+UNCONFIRMED_SLOT_TTL = 15 * 60
+
+
+class AmountAllocator:
+    """
+    Выдаёт ожидающим оплатам уникальные суммы внутри пары (блокчейн, валюта).
+
+    Сначала выдаются суммы, отстоящие от соседних больше, чем на ширину окна
+    допуска: перевод в пределах допуска однозначно указывает на одну транзакцию.
+    Когда такие кончились, суммы выдаются с шагом DENSE_SLOT_SPACING, а перевод
+    достаётся ближайшей сумме (точный перевод — всегда своей). Занятые суммы
+    хранятся в отсортированном списке, так что поиск владельца перевода стоит O(log n).
+    """
+
+    def __init__(self, tolerance=PAYMENT_TOLERANCE, spacing_factor=SLOT_SPACING_FACTOR):
+        self.tolerance = tolerance
+        self.spacing_factor = spacing_factor
+        self._amounts = defaultdict(list)  # (блокчейн, валюта) -> отсортированные суммы
+        self._owners = defaultdict(list)  # (блокчейн, валюта) -> id транзакций в том же порядке
+        self._slots = {}  # id транзакции -> ((блокчейн, валюта), сумма)
+        # id транзакции -> [когда выдана, время последнего снимка базы, где она была]
+        self._seen = {}
+
+    def _is_free(self, key, amount, gap):
+        amounts = self._amounts[key]
+        index = bisect.bisect_left(amounts, amount - gap)
+        return index == len(amounts) or amounts[index] > amount + gap
+
+    def _insert(self, key, amount, transaction_id):
+        index = bisect.bisect_left(self._amounts[key], amount)
+        self._amounts[key].insert(index, amount)
+        self._owners[key].insert(index, transaction_id)
+        self._slots[transaction_id] = (key, amount)
+        self._seen[transaction_id] = [time.monotonic(), None]
+
+    def allocate(self, blockchain, currency, base_amount, transaction_id):
+        """
+        Подбирает ближайшую к base_amount свободную сумму и закрепляет её за транзакцией.
+        """
+        self.release(transaction_id)
+        key = (blockchain, currency)
+        # (шаг, насколько близко может быть соседняя сумма): сначала окна не пересекаются, затем плотно
+        tiers = (
+            (self.tolerance * self.spacing_factor, self.tolerance * (self.spacing_factor - 1)),
+            (DENSE_SLOT_SPACING, DENSE_SLOT_SPACING / 2),
+        )
+        for spacing, gap in tiers:
+            step = base_amount * spacing
+            for offset in range(int(MAX_SLOT_DEVIATION / spacing) + 1):
+                for sign in ((1,) if offset == 0 else (1, -1)):
+                    amount = round(base_amount + sign * offset * step, AMOUNT_PRECISION)
+                    if amount > 0 and self._is_free(key, amount, amount * gap):
+                        self._insert(key, amount, transaction_id)
+                        return amount
+
+        raise ValueError("Не удалось подобрать уникальную сумму оплаты, попробуйте позже.")
+
+    def reserve(self, blockchain, currency, amount, transaction_id):
+        """
+        Занимает уже выданную сумму (при загрузке ожидающих транзакций из базы).
+        """
+        self.release(transaction_id)
+        self._insert((blockchain, currency), amount, transaction_id)
+
+    def release(self, transaction_id):
+        """
+        Освобождает сумму транзакции после оплаты, отмены или истечения срока.
+        """
+        slot = self._slots.pop(transaction_id, None)
+        self._seen.pop(transaction_id, None)
+        if slot is None:
+            return
+        key, amount = slot
+        amounts, owners = self._amounts[key], self._owners[key]
+        index = bisect.bisect_left(amounts, amount)
+        while index < len(amounts) and amounts[index] == amount:
+            if owners[index] == transaction_id:
+                del amounts[index]
+                del owners[index]
+                return
+            index += 1
+
+    def match(self, blockchain, currency, received_amount):
+        """
+        id транзакции с ближайшей суммой, если полученная сумма в её окне допуска, или None.
+        """
+        key = (blockchain, currency)
+        amounts = self._amounts.get(key)
+        if not amounts:
+            return None
+        index = bisect.bisect_left(amounts, received_amount)
+        best = None
+        for candidate in (index - 1, index):
+            if 0 <= candidate < len(amounts):
+                distance = abs(received_amount - amounts[candidate])
+                if distance <= amounts[candidate] * self.tolerance and (best is None or distance < best[0]):
+                    best = (distance, candidate)
+        return self._owners[key][best[1]] if best else None
+
+    def sync(self, blockchain, currency, transactions, snapshot_at):
+        """
+        Сливает индекс пары (блокчейн, валюта) с ожидающими транзакциями из базы.
+        Нужен, когда суммы выдают несколько процессов: каждый видит только свои.
+
+        snapshot_at — time.monotonic() перед чтением transactions. Снимок мог устареть,
+        пока шли сетевые запросы, поэтому своя сумма убирается, только если она уже была
+        в более раннем снимке и пропала (оплачена или отменена в другом процессе), либо
+        так и не попала в базу за время жизни оплаты.
+        """
+        key = (blockchain, currency)
+        in_snapshot = {transaction.id: transaction for transaction in transactions}
+        for transaction_id in list(self._owners.get(key, ())):
+            if transaction_id in in_snapshot:
+                continue
+            allocated_at, seen_at = self._seen[transaction_id]
+            left_pending = seen_at is not None and seen_at < snapshot_at
+            if left_pending or allocated_at < snapshot_at - UNCONFIRMED_SLOT_TTL:
+                self.release(transaction_id)
+
+        for transaction_id, transaction in in_snapshot.items():
+            slot = self._slots.get(transaction_id)
+            # Сумму выдали в этом процессе уже после снимка — она новее базы
+            if slot is not None and self._seen[transaction_id][0] >= snapshot_at:
+                continue
+            if slot != (key, transaction.expected_amount):
+                self.reserve(blockchain, currency, transaction.expected_amount, transaction_id)
+            seen = self._seen[transaction_id]
+            seen[1] = max(seen[1] or snapshot_at, snapshot_at)
+
+    def warm(self, transactions):
+        """
+        Восстанавливает индекс по ожидающим транзакциям из базы.
+        """
+        for transaction in transactions:
+            self.reserve(transaction.blockchain, transaction.currency, transaction.expected_amount, transaction.id)
+            seen = self._seen[transaction.id]
+            seen[1] = seen[0]
+
+
+amount_allocator = AmountAllocator()
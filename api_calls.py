@@ -1,16 +1,35 @@
 import asyncio
+import itertools
+import logging
 import time
 from abc import ABC, abstractmethod
+from collections import namedtuple, OrderedDict
+from datetime import datetime
 import os
-import requests
+
+import aiohttp
 from dotenv import load_dotenv
-from requests import HTTPError
 
-from main import session
+from claimed_hashes import claimed_hashes
+from constants import PAYMENT_TOLERANCE, INGEST_MIN_INTERVAL
+from crud.ledger import find_payment_transfer
+from crud.transactions import get_oldest_pending_time, get_pending_amounts, mark_transaction_paid
+from rates import rate_service
+from endpoints import EndpointPool
+from metrics import Gauge, chain_request_errors, chain_request_seconds
+from resilience import (
+    ExplorerError,
+    ProviderUnavailableError,
+    RateLimitError,
+    call_with_breaker,
+    get_breaker,
+    is_transient,
+)
+
+logger = logging.getLogger(__name__)
 
 load_dotenv()
 
-import requests
 import os
 from dotenv import load_dotenv
 
@@ -22,319 +41,783 @@ tron_wallet_address = os.environ.get('TRON_WALLET_ADDRESS')
 
 
 def get_sol_usd_rate():
-    response = requests.get("https://api.coingecko.com/api/v3/simple/price?ids=solana&vs_currencies=usd")
-    if response.status_code == 200:
-        return response.json().get("solana", {}).get("usd", 1)
-    return -1
+    return rate_service.get_rate("SOL")
 
 
 def get_ton_usd_rate():
-    url = f"https://tonapi.io/v2/rates"
-    params = {
-        "tokens": "ton",
-        "currencies": "usd",
-    }
-    try:
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        data = response.json()
-        if data:
-            try:
-                return data.get("rates", {}).get("TON", {}).get("prices", {}).get("USD", {})
-            except ValueError:
-                raise ValueError("Курс TON/USD не найден.")
-        else:
-            raise ValueError(f"Ошибка в API: {data.get('error')}")
-    except requests.RequestException as e:
-        raise SystemExit(f"Ошибка соединения: {e}")
-    except ValueError as e:
-        raise SystemExit(f"Ошибка данных: {e}")
+    return rate_service.get_rate("TON")
 
 
 def get_bnb_usd_rate():
-    response = requests.get("https://api.coingecko.com/api/v3/simple/price?ids=binancecoin&vs_currencies=usd")
-    if response.status_code == 200:
-        return response.json().get("binancecoin", {}).get("usd", 1)
-    return -1
+    return rate_service.get_rate("BNB")
 
 
 def get_eth_usd_rate():
     """
     Получение текущего курса ETH/USD.
     """
-    response = requests.get("https://api.coingecko.com/api/v3/simple/price?ids=ethereum&vs_currencies=usd")
-    if response.status_code == 200:
-        return response.json().get("ethereum", {}).get("usd", 1)
-    return -1
+    return rate_service.get_rate("ETH")
 
 
 def get_trx_usd_rate():
     """
     Получение курса TRX/USD.
     """
-    response = requests.get("https://api.coingecko.com/api/v3/simple/price?ids=tron&vs_currencies=usd")
-    if response.status_code == 200:
-        return response.json().get("tron", {}).get("usd", 1)
-    return -1
+    return rate_service.get_rate("TRX")
+
+
+# Нормализованный входящий перевод на кошелёк проекта
+Transfer = namedtuple("Transfer", ["tx_hash", "amount", "timestamp"])
+
+# Сколько записей запрашивать за одну страницу и сколько страниц максимум за один проход
+PAGE_SIZE = 50
+MAX_PAGES = 10
+
+SYSTEM_PROGRAM_ID = "11111111111111111111111111111111"
+
+
+def _is_incoming(address, wallet_address):
+    return bool(address) and address.lower() == (wallet_address or "").lower()
+
+
+def _from_unix(seconds):
+    return datetime.utcfromtimestamp(int(seconds)) if seconds else None
+
+
+def _page_count(cursor, since):
+    # Без курсора и окна оплат хватает последних переводов, иначе листаем до них
+    return MAX_PAGES if cursor or since else 1
+
+
+def _older_than(seconds, since):
+    return since is not None and bool(seconds) and _from_unix(seconds) < since
+
+
+# Последняя пара iter_transfers, если страницы кончились раньше курсора или since
+TRUNCATED = object()
+
+
+def _split_cursor(cursor):
+    """
+    Курсор "голова|точка продолжения|старый курсор" оставляет fetch_transfers_since,
+    когда не дочитал историю до старого курсора. Обычный курсор — (cursor, None, cursor).
+    """
+    if not cursor or "|" not in cursor:
+        return cursor, None, cursor
+    head, resume, stop = cursor.split("|", 2)
+    return head, resume, stop or None
+
 
+def _join_cursor(head, resume, stop):
+    return f"{head}|{resume}|{stop or ''}"
 
 
 class BlockchainAPI(ABC):
     """
     Абстрактный класс для взаимодействия с различными блокчейнами.
+
+    Каждый экземпляр держит собственную долгоживущую aiohttp-сессию с пулом
+    соединений, поэтому запросы к обозревателю не блокируют event loop бота.
     """
 
+    default_timeout = 10
+    connection_limit = 20
+    # Имя автомата провайдера в resilience (совпадает с ключом блокчейна в BlockchainFactory)
+    provider = None
+
+    def __init__(self, urls, timeout=None):
+        self.timeout = aiohttp.ClientTimeout(total=timeout or self.default_timeout)
+        self.endpoints = EndpointPool(urls)
+        self.breaker = get_breaker(self.provider or type(self).__name__)
+        self._session = None
+
+    def _get_session(self):
+        # Сессия создаётся лениво, уже внутри работающего event loop
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                timeout=self.timeout,
+                connector=aiohttp.TCPConnector(limit=self.connection_limit, ttl_dns_cache=300),
+            )
+        return self._session
+
+    async def _request(self, method, path, check=None, **kwargs):
+        """
+        HTTP-запрос к пути path на одном из адресов провайдера (с переключением и
+        дублированием медленных запросов) через автомат провайдера с повторами.
+        check(data) может поднять ExplorerError/RateLimitError по телу ответа.
+        """
+        async def send(base_url):
+            started = time.perf_counter()
+            try:
+                async with self._get_session().request(method, base_url + path, **kwargs) as response:
+                    response.raise_for_status()
+                    data = await response.json(content_type=None)
+                if check is not None:
+                    check(data)
+            except Exception as e:
+                chain_request_seconds.observe(time.perf_counter() - started, self.breaker.name, "error")
+                chain_request_errors.inc(self.breaker.name, type(e).__name__)
+                raise
+            chain_request_seconds.observe(time.perf_counter() - started, self.breaker.name, "ok")
+            return data
+
+        return await call_with_breaker(self.breaker, lambda: self.endpoints.call(send))
+
+    async def _get(self, path="", params=None, check=None):
+        if params:
+            params = {key: value for key, value in params.items() if value is not None}
+        return await self._request("GET", path, check, params=params)
+
+    async def _post(self, path, payload, check=None):
+        return await self._request("POST", path, check, json=payload)
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
     @abstractmethod
-    def get_last_transactions(self, wallet_address, limit=3):
+    async def get_last_transactions(self, wallet_address, limit=3):
         pass
 
     @abstractmethod
-    def get_transaction_details(self, tx_hash):
+    async def get_transaction_details(self, tx_hash):
         pass
 
+    @abstractmethod
+    def iter_transfers(self, wallet_address, contract_address, cursor=None, since=None, before=None):
+        """
+        Асинхронный генератор по истории кошелька от новых записей к старым: пары
+        (позиция записи для курсора, Transfer или None, если запись — не входящий перевод).
+        Начинает с самой новой записи, а с before — с записей не новее позиции before.
+        Останавливается на курсоре или на первой записи старше since (времени самой
+        ранней ожидающей оплаты); без курсора и since — после первой страницы.
+        Если за MAX_PAGES страниц не дошли до курсора или since, последней идёт (TRUNCATED, None).
+        Страницы запрашиваются по мере чтения, поэтому ранний выход экономит запросы.
+        """
+
+    async def _scan(self, wallet_address, contract_address, cursor, since, before=None):
+        """
+        Один проход iter_transfers: (переводы, первая позиция, последняя позиция, дочитан ли до конца).
+        """
+        transfers, first, last, truncated = [], None, None, False
+        async for position, transfer in self.iter_transfers(wallet_address, contract_address, cursor, since, before):
+            if position is TRUNCATED:
+                truncated = True
+                continue
+            if first is None:
+                first = position
+            last = position
+            if transfer is not None:
+                transfers.append(transfer)
+        return transfers, first, last, truncated
+
+    async def fetch_transfers_since(self, wallet_address, contract_address, cursor, since=None):
+        """
+        Входящие переводы, появившиеся после курсора (и не раньше since), и новый курсор.
+
+        Если за MAX_PAGES страниц история не дочитана до курсора, курсор запоминает
+        точку продолжения: следующий вызов сначала дочитывает пропуск до старого
+        курсора и только потом берёт новые записи.
+        """
+        head, resume, stop = _split_cursor(cursor)
+        transfers = []
+        if resume is not None:
+            transfers, _, last, truncated = await self._scan(wallet_address, contract_address, stop, since, resume)
+            if truncated:
+                return transfers, _join_cursor(head, last, stop)
+
+        fresh, first, last, truncated = await self._scan(wallet_address, contract_address, head, since)
+        transfers.extend(fresh)
+        if truncated and (head or since):
+            return transfers, _join_cursor(first, last, head)
+        return transfers, first or head
+
+
+class BatchRejectedError(ExplorerError):
+    """
+    JSON-RPC отказался принимать батчи (а не временно не справился с запросом).
+    """
+
 
-class SolanaAPI(BlockchainAPI):
-    def __init__(self, rpc_url):
-        self.rpc_url = rpc_url
+# Коды JSON-RPC, которыми узлы отвечают на батч, если не поддерживают их
+_BATCH_REJECTION_CODES = (-32600, -32601)
+
+
+def _is_batch_rejection(error):
+    if not isinstance(error, dict):
+        return True
+    return error.get("code") in _BATCH_REJECTION_CODES or "batch" in str(error.get("message", "")).lower()
 
-    def get_last_transactions(self, wallet_address, limit=3):
+
+class SolanaAPI(BlockchainAPI):
+    provider = "SOL"
+    # Сколько подписей отправлять в одном JSON-RPC батче
+    batch_size = 20
+    # Сколько одиночных getTransaction одновременно, если RPC не принимает батчи
+    details_concurrency = 4
+    # Сколько разобранных транзакций держать в LRU-кэше
+    details_cache_size = 1024
+
+    def __init__(self, rpc_urls, timeout=None):
+        super().__init__(rpc_urls, timeout)
+        self._details_cache = OrderedDict()  # подпись -> результат getTransaction
+        self._details_semaphore = asyncio.Semaphore(self.details_concurrency)
+        self._batch_supported = True
+
+    async def get_last_transactions(self, wallet_address, limit=3, until=None, before=None):
+        options = {"limit": limit}
+        if until:
+            options["until"] = until
+        if before:
+            options["before"] = before
         payload = {
             "jsonrpc": "2.0",
             "id": 1,
             "method": "getSignaturesForAddress",
-            "params": [wallet_address, {"limit": limit}],
+            "params": [wallet_address, options],
         }
-        response = requests.post(self.rpc_url, json=payload)
-        response.raise_for_status()
-        return response.json().get("result", [])
+        data = await self._post("", payload)
+        if "error" in data:
+            raise ExplorerError(data["error"])
+        return data.get("result", [])
 
-    def get_transaction_details(self, tx_hash):
-        payload = {
+    @staticmethod
+    def _details_request(tx_hash, request_id=1):
+        return {
             "jsonrpc": "2.0",
-            "id": 1,
+            "id": request_id,
             "method": "getTransaction",
-            "params": [tx_hash, "jsonParsed"],
+            "params": [tx_hash, {"encoding": "jsonParsed", "maxSupportedTransactionVersion": 0}],
         }
-        response = requests.post(self.rpc_url, json=payload)
-        response.raise_for_status()
-        return response.json().get("result", {})
 
+    def _remember_details(self, tx_hash, details):
+        self._details_cache[tx_hash] = details
+        self._details_cache.move_to_end(tx_hash)
+        if len(self._details_cache) > self.details_cache_size:
+            self._details_cache.popitem(last=False)
+
+    async def get_transaction_details(self, tx_hash):
+        cached = self._details_cache.get(tx_hash)
+        if cached is not None:
+            self._details_cache.move_to_end(tx_hash)
+            return cached
+
+        async with self._details_semaphore:
+            data = await self._post("", self._details_request(tx_hash))
+        if "error" in data:
+            raise ExplorerError(data["error"])
+        details = data.get("result") or {}
+        # Неподтверждённые транзакции (result = null) не кэшируем, они ещё появятся
+        if details:
+            self._remember_details(tx_hash, details)
+        return details
+
+    async def _get_details_batch(self, signatures):
+        """
+        Один HTTP-запрос на пачку подписей. Возвращает найденные детали и подписи,
+        которые RPC не отдал (ошибка в элементе батча).
+        """
+        payload = [self._details_request(tx_hash, request_id) for request_id, tx_hash in enumerate(signatures)]
+        data = await self._post("", payload)
+        if not isinstance(data, list):
+            error = data.get("error") if isinstance(data, dict) else data
+            # RPC не поддерживает батчи — или отклонил запрос целиком по другой причине
+            if _is_batch_rejection(error):
+                raise BatchRejectedError(error)
+            raise ExplorerError(error)
+
+        found, failed = {}, []
+        responses = {item.get("id"): item for item in data}
+        for request_id, tx_hash in enumerate(signatures):
+            item = responses.get(request_id)
+            if item is None or "error" in item:
+                failed.append(tx_hash)
+                continue
+            details = item.get("result") or {}
+            if details:
+                self._remember_details(tx_hash, details)
+            found[tx_hash] = details
+        return found, failed
+
+    async def get_transactions_details(self, signatures):
+        """
+        Детали сразу для многих подписей: из LRU-кэша, затем JSON-RPC батчами,
+        а если батч не прошёл — одиночными запросами с ограниченной параллельностью.
+        """
+        result = {}
+        missing = []
+        for tx_hash in signatures:
+            cached = self._details_cache.get(tx_hash)
+            if cached is not None:
+                self._details_cache.move_to_end(tx_hash)
+                result[tx_hash] = cached
+            else:
+                missing.append(tx_hash)
+
+        fallback = []
+        for start in range(0, len(missing), self.batch_size):
+            chunk = missing[start:start + self.batch_size]
+            if not self._batch_supported:
+                fallback.extend(chunk)
+                continue
+            try:
+                found, failed = await self._get_details_batch(chunk)
+            except aiohttp.ClientResponseError as e:
+                # 5xx и 429 пережили повторы — это сбой провайдера, а не отказ от батчей
+                if is_transient(e):
+                    raise
+                self._disable_batches(chunk, fallback)
+                continue
+            except BatchRejectedError:
+                self._disable_batches(chunk, fallback)
+                continue
+            result.update(found)
+            fallback.extend(failed)
 
-class BinanceSmartChainAPI(BlockchainAPI):
-    def __init__(self, api_key):
-        self.api_key = api_key
-        self.api_url = "https://api.bscscan.com/api"
-
-    def get_last_transactions(self, wallet_address, limit=3):
-        url = f"{self.api_url}?module=account&action=txlist&address={wallet_address}&apikey={self.api_key}"
-        response = requests.get(url)
-        response.raise_for_status()
-        return response.json().get("result", [])
-
-    def get_last_token_transactions(self, wallet_address, contract_address, limit=3):
-        url = (
-            f"{self.api_url}?module=account&action=tokentx"
-            f"&contractaddress={contract_address}&address={wallet_address}"
-            f"&apikey={self.api_key}&sort=desc&page=1&offset=3"
-        )
-        response = requests.get(url)
-        response.raise_for_status()
-        return response.json().get("result", [])
-
-    def get_transaction_details(self, tx_hash):
-        return {"tx_hash": tx_hash}
+        if fallback:
+            details = await asyncio.gather(*(self.get_transaction_details(tx_hash) for tx_hash in fallback))
+            result.update(zip(fallback, details))
+        return result
+
+    def _disable_batches(self, chunk, fallback):
+        # Публичные RPC иногда отключают батчи (4xx или ошибка JSON-RPC): дальше работаем одиночными запросами
+        self._batch_supported = False
+        fallback.extend(chunk)
 
+    @staticmethod
+    def parse_transfer_amount(details, wallet_address):
+        """
+        Сумма перевода SOL на кошелёк из разобранной транзакции или None.
+        """
+        instructions = details.get("transaction", {}).get("message", {}).get("instructions", [])
+        for instruction in instructions:
+            info = instruction.get("parsed", {}).get("info", {})
+            if instruction.get("programId") == SYSTEM_PROGRAM_ID and info.get("destination", "") == wallet_address:
+                return float(info.get("lamports", 0)) / 1e9
+        return None
+
+    async def iter_transfers(self, wallet_address, contract_address, cursor=None, since=None, before=None):
+        # Подписи идут от новых к старым; until останавливает выборку на курсоре.
+        # Детали запрашиваются постранично и только для незасчитанных подписей внутри окна.
+        for _ in range(_page_count(cursor or before, since)):
+            page = await self.get_last_transactions(wallet_address, PAGE_SIZE, until=cursor, before=before)
+            window = list(itertools.takewhile(lambda item: not _older_than(item.get("blockTime"), since), page))
+            successful = [
+                item["signature"] for item in window
+                if not item.get("err") and item["signature"] not in claimed_hashes
+            ]
+            details_by_signature = await self.get_transactions_details(successful) if successful else {}
+
+            for item in window:
+                if item["signature"] in claimed_hashes:
+                    yield item["signature"], None
+                    continue
+                amount = self.parse_transfer_amount(details_by_signature.get(item["signature"]) or {}, wallet_address)
+                transfer = Transfer(item["signature"], amount, _from_unix(item.get("blockTime"))) if amount else None
+                yield item["signature"], transfer
+
+            if len(window) < len(page) or len(page) < PAGE_SIZE:
+                return
+            before = page[-1]["signature"]
+        yield TRUNCATED, None
+
+
+class EtherscanAPI(BlockchainAPI):
+    """
+    Общий клиент для обозревателей на движке Etherscan (bscscan, basescan).
+    """
 
-class BaseApi(BlockchainAPI):
-    def __init__(self, api_key):
+    def __init__(self, api_key, api_urls, timeout=None):
+        super().__init__(api_urls, timeout)
         self.api_key = api_key
-        self.api_url = "https://api.basescan.org/api"
-
-    def get_last_transactions(self, wallet_address, limit=3):
-        url = f"{self.api_url}?module=account&action=txlist&address={wallet_address}&apikey={self.api_key}"
-        response = requests.get(url)
-        response.raise_for_status()
-        return response.json().get("result", [])
-
-    def get_last_token_transactions(self, wallet_address, contract_address, limit=3):
-        url = (
-            f"{self.api_url}?module=account&action=tokentx"
-            f"&contractaddress={contract_address}&address={wallet_address}"
-            f"&apikey={self.api_key}&sort=desc&page=1&offset={limit}"
-        )
-        response = requests.get(url)
-        response.raise_for_status()
-        return response.json().get("result", [])
-
-    def get_transaction_details(self, tx_hash):
+
+    @staticmethod
+    def _check_result(data):
+        result = data.get("result", [])
+        # При ошибке (например, превышен лимит) result содержит строку с описанием
+        if isinstance(result, str):
+            if "rate limit" in result.lower():
+                raise RateLimitError(result)
+            raise ExplorerError(result)
+
+    async def _account_request(self, params):
+        data = await self._get(params={"module": "account", "apikey": self.api_key, **params}, check=self._check_result)
+        return data.get("result", [])
+
+    async def get_last_transactions(self, wallet_address, limit=3, start_block=None, page=1, end_block=None):
+        return await self._account_request({
+            "action": "txlist",
+            "address": wallet_address,
+            "startblock": start_block,
+            "endblock": end_block,
+            "sort": "desc",
+            "page": page,
+            "offset": limit,
+        })
+
+    async def get_last_token_transactions(self, wallet_address, contract_address, limit=3, start_block=None, page=1,
+                                          end_block=None):
+        return await self._account_request({
+            "action": "tokentx",
+            "contractaddress": contract_address,
+            "address": wallet_address,
+            "startblock": start_block,
+            "endblock": end_block,
+            "sort": "desc",
+            "page": page,
+            "offset": limit,
+        })
+
+    async def get_transaction_details(self, tx_hash):
         return {"tx_hash": tx_hash}
 
+    @staticmethod
+    def parse_transfer(tx, wallet_address):
+        if not _is_incoming(tx.get("to"), wallet_address) or tx.get("isError", "0") != "0":
+            return None
+        decimals = int(tx.get("tokenDecimal") or 18)
+        amount = float(tx.get("value", 0)) / 10 ** decimals
+        if not amount:
+            return None
+        return Transfer(tx.get("hash"), amount, _from_unix(tx.get("timeStamp")))
+
+    async def iter_transfers(self, wallet_address, contract_address, cursor=None, since=None, before=None):
+        # Курсор — номер последнего обработанного блока. startblock отсекает старые блоки
+        # на стороне обозревателя, endblock — новее точки продолжения; граничные блоки
+        # приходят повторно, дубликаты отсекаются уникальностью хэша в журнале.
+        start_block = int(cursor) if cursor else None
+        end_block = int(before) if before else None
+        for page in range(1, _page_count(cursor or before, since) + 1):
+            if contract_address:
+                transactions = await self.get_last_token_transactions(
+                    wallet_address, contract_address, PAGE_SIZE, start_block, page, end_block
+                )
+            else:
+                transactions = await self.get_last_transactions(
+                    wallet_address, PAGE_SIZE, start_block, page, end_block
+                )
+
+            for tx in transactions:
+                if _older_than(tx.get("timeStamp"), since):
+                    return
+                if tx.get("hash") in claimed_hashes:
+                    yield tx.get("blockNumber"), None
+                    continue
+                yield tx.get("blockNumber"), self.parse_transfer(tx, wallet_address)
+            if len(transactions) < PAGE_SIZE:
+                return
+        yield TRUNCATED, None
+
+
+class BinanceSmartChainAPI(EtherscanAPI):
+    provider = "BSC"
+
+    def __init__(self, api_key, timeout=None, api_urls=None):
+        super().__init__(api_key, api_urls or ["https://api.bscscan.com/api"], timeout)
+
+
+class BaseApi(EtherscanAPI):
+    provider = "Base"
+
+    def __init__(self, api_key, timeout=None, api_urls=None):
+        super().__init__(api_key, api_urls or ["https://api.basescan.org/api"], timeout)
+
 
 class TronAPI(BlockchainAPI):
-    def __init__(self, api_key):
+    provider = "TRON"
+
+    def __init__(self, api_key, timeout=None, api_urls=None):
+        # Оба адреса — один и тот же API tronscan
+        super().__init__(api_urls or ["https://apilist.tronscanapi.com", "https://apilist.tronscan.org"], timeout)
         self.api_key = api_key
 
-    def get_last_transactions(self, wallet_address, limit=3):
-        url = f"https://apilist.tronscan.org/api/transaction?address={wallet_address}&limit={limit}&apikey={self.api_key}"
-        response = requests.get(url)
-        response.raise_for_status()
-        return response.json().get("data", [])
-
-    def get_last_token_transactions(self, wallet_address, contract_address, limit=3):
-        url = (
-            f"https://apilist.tronscanapi.com/api/token_trc20/transfers"
-            f"?contract_address={contract_address}"  # Адрес контракта TRC20
-            f"&relatedAddress={wallet_address}"  # Адрес кошелька
-            f"&sort=-timestamp"  # Сортировка по времени (новейшие транзакции сначала)
-            f"&limit={limit}"  # Количество транзакций на странице
-            f"&start=0"  # Начальный индекс для пагинации
-        )
-        response = requests.get(url)
-        response.raise_for_status()
-        return response.json().get("token_transfers", [])
-
-    def get_transaction_details(self, tx_hash):
-        url = f"https://apilist.tronscan.org/api/transaction-info?hash={tx_hash}"
-        response = requests.get(url)
-        response.raise_for_status()
-        return response.json()
+    async def get_last_transactions(self, wallet_address, limit=3, start=0, end_timestamp=None):
+        params = {
+            "address": wallet_address,
+            "sort": "-timestamp",
+            "limit": limit,
+            "start": start,
+            "end_timestamp": end_timestamp,
+            "apikey": self.api_key,
+        }
+        data = await self._get("/api/transaction", params=params)
+        return data.get("data", [])
+
+    async def get_last_token_transactions(self, wallet_address, contract_address, limit=3, start=0,
+                                          end_timestamp=None):
+        params = {
+            "contract_address": contract_address,  # Адрес контракта TRC20
+            "relatedAddress": wallet_address,  # Адрес кошелька
+            "sort": "-timestamp",  # Сортировка по времени (новейшие транзакции сначала)
+            "limit": limit,  # Количество транзакций на странице
+            "start": start,  # Начальный индекс для пагинации
+            "end_timestamp": end_timestamp,  # Не новее этой метки (мс)
+        }
+        data = await self._get("/api/token_trc20/transfers", params=params)
+        return data.get("token_transfers", [])
+
+    async def get_transaction_details(self, tx_hash):
+        return await self._get("/api/transaction-info", params={"hash": tx_hash})
+
+    @staticmethod
+    def parse_transfer(tx, wallet_address, token=False):
+        if token:
+            if not _is_incoming(tx.get("to_address"), wallet_address):
+                return None
+            amount = float(tx.get("quant", 0)) / 1e6
+            return Transfer(tx.get("transaction_id"), amount, _from_unix(tx.get("block_ts", 0) // 1000))
+
+        contract_data = tx.get("contractData") or {}
+        if not _is_incoming(contract_data.get("to_address"), wallet_address):
+            return None
+        amount = float(contract_data.get("amount", 0)) / 1e6
+        return Transfer(tx.get("hash"), amount, _from_unix(tx.get("timestamp", 0) // 1000))
+
+    async def iter_transfers(self, wallet_address, contract_address, cursor=None, since=None, before=None):
+        # Курсор — метка времени (мс) последнего обработанного перевода.
+        # Листаем страницы через start, пока не дойдём до курсора или начала окна;
+        # end_timestamp начинает выборку с точки продолжения.
+        time_field = "block_ts" if contract_address else "timestamp"
+        cursor_ts = int(cursor) if cursor else None
+        for page in range(_page_count(cursor or before, since)):
+            start = page * PAGE_SIZE
+            if contract_address:
+                batch = await self.get_last_token_transactions(
+                    wallet_address, contract_address, PAGE_SIZE, start, before
+                )
+            else:
+                batch = await self.get_last_transactions(wallet_address, PAGE_SIZE, start, before)
+
+            for tx in batch:
+                timestamp = tx.get(time_field, 0)
+                if (cursor_ts is not None and timestamp < cursor_ts) or _older_than(timestamp // 1000, since):
+                    return
+                if (tx.get("transaction_id") if contract_address else tx.get("hash")) in claimed_hashes:
+                    yield str(timestamp), None
+                    continue
+                transfer = self.parse_transfer(tx, wallet_address, bool(contract_address))
+                yield str(timestamp), transfer if transfer and transfer.amount else None
+            if len(batch) < PAGE_SIZE:
+                return
+        yield TRUNCATED, None
 
 
 class TonAPI(BlockchainAPI):
-    def __init__(self, api_key):
+    provider = "TON"
+
+    def __init__(self, api_key, timeout=None, api_urls=None):
+        super().__init__(api_urls or ["https://toncenter.com/api/v2"], timeout)
         self.api_key = api_key
-        self.api_url = "https://toncenter.com/api/v2"
 
-    def get_last_transactions(self, wallet_address, limit=3):
+    async def get_last_transactions(self, wallet_address, limit=3, lt=None, tx_hash=None, to_lt=None):
         params = {
             "address": wallet_address,
             "limit": limit,
+            "lt": lt,
+            "hash": tx_hash,
+            "to_lt": to_lt,
             "api_key": self.api_key,
         }
-        url = f"{self.api_url}/getTransactions"
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        return response.json().get("result", [])
+        data = await self._get("/getTransactions", params=params)
+        if not data.get("ok", True):
+            raise ExplorerError(data.get("error"))
+        return data.get("result", [])
 
-    def get_transaction_details(self, tx_hash):
+    async def get_transaction_details(self, tx_hash):
         params = {
             "hash": tx_hash,
             "api_key": self.api_key,
         }
-        url = f"{self.api_url}/getTransaction"
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        return response.json().get("result", {})
+        data = await self._get("/getTransaction", params=params)
+        return data.get("result", {})
+
+    @staticmethod
+    def parse_transfer(tx):
+        in_msg = tx.get("in_msg") or {}
+        # Внешние сообщения (исходящие переводы самого кошелька) не несут value
+        if not in_msg.get("source"):
+            return None
+        amount = float(in_msg.get("value", 0)) / 1e9  # нанотоны -> TON
+        if not amount:
+            return None
+        return Transfer(tx.get("transaction_id", {}).get("hash"), amount, _from_unix(tx.get("utime")))
+
+    async def iter_transfers(self, wallet_address, contract_address, cursor=None, since=None, before=None):
+        # Курсор — "lt:hash" последней обработанной транзакции; to_lt отсекает старые,
+        # а lt/hash последней записи страницы (или точки продолжения) листают историю вглубь.
+        to_lt = cursor.split(":", 1)[0] if cursor else None
+        lt, tx_hash = before.split(":", 1) if before else (None, None)
+        for _ in range(_page_count(cursor or before, since)):
+            page = await self.get_last_transactions(wallet_address, PAGE_SIZE, lt=lt, tx_hash=tx_hash, to_lt=to_lt)
+            # При листании первая запись страницы повторяет последнюю запись предыдущей
+            if lt is not None and page and page[0].get("transaction_id", {}).get("lt") == lt:
+                page = page[1:]
+
+            for tx in page:
+                if _older_than(tx.get("utime"), since):
+                    return
+                transaction_id = tx["transaction_id"]
+                position = f"{transaction_id['lt']}:{transaction_id['hash']}"
+                yield position, None if transaction_id["hash"] in claimed_hashes else self.parse_transfer(tx)
+            if len(page) < PAGE_SIZE - 1:
+                return
+            lt = page[-1]["transaction_id"]["lt"]
+            tx_hash = page[-1]["transaction_id"]["hash"]
+        yield TRUNCATED, None
+
+
+def _provider_urls(blockchain):
+    """
+    Адреса провайдера из переменной окружения <BLOCKCHAIN>_API_URLS (через запятую) или None.
+    """
+    urls = [url.strip() for url in os.getenv(f"{blockchain.upper()}_API_URLS", "").split(",") if url.strip()]
+    return urls or None
+
+
+def _provider_timeout(blockchain, default):
+    """
+    Таймаут запросов к провайдеру: переменная окружения <BLOCKCHAIN>_API_TIMEOUT или значение по умолчанию.
+    """
+    return float(os.getenv(f"{blockchain.upper()}_API_TIMEOUT", default))
 
 
 class BlockchainFactory:
     """
     Фабрика для создания объектов API блокчейнов.
+
+    Клиенты создаются один раз на блокчейн и переиспользуются, чтобы
+    соединения из пула сессии не открывались заново на каждую проверку.
     """
 
+    _instances = {}
+
+    @classmethod
+    def get_blockchain_api(cls, blockchain):
+        api = cls._instances.get(blockchain)
+        if api is None:
+            api = cls._create_blockchain_api(blockchain)
+            cls._instances[blockchain] = api
+        return api
+
     @staticmethod
-    def get_blockchain_api(blockchain):
+    def _create_blockchain_api(blockchain):
         if blockchain == "SOL":
-            return SolanaAPI(rpc_url="https://api.mainnet-beta.solana.com")
+            return SolanaAPI(
+                rpc_urls=_provider_urls("SOL") or ["https://api.mainnet-beta.solana.com"],
+                timeout=_provider_timeout("SOL", 15),
+            )
         elif blockchain == "BSC":
-            return BinanceSmartChainAPI(api_key=os.getenv("BSC_API_KEY"))
+            return BinanceSmartChainAPI(
+                api_key=os.getenv("BSC_API_KEY"), timeout=_provider_timeout("BSC", 10), api_urls=_provider_urls("BSC")
+            )
         elif blockchain == "TRON":
-            return TronAPI(api_key=os.getenv("TRON_API_KEY"))
+            return TronAPI(
+                api_key=os.getenv("TRON_API_KEY"), timeout=_provider_timeout("TRON", 10), api_urls=_provider_urls("TRON")
+            )
         elif blockchain == "TON":
-            return TonAPI(api_key=os.getenv("TON_API_KEY"))
+            return TonAPI(
+                api_key=os.getenv("TON_API_KEY"), timeout=_provider_timeout("TON", 10), api_urls=_provider_urls("TON")
+            )
         elif blockchain == "Base":
-            return BaseApi(api_key=os.getenv("BASE_API_KEY"))
+            return BaseApi(
+                api_key=os.getenv("BASE_API_KEY"), timeout=_provider_timeout("Base", 10), api_urls=_provider_urls("Base")
+            )
         else:
             raise ValueError(f"Блокчейн {blockchain} не поддерживается.")
 
+    @classmethod
+    def endpoint_stats(cls):
+        """
+        Задержки и ошибки по каждому адресу уже созданных клиентов.
+        """
+        return {blockchain: api.endpoints.stats() for blockchain, api in cls._instances.items()}
+
+    @classmethod
+    async def close_all(cls):
+        """
+        Закрывает сессии всех созданных клиентов (вызывается при остановке бота).
+        """
+        for api in cls._instances.values():
+            await api.close()
+        cls._instances.clear()
+
+
+def _endpoint_gauge(field):
+    def collect():
+        return {
+            (blockchain, endpoint["url"]): float(endpoint[field])
+            for blockchain, endpoints in BlockchainFactory.endpoint_stats().items()
+            for endpoint in endpoints
+            if endpoint[field] is not None
+        }
+    return collect
+
+
+Gauge("chain_endpoint_latency_ms", "Средняя (EWMA) задержка адреса провайдера", ("provider", "url"),
+      collect=_endpoint_gauge("latency_ms"))
+Gauge("chain_endpoint_healthy", "Адрес провайдера исправен (1) или на паузе после ошибки (0)", ("provider", "url"),
+      collect=_endpoint_gauge("healthy"))
+Gauge("chain_endpoint_hedged", "Сколько раз на адрес уходил дублирующий запрос", ("provider", "url"),
+      collect=_endpoint_gauge("hedged"))
 
-def is_transaction_valid(received_amount, expected_amount, tolerance=0.001):
+
+def is_transaction_valid(received_amount, expected_amount, tolerance=PAYMENT_TOLERANCE):
     """
     Проверяет, попадает ли сумма в допустимый диапазон.
     """
     return abs(received_amount - expected_amount) <= (expected_amount * tolerance)
 
 
-def check_payment(blockchain, expected_amount, token_contract=None, tolerance=0.001):
+def get_token_contract(blockchain, currency):
     """
-    Универсальная проверка транзакций.
+    Адрес контракта токена для оплаты в стейблкоинах (None для нативной монеты).
     """
-    blockchain_api = BlockchainFactory.get_blockchain_api(blockchain)
-    wallet_address = os.environ.get(f"{blockchain}_WALLET_ADDRESS")
-    if token_contract:
-        transactions = blockchain_api.get_last_token_transactions(wallet_address, token_contract)
-        for tx in transactions:
-            if blockchain == "TRON":
-                amount = float(tx.get('quant')) / 1e6
-                tx_hash = tx.get('transaction_id')
-            elif blockchain == "BSC" or blockchain == "Base":
-                amount = float(tx.get("value")) / 1e18
-                tx_hash = tx.get("hash")
-            if is_transaction_valid(amount, expected_amount, tolerance):
-                return True, tx_hash
-        return False, None
-
-    transactions = blockchain_api.get_last_transactions(wallet_address)
-    amount = 0
-    count = 10
-    tx_hash = None
-    for tx in transactions:
-        count += 1
-        # Извлечение деталей транзакции
-        if blockchain == "TON":
-            amount = float(tx.get("in_msg", {}).get("value", 0)) / 1e9  # TON -> Decimal
-            tx_hash = tx.get("transaction_id").get("hash")
-        elif blockchain == "SOL":
-            try:
-                details = blockchain_api.get_transaction_details(tx.get("signature"))
-                instructions = details.get("transaction", {}).get("message", {}).get("instructions", [])
-                for instruction in instructions:
-                    if (instruction.get("programId") == "11111111111111111111111111111111"
-                            and instruction.get("parsed", {})
-                                    .get("info", {})
-                                    .get("destination", "") == os.environ.get("SOL_WALLET_ADDRESS")):
-                        amount = float(instruction.get("parsed", {}).get("info", {}).get("lamports", 0)) / 1e9
-                        tx_hash = tx.get("signature")
-                        if count > 3:
-                            break
-            except HTTPError:
-                print("Too many requests")
-                continue
-        elif blockchain == "BSC" or blockchain == "BASE":
-            amount = float(tx.get("value", 0)) / 1e18
-            tx_hash = tx.get("hash")
-        elif blockchain == "TRON":
-            amount = float(tx.get("contractData").get("amount", 0)) / 1e6
-            tx_hash = tx.get("hash")
-
-        if is_transaction_valid(amount, expected_amount, tolerance):
-            return True, tx_hash
-
-    return False, None
+    if currency == "USDT" and blockchain == "BSC":
+        return os.getenv("USDT_BSC_MINT_ADDRESS")
+    elif currency == "USDT" and blockchain == "TRON":
+        return os.getenv("USDT_TRON_MINT_ADDRESS")
+    elif currency == "USDC" and blockchain == "Base":
+        return os.getenv("USDC_BASE_MINT_ADDRESS")
+    return None
 
 
-def validate_payment(transaction):
+async def validate_payment(session, transaction):
     """
-    Проверка оплаты для переданной транзакции.
+    Проверка оплаты для переданной транзакции по локальному журналу переводов.
     """
-    token_contract = None
-    if transaction.currency == "USDT" and transaction.blockchain == "BSC":
-        token_contract = os.getenv("USDT_BSC_MINT_ADDRESS")
-    elif transaction.currency == "USDT" and transaction.blockchain == "TRON":
-        token_contract = os.getenv("USDT_TRON_MINT_ADDRESS")
-    elif transaction.currency == "USDC" and transaction.blockchain == "Base":
-        token_contract = os.getenv("USDC_BASE_MINT_ADDRESS")
-
-    is_valid, tx_id = check_payment(
+    from ingestion import ingest_wallet
+
+    token_contract = get_token_contract(transaction.blockchain, transaction.currency)
+    # Курсор кошелька общий для всех оплат в этой валюте, поэтому история читается
+    # до самой ранней из них, а не до времени этой транзакции
+    since = await get_oldest_pending_time(session, transaction.blockchain, transaction.currency)
+    # Подтягиваем только новые переводы с последнего курсора (не чаще раза в несколько секунд).
+    # Если обозреватель недоступен, проверяем по тому, что уже есть в журнале.
+    try:
+        await ingest_wallet(session, transaction.blockchain, token_contract, max_age=INGEST_MIN_INTERVAL,
+                            since=min(since or transaction.created_at, transaction.created_at))
+    except (aiohttp.ClientError, asyncio.TimeoutError, ExplorerError) as e:
+        logger.warning("Не удалось обновить переводы %s: %s", transaction.blockchain, e)
+
+    # Плотно выданные суммы соседей попадают в окно допуска: перевод достаётся ближайшей
+    expected_amount = transaction.expected_amount
+    window = expected_amount * PAYMENT_TOLERANCE * 2
+    competing = [
+        amount for amount in await get_pending_amounts(session, transaction.blockchain, transaction.currency,
+                                                       expected_amount - window, expected_amount + window)
+        if amount != expected_amount
+    ]
+    transfer = await find_payment_transfer(
+        session,
         blockchain=transaction.blockchain,
-        expected_amount=transaction.expected_amount,
-        token_contract=token_contract,
+        contract_address=token_contract,
+        expected_amount=expected_amount,
+        since=transaction.created_at,
+        tolerance=PAYMENT_TOLERANCE,
+        competing=competing,
     )
 
-    if is_valid:
-        transaction.status = "Success"
-        transaction.tx_id = tx_id
-        session.commit()
-        return True
+    if transfer:
+        return await mark_transaction_paid(session, transaction, transfer.tx_hash)
     else:
         return False
@@ -1,77 +1,129 @@
 import asyncio
+import logging
+import time
+from collections import defaultdict
 from datetime import timedelta, datetime
 
-from database import Transaction, User, Subscription
+import aiohttp
 
+from activation import activate_subscription
+from amount_slots import amount_allocator
+from api_calls import ExplorerError, get_token_contract
+from crud.ledger import get_unclaimed_transfers
+from crud.transactions import get_pending_transactions, mark_transaction_paid, expire_stale_transactions
+from ingestion import ingest_wallet
+from metrics import pending_transactions, transactions_expired, transactions_paid
+from outbox import outbox, PRIORITY_HIGH
 
-async def monitor_transactions(session, bot):
-    while True:
-        now = datetime.utcnow()
-        expired_transactions = (
-            session.query(Transaction)
-            .filter(Transaction.status == "Pending")
-            .filter(Transaction.created_at < now - timedelta(minutes=15))
-            .all()
-        )
-
-        for transaction in expired_transactions:
-            # Удаляем сообщение о платеже (если есть message_id и chat_id, можно удалять сообщение через bot.delete_message)
-            user_id = transaction.initiator
-
-            # Уведомляем пользователя об отмене
-            user = session.query(User).filter_by(telegram_id=user_id).first()
-            if user:
-                await bot.send_message(user.telegram_id, "Время на оплату истекло. Транзакция была отменена.")
-
-            transaction.status = "Expired"
-            session.commit()
+logger = logging.getLogger(__name__)
 
-        await asyncio.sleep(60)  # Проверяем каждые 60 секунд
+# Границы интервала опроса кошельков фоновым наблюдателем, в секундах
+PAYMENT_WATCH_MIN_INTERVAL = 10
+PAYMENT_WATCH_MAX_INTERVAL = 60
 
 
-async def check_expired_subscriptions(session, bot):
+async def monitor_transactions(session_maker, bot):
     while True:
-        now = datetime.utcnow()
-        three_days_from_now = now + timedelta(days=3)
+        try:
+            await expire_transactions(session_maker)
+        except Exception:
+            # Сбой одного прохода (например, базы) не должен останавливать отмену навсегда
+            logger.exception("Не удалось отменить просроченные транзакции")
+        await asyncio.sleep(60)  # Проверяем каждые 60 секунд
 
-        # Проверяем истекшие подписки
-        expired_subs = session.query(Subscription).filter(Subscription.expiration_date < now).all()
 
-        for sub in expired_subs:
-            # Исключаем пользователя из чата
-            chat_id = sub.chat_id
-            user_id = sub.user_id
+async def expire_transactions(session_maker, max_age=timedelta(minutes=15)):
+    """
+    Один проход monitor_transactions: отменяет ожидающие оплаты старше max_age.
+    """
+    # Все просроченные транзакции закрываются одним UPDATE в короткой транзакции
+    async with session_maker() as session:
+        expired = await expire_stale_transactions(session, datetime.utcnow() - max_age)
+    transactions_expired.inc(amount=len(expired))
+
+    for transaction_id, _ in expired:
+        amount_allocator.release(transaction_id)
+
+    # Уведомления об отмене уходят через очередь уже после коммита
+    for initiator in dict.fromkeys(initiator for _, initiator in expired):
+        outbox.send_message(initiator, "Время на оплату истекло. Транзакция была отменена.")
+    return expired
+
+
+def payment_watch_interval(pending_count):
+    """
+    Чем больше ожидающих оплат, тем чаще опрашиваем кошельки; без них — редко.
+    """
+    return max(PAYMENT_WATCH_MIN_INTERVAL, PAYMENT_WATCH_MAX_INTERVAL / (1 + pending_count))
+
+
+def match_transfers(transfers, transactions, blockchain, currency):
+    """
+    Сопоставляет входящие переводы с ожидающими транзакциями за один проход.
+    Владелец суммы ищется по индексу выданных сумм за O(log n).
+    """
+    by_id = {transaction.id: transaction for transaction in transactions}
+    matches = []
+    for transfer in transfers:
+        transaction = by_id.get(amount_allocator.match(blockchain, currency, transfer.amount))
+        # Перевод должен прийти после того, как пользователь получил сумму
+        if transaction is None or (transfer.timestamp and transfer.timestamp < transaction.created_at):
+            continue
+        del by_id[transaction.id]
+        matches.append((transaction, transfer.tx_hash))
+    return matches
+
+
+async def watch_payments(session_maker, bot):
+    """
+    Фоновый наблюдатель за кошельками: один запрос на кошелёк/контракт за интервал,
+    найденные оплаты подтверждаются без нажатия "Проверить оплату".
+    """
+    while True:
+        try:
+            async with session_maker() as session:
+                pending_count = await _watch_payments_once(session, bot)
+            interval = payment_watch_interval(pending_count)
+        except Exception:
+            logger.exception("Проход наблюдателя за оплатами завершился ошибкой")
+            interval = PAYMENT_WATCH_MIN_INTERVAL
+        await asyncio.sleep(interval)
+
+
+async def _watch_payments_once(session, bot):
+    snapshot_at = time.monotonic()
+    pending = await get_pending_transactions(session)
+    pending_transactions.set(len(pending))
+
+    groups = defaultdict(list)
+    for transaction in pending:
+        groups[(transaction.blockchain, transaction.currency)].append(transaction)
+
+    for (blockchain, currency), transactions in groups.items():
+        token_contract = get_token_contract(blockchain, currency)
+        # Переводы старше самой ранней ожидающей оплаты не нужны, историю дальше не читаем
+        since = min(transaction.created_at for transaction in transactions)
+        try:
+            await ingest_wallet(session, blockchain, token_contract, since=since)
+        except (aiohttp.ClientError, asyncio.TimeoutError, ExplorerError) as e:
+            logger.warning("Не удалось получить переводы %s: %s", blockchain, e)
+            continue
+
+        # Суммы могли выдать другие воркеры — сверяем индекс с базой
+        amount_allocator.sync(blockchain, currency, transactions, snapshot_at)
+
+        # Сопоставляем все незасчитанные переводы из журнала, в том числе
+        # загруженные по нажатию кнопки другими пользователями
+        transfers = await get_unclaimed_transfers(session, blockchain, token_contract, since)
+
+        for transaction, tx_hash in match_transfers(transfers, transactions, blockchain, currency):
+            if not await mark_transaction_paid(session, transaction, tx_hash):
+                continue
+            transactions_paid.inc("watcher")
             try:
-                await bot.ban_chat_member(chat_id, user_id)
+                text = await activate_subscription(session, bot, transaction)
+                outbox.send_message(transaction.initiator, text, priority=PRIORITY_HIGH)
             except Exception:
-                print(f"Не удалось кикнуть пользователя {user_id}")
+                logger.exception("Не удалось активировать подписку пользователя %s", transaction.initiator)
 
-            # Удаляем подписку
-            session.delete(sub)
-            session.commit()
-
-            try:
-                await bot.send_message(
-                    chat_id=user_id,
-                    text=f"Ваша подписка на чат истекла."
-                )
-            except Exception as e:
-                print(f"Не удалось отправить сообщение пользователю {user_id}: {e}")
-
-        # Проверяем подписки, которые истекают через 3 дня
-        about_to_expire_subs = session.query(Subscription).filter(
-            Subscription.expiration_date >= now,
-            Subscription.expiration_date <= three_days_from_now
-        ).all()
-
-        for sub in about_to_expire_subs:
-            user_id = sub.user_id
-            try:
-                await bot.send_message(
-                    chat_id=user_id,
-                    text=f"Ваша подписка истекает через 3 дня! Пожалуйста, продлите её, чтобы не потерять доступ."
-                )
-            except Exception as e:
-                print(f"Не удалось отправить сообщение пользователю {user_id}: {e}")
-
-        await asyncio.sleep(86400)  # Проверять раз в сутки
+    return len(pending)
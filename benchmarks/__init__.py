@@ -0,0 +1,97 @@
+"""
+Офлайн-бенчмарки горячих путей: разбор ответов обозревателей, сопоставление
+оплат, CRUD и проходы фоновых задач на SQLite, смесь запросов бота на SQLite
+и PostgreSQL (BENCH_POSTGRES_URL, см. benchmarks/backends.py).
+
+    python -m benchmarks                      # полный прогон, результат в benchmarks/results/<commit>.json
+    python -m benchmarks --quick --only parse # быстрый прогон одной группы
+    python -m benchmarks --compare benchmarks/results/abc1234.json
+
+Сеть не нужна: истории кошельков синтетические (fake_explorer.py), база — временный файл.
+"""
+import asyncio
+import statistics
+import time
+from collections import Counter
+
+# Зарегистрированные группы: имя -> async функция(quick) -> список результатов
+GROUPS = {}
+
+
+def group(name):
+    def register(func):
+        GROUPS[name] = func
+        return func
+    return register
+
+
+async def measure(name, func, params=None, operations=1, repeat=5, setup=None):
+    """
+    Прогоняет func() repeat раз. Если задан setup, перед каждым прогоном вызывается
+    setup() (не учитывается во времени), и его результат передаётся в func.
+    operations — сколько операций выполняет один прогон, для пропускной способности.
+    """
+    timings = []
+    for _ in range(repeat):
+        args = (await _call(setup),) if setup is not None else ()
+        started = time.perf_counter()
+        await _call(func, *args)
+        timings.append(time.perf_counter() - started)
+    best = min(timings)
+    return {
+        "name": name,
+        "params": params or {},
+        "repeat": repeat,
+        "operations": operations,
+        "min_ms": round(best * 1000, 3),
+        "median_ms": round(statistics.median(timings) * 1000, 3),
+        "ops_per_second": round(operations / best, 1) if best else None,
+    }
+
+
+async def measure_load(name, call, requests, concurrency, params=None):
+    """
+    requests вызовов call() из concurrency параллельных потоков: пропускная способность,
+    перцентили задержки и ошибки по типу (ошибка не прерывает прогон).
+    """
+    latencies = []
+    errors = Counter()
+    remaining = iter(range(requests))
+
+    async def worker():
+        for _ in remaining:
+            started = time.perf_counter()
+            try:
+                await call()
+            except Exception as e:
+                errors[type(e).__name__] += 1
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+
+    def percentile(q):
+        return round(latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000, 3)
+
+    return {
+        "name": name,
+        "params": {**(params or {}), "concurrency": concurrency},
+        "repeat": 1,
+        "operations": requests,
+        "min_ms": percentile(0),
+        "median_ms": percentile(0.5),
+        "p95_ms": percentile(0.95),
+        "p99_ms": percentile(0.99),
+        "ops_per_second": round(requests / elapsed, 1),
+        "errors": dict(errors),
+    }
+
+
+async def _call(func, *args):
+    result = func(*args)
+    if asyncio.iscoroutine(result):
+        result = await result
+    return result
@@ -0,0 +1,96 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+from datetime import datetime
+
+from benchmarks import GROUPS
+from benchmarks import backends, matching, parsing, providers, storage  # noqa: F401 — регистрируют группы
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+
+def _git(*args):
+    try:
+        return subprocess.run(["git", *args], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _key(result):
+    return result["name"], json.dumps(result["params"], sort_keys=True)
+
+
+def compare(baseline, results, threshold):
+    """
+    Печатает изменения медианы относительно baseline; возвращает число замедлений больше threshold.
+    """
+    previous = {_key(result): result for result in baseline["results"]}
+    regressions = 0
+    for result in results:
+        before = previous.get(_key(result))
+        if before is None or not before["median_ms"]:
+            continue
+        ratio = result["median_ms"] / before["median_ms"]
+        marker = ""
+        if ratio > threshold:
+            marker = "  <-- медленнее"
+            regressions += 1
+        elif ratio < 1 / threshold:
+            marker = "  быстрее"
+        print(f"{result['name']:40} {_key(result)[1]:45} {before['median_ms']:>10.3f} -> "
+              f"{result['median_ms']:>10.3f} ms  x{ratio:.2f}{marker}")
+    return regressions
+
+
+async def run(names, quick):
+    results = []
+    for name in names:
+        print(f"== {name}", file=sys.stderr)
+        results.extend(await GROUPS[name](quick))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description=__import__("benchmarks").__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--quick", action="store_true", help="малые размеры, для проверки перед коммитом")
+    parser.add_argument("--only", nargs="+", choices=sorted(GROUPS), help="запустить только эти группы")
+    parser.add_argument("--output", help="файл для JSON (по умолчанию benchmarks/results/<commit>.json)")
+    parser.add_argument("--compare", help="JSON предыдущего прогона для сравнения")
+    parser.add_argument("--threshold", type=float, default=1.2,
+                        help="во сколько раз медиана может вырасти, не считаясь регрессией")
+    args = parser.parse_args()
+
+    # Бенчмарк не должен мерить вывод логов
+    logging.basicConfig(level=logging.WARNING)
+    commit = _git("rev-parse", "--short", "HEAD")
+    report = {
+        "commit": commit,
+        "dirty": bool(_git("status", "--porcelain", "--untracked-files=no")),
+        "created_at": datetime.utcnow().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "quick": args.quick,
+        "results": asyncio.run(run(args.only or list(GROUPS), args.quick)),
+    }
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{commit or 'unknown'}{'-quick' if args.quick else ''}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as file:
+        json.dump(report, file, ensure_ascii=False, indent=2)
+    print(f"Результаты записаны в {output}", file=sys.stderr)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            baseline = json.load(file)
+        if compare(baseline, report["results"], args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+Одна и та же смесь запросов бота на SQLite (WAL) и PostgreSQL: параллельные
+оформления оплат (пользователь, транзакция, выбор суммы, нажатия "Проверить
+оплату", подтверждение и подписка), пока фоновый наблюдатель пишет переводы в
+журнал и отменяет просроченные оплаты.
+
+PostgreSQL участвует, если задан BENCH_POSTGRES_URL — DSN отдельной пустой базы:
+таблицы бота в ней создаются перед прогоном и удаляются после него.
+"""
+import asyncio
+import itertools
+import os
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+
+from amount_slots import amount_allocator
+from api_calls import Transfer
+from benchmarks import group, measure_load
+from benchmarks.storage import temporary_database
+from constants import PAYMENT_TOLERANCE
+from crud.ledger import find_payment_transfer, get_cursor, save_transfers
+from crud.subscriptions import create_subscription
+from crud.transactions import (
+    create_transaction,
+    expire_stale_transactions,
+    get_pending_transactions,
+    get_transaction_by_telegram_id,
+    mark_transaction_paid,
+)
+from crud.users import create_user
+from database import Base, close_db, init_db, make_engine
+from migrations import schema_version
+
+CHECKOUTS = 500
+QUICK_CHECKOUTS = 100
+CONCURRENCY = (1, 20, 100)
+QUICK_CONCURRENCY = (20,)
+# Сколько раз пользователь нажимает "Проверить оплату", прежде чем уйти
+CHECKS = 3
+# Пауза между проходами фонового наблюдателя, секунды
+WATCH_INTERVAL = 0.02
+
+_telegram_ids = itertools.count(2_000_000)
+
+
+@asynccontextmanager
+async def postgres_database(dsn):
+    """
+    Фабрика сессий к базе PostgreSQL с чистыми таблицами бота.
+    """
+
+    async def drop_tables():
+        engine = make_engine(dsn)
+        try:
+            async with engine.begin() as conn:
+                await conn.run_sync(Base.metadata.drop_all)
+                await conn.run_sync(schema_version.drop, checkfirst=True)
+        finally:
+            await engine.dispose()
+
+    await drop_tables()
+    session_maker = await init_db(dsn)
+    try:
+        yield session_maker
+    finally:
+        await close_db(dsn)
+        await drop_tables()
+
+
+async def _watch(session_maker, stopping):
+    """
+    Фоновый наблюдатель: каждая ожидающая оплата получает перевод в журнале.
+    """
+    passes = itertools.count()
+    while not stopping.is_set():
+        async with session_maker() as session:
+            now = datetime.utcnow()
+            pending = await get_pending_transactions(session, "TON", "TON")
+            cursor = await get_cursor(session, "TON", "bench-wallet", None)
+            transfers = [Transfer(f"bench-{t.id}", t.expected_amount, now) for t in pending if t.expected_amount]
+            await save_transfers(session, cursor, transfers, str(next(passes)))
+            await expire_stale_transactions(session, now - timedelta(minutes=15))
+        await asyncio.sleep(WATCH_INTERVAL)
+
+
+async def _checkouts(session_maker, backend, checkouts, concurrency):
+    paid = 0
+
+    async def checkout():
+        nonlocal paid
+        telegram_id = next(_telegram_ids)
+        async with session_maker() as session:
+            await create_user(session, telegram_id)
+            transaction = await create_transaction(session, telegram_id, 50, "", "", "1m", True)
+            # Выбор валюты: уникальная сумма из индекса, как в обработчике оплаты
+            transaction.blockchain, transaction.currency = "TON", "TON"
+            transaction.expected_amount = amount_allocator.allocate("TON", "TON", 10 + telegram_id % 1000,
+                                                                    transaction.id)
+            await session.commit()
+            for _ in range(CHECKS):
+                await get_transaction_by_telegram_id(session, telegram_id)
+                transfer = await find_payment_transfer(session, "TON", None, transaction.expected_amount,
+                                                       transaction.created_at, PAYMENT_TOLERANCE)
+                if transfer is not None and await mark_transaction_paid(session, transaction, transfer.tx_hash):
+                    await create_subscription(session, telegram_id, "С чатом", 30)
+                    paid += 1
+                    return
+            # Пользователь ушёл, не дождавшись: сумма освобождается
+            amount_allocator.release(transaction.id)
+
+    stopping = asyncio.Event()
+    watcher = asyncio.create_task(_watch(session_maker, stopping))
+    try:
+        result = await measure_load("backend.checkout", checkout, checkouts, concurrency, {"backend": backend})
+    finally:
+        stopping.set()
+        await watcher
+    result["paid_share"] = round(paid / checkouts, 3)
+    return result
+
+
+@group("backend")
+async def run(quick):
+    backends = {"sqlite": temporary_database}
+    if os.getenv("BENCH_POSTGRES_URL"):
+        backends["postgresql"] = lambda: postgres_database(os.environ["BENCH_POSTGRES_URL"])
+
+    checkouts = QUICK_CHECKOUTS if quick else CHECKOUTS
+    results = []
+    for backend, database in backends.items():
+        for concurrency in QUICK_CONCURRENCY if quick else CONCURRENCY:
+            async with database() as session_maker:
+                results.append(await _checkouts(session_maker, backend, checkouts, concurrency))
+    return results
@@ -0,0 +1,82 @@
+"""
+Сопоставление входящих переводов с тысячами ожидающих оплат: перебор с
+is_transaction_valid против индекса выданных сумм (match_transfers).
+"""
+import random
+from datetime import datetime, timedelta
+
+from amount_slots import SLOT_SPACING_FACTOR, amount_allocator
+from api_calls import Transfer, is_transaction_valid
+from async_tasks import match_transfers
+from benchmarks import group, measure
+from constants import PAYMENT_TOLERANCE
+from database import Transaction
+
+PENDING_SIZES = (100, 1000, 5000)
+QUICK_PENDING_SIZES = (100, 1000)
+TRANSFERS = 500
+# Ожидающие оплаты делятся поровну между парами (сеть, валюта)
+PAIRS = (("SOL", "SOL"), ("BSC", "USDT"), ("TRON", "USDT"), ("TON", "TON"), ("Base", "USDC"))
+# Относительный шаг цен ожидающих оплат
+AMOUNT_STEP = PAYMENT_TOLERANCE * SLOT_SPACING_FACTOR * 1.5
+
+
+def _pending(count):
+    created_at = datetime.utcnow() - timedelta(minutes=5)
+    transactions = []
+    for number in range(count):
+        blockchain, currency = PAIRS[number % len(PAIRS)]
+        transaction = Transaction(
+            id=f"bench-{number}", initiator=number, blockchain=blockchain, currency=currency, created_at=created_at,
+        )
+        # Цены идут с шагом чуть больше окна аллокатора, иначе тысячи сумм в одной паре не помещаются
+        base_amount = 5 * (1 + AMOUNT_STEP) ** (number // len(PAIRS))
+        transaction.expected_amount = amount_allocator.allocate(blockchain, currency, base_amount, transaction.id)
+        transactions.append(transaction)
+    return transactions
+
+
+def _transfers(transactions, rng):
+    """
+    Половина переводов оплачивает случайные ожидающие транзакции, половина ни к чему не относится.
+    """
+    timestamp = datetime.utcnow()
+    transfers = []
+    for number in range(TRANSFERS):
+        if number % 2:
+            transaction = rng.choice(transactions)
+            amount = transaction.expected_amount * (1 + rng.uniform(-PAYMENT_TOLERANCE, PAYMENT_TOLERANCE) / 2)
+        else:
+            transaction, amount = None, rng.uniform(5, 5000)
+        pair = (transaction.blockchain, transaction.currency) if transaction else rng.choice(PAIRS)
+        transfers.append((pair, Transfer(f"tx{number}", amount, timestamp)))
+    return transfers
+
+
+@group("match")
+async def run(quick):
+    results = []
+    for size in QUICK_PENDING_SIZES if quick else PENDING_SIZES:
+        rng = random.Random(size)
+        transactions = _pending(size)
+        transfers = _transfers(transactions, rng)
+        by_pair = {pair: [t for t in transactions if (t.blockchain, t.currency) == pair] for pair in PAIRS}
+        params = {"pending": size, "transfers": TRANSFERS}
+
+        def linear():
+            # Каждый перевод сверяется со всеми ожидающими оплатами своей пары
+            for pair, transfer in transfers:
+                for transaction in by_pair[pair]:
+                    if is_transaction_valid(transfer.amount, transaction.expected_amount):
+                        break
+
+        def indexed():
+            for pair, pending in by_pair.items():
+                match_transfers([transfer for p, transfer in transfers if p == pair], pending, *pair)
+
+        results.append(await measure("match.is_transaction_valid_scan", linear, params, operations=TRANSFERS))
+        results.append(await measure("match.match_transfers", indexed, params, operations=TRANSFERS))
+
+        for transaction in transactions:
+            amount_allocator.release(transaction.id)
+    return results
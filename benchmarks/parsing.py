@@ -0,0 +1,93 @@
+"""
+Разбор ответов обозревателей: fetch_transfers_since каждой сети на историях
+от 10 до 100 000 записей (вся история после курсора и только окно ожидающих
+оплат) и разбор всей истории по одной записи.
+"""
+from datetime import datetime
+
+from api_calls import BinanceSmartChainAPI, SolanaAPI, TonAPI, TronAPI
+from benchmarks import group, measure
+from fake_explorer import TOKEN_CONTRACTS, WALLETS, FakeExplorer, synthetic_history
+
+HISTORY_SIZES = (10, 100, 1000, 10000, 100000)
+QUICK_HISTORY_SIZES = (10, 100, 1000)
+# Сколько последних записей истории приходится на окно ожидающих оплат
+CHECKOUT_WINDOW = 100
+
+# (сеть, перевод токена) и клиент, который её разбирает
+CASES = {
+    ("SOL", False): lambda: SolanaAPI(["http://sol.invalid"]),
+    ("BSC", False): lambda: BinanceSmartChainAPI(None),
+    ("BSC", True): lambda: BinanceSmartChainAPI(None),
+    ("TRON", False): lambda: TronAPI(None),
+    ("TRON", True): lambda: TronAPI(None),
+    ("TON", False): lambda: TonAPI(None),
+}
+
+
+def _oldest_cursor(explorer):
+    """
+    Курсор на самой старой записи: клиент догоняет всю историю (не дальше MAX_PAGES страниц).
+    """
+    entry = explorer.entries[-1]
+    rendered = explorer.render(entry)
+    if explorer.blockchain == "SOL":
+        return entry.tx_hash
+    if explorer.blockchain == "BSC":
+        return rendered["blockNumber"]
+    if explorer.blockchain == "TRON":
+        return str(rendered["block_ts"] if explorer.token else rendered["timestamp"])
+    return f"{rendered['transaction_id']['lt']}:{entry.tx_hash}"
+
+
+def _parser(explorer):
+    """
+    Разбор одной записи истории так, как это делает fetch_transfers_since.
+    """
+    wallet = explorer.wallet_address
+    if explorer.blockchain == "SOL":
+        return lambda details: SolanaAPI.parse_transfer_amount(details, wallet)
+    if explorer.blockchain == "BSC":
+        return lambda tx: BinanceSmartChainAPI.parse_transfer(tx, wallet)
+    if explorer.blockchain == "TRON":
+        return lambda tx: TronAPI.parse_transfer(tx, wallet, explorer.token)
+    return TonAPI.parse_transfer
+
+
+@group("parse")
+async def run(quick):
+    results = []
+    for (blockchain, token), client in CASES.items():
+        name = f"{blockchain}_token" if token else blockchain
+        contract = TOKEN_CONTRACTS[blockchain] if token else None
+        for size in QUICK_HISTORY_SIZES if quick else HISTORY_SIZES:
+            explorer = FakeExplorer(blockchain, synthetic_history(size), WALLETS[blockchain], token)
+            cursor = _oldest_cursor(explorer)
+            params = {"chain": name, "history": size}
+
+            async def fetch(api):
+                await api.fetch_transfers_since(explorer.wallet_address, contract, cursor)
+
+            async def fetch_window(api):
+                await api.fetch_transfers_since(explorer.wallet_address, contract, cursor, since)
+
+            # Новый клиент на каждый прогон: кэш деталей Solana не переживает прогон
+            results.append(await measure(
+                "parse.fetch_transfers_since", fetch, params, setup=lambda: explorer.attach(client()),
+            ))
+            # Та же история, но ожидающие оплаты созданы CHECKOUT_WINDOW записей назад
+            since = datetime.utcfromtimestamp(explorer.entries[min(size, CHECKOUT_WINDOW) - 1].timestamp)
+            results.append(await measure(
+                "parse.fetch_checkout_window", fetch_window, {**params, "window": CHECKOUT_WINDOW},
+                setup=lambda: explorer.attach(client()),
+            ))
+
+            # В Solana разбираются детали транзакции, а не элемент списка подписей
+            render = explorer.render_details if blockchain == "SOL" else explorer.render
+            rows = [render(entry) for entry in explorer.entries]
+            parse = _parser(explorer)
+            results.append(await measure(
+                "parse.history", lambda: [parse(row) for row in rows], params, operations=size,
+                repeat=3 if size >= 10000 else 5,
+            ))
+    return results
@@ -0,0 +1,113 @@
+"""
+Клиенты обозревателей под нагрузкой через HTTP-заглушку (fake_explorer.ExplorerStub):
+fetch_transfers_since каждой сети и validate_payment при ровных ответах,
+медленном хвосте, 5xx и 429.
+"""
+import os
+import random
+import uuid
+from datetime import datetime, timedelta
+
+from amount_slots import amount_allocator
+from api_calls import BinanceSmartChainAPI, BlockchainFactory, SolanaAPI, TonAPI, TronAPI, validate_payment
+from benchmarks import group, measure_load
+from benchmarks.storage import temporary_database
+from database import Transaction
+from fake_explorer import WALLETS, ExplorerStub, Faults
+from ingestion import _last_ingested
+from resilience import reset_breakers
+
+SCENARIOS = {
+    "steady": {"latency": 0.02, "jitter": 0.01},
+    "slow_tail": {"latency": 0.02, "jitter": 0.01, "slow_share": 0.05, "slow_latency": 1.0},
+    "server_errors": {"latency": 0.02, "jitter": 0.01, "errors": 0.05},
+    "rate_limited": {"latency": 0.02, "jitter": 0.01, "rate_limit": 0.02, "retry_after": 1},
+}
+CLIENTS = {
+    "SOL": lambda url: SolanaAPI([url]),
+    "BSC": lambda url: BinanceSmartChainAPI(None, api_urls=[url]),
+    "TRON": lambda url: TronAPI(None, api_urls=[url]),
+    "TON": lambda url: TonAPI(None, api_urls=[url]),
+}
+REQUESTS = 500
+QUICK_REQUESTS = 100
+CONCURRENCY = 20
+# Сколько оплат ждут подтверждения в прогоне validate_payment (все помещаются в первую страницу истории)
+VALIDATE_PENDING = 40
+
+
+async def _fetch(environment, blockchain, requests):
+    api = CLIENTS[blockchain](environment[f"{blockchain}_API_URLS"])
+    try:
+        return await measure_load(
+            "providers.fetch_transfers_since",
+            lambda: api.fetch_transfers_since(WALLETS[blockchain], None, None),
+            requests, CONCURRENCY, {"chain": blockchain},
+        )
+    finally:
+        await api.close()
+
+
+async def _validate(stub, requests):
+    """
+    Нажатия "Проверить оплату" по TON: VALIDATE_PENDING оплат, каждая уже пришла на кошелёк.
+    """
+    created_at = datetime.utcnow() - timedelta(minutes=1)
+    _last_ingested.clear()
+    async with temporary_database() as session_maker:
+        async with session_maker() as session:
+            pending = [
+                Transaction(id=str(uuid.uuid4()), initiator=number, blockchain="TON", currency="TON",
+                            expected_amount=0, period="1m", with_chat=True, status="Pending", created_at=created_at)
+                for number in range(VALIDATE_PENDING)
+            ]
+            # Суммы выдаются до вставки: ожидающие оплаты пары не могут делить одну сумму
+            for number, transaction in enumerate(pending):
+                transaction.expected_amount = amount_allocator.allocate("TON", "TON", 10 + number, transaction.id)
+                stub.explorers[("TON", False)].add_transfer(transaction.expected_amount)
+            session.add_all(pending)
+            await session.commit()
+
+        rng = random.Random(0)
+
+        async def check():
+            async with session_maker() as session:
+                await validate_payment(session, rng.choice(pending))
+
+        try:
+            return await measure_load("providers.validate_payment", check, requests, CONCURRENCY, {"chain": "TON"})
+        finally:
+            for transaction in pending:
+                amount_allocator.release(transaction.id)
+            await BlockchainFactory.close_all()
+
+
+@group("providers")
+async def run(quick):
+    requests = QUICK_REQUESTS if quick else REQUESTS
+    stub = ExplorerStub(history=1000)
+    runner, base_url = await stub.start()
+    environment = stub.environment(base_url)
+    saved = {variable: os.environ.get(variable) for variable in [*environment, "TON_WALLET_ADDRESS"]}
+    os.environ.update(environment, TON_WALLET_ADDRESS=WALLETS["TON"])
+    results = []
+    try:
+        for scenario, faults in SCENARIOS.items():
+            stub.faults = Faults(**faults)
+            reset_breakers()
+            for blockchain in CLIENTS:
+                result = await _fetch(environment, blockchain, requests)
+                result["params"]["scenario"] = scenario
+                results.append(result)
+            reset_breakers()
+            result = await _validate(stub, requests)
+            result["params"]["scenario"] = scenario
+            results.append(result)
+        return results
+    finally:
+        for variable, value in saved.items():
+            if value is None:
+                os.environ.pop(variable, None)
+            else:
+                os.environ[variable] = value
+        await runner.cleanup()
@@ -0,0 +1,157 @@
+"""
+CRUD и проходы фоновых задач на SQLite: создание и поиск транзакций, создание
+подписок, отмена просроченных оплат (monitor_transactions) и сопоставление
+незасчитанных переводов из журнала (watch_payments).
+"""
+import itertools
+import os
+import random
+import shutil
+import tempfile
+import uuid
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+
+from amount_slots import amount_allocator
+from async_tasks import expire_transactions, match_transfers
+from benchmarks import group, measure
+from benchmarks.matching import AMOUNT_STEP
+from claimed_hashes import claimed_hashes
+from crud.ledger import get_unclaimed_transfers
+from crud.subscriptions import create_subscription
+from crud.transactions import create_transaction, get_transaction_by_telegram_id
+from database import LedgerTransfer, Transaction, close_db, init_db
+
+CRUD_OPERATIONS = 1000
+QUICK_CRUD_OPERATIONS = 200
+EXPIRY_SIZES = (1000, 10000)
+QUICK_EXPIRY_SIZES = (1000,)
+# Сколько переводов в журнале уже засчитано; ожидающих оплат и новых переводов — WATCH_PENDING
+WATCH_CLAIMED_SIZES = (1000, 10000, 50000)
+QUICK_WATCH_CLAIMED_SIZES = (1000,)
+WATCH_PENDING = 500
+
+_telegram_ids = itertools.count(1_000_000)
+
+
+@asynccontextmanager
+async def temporary_database():
+    """
+    Фабрика сессий к новой базе во временном каталоге.
+    """
+    directory = tempfile.mkdtemp(prefix="bench-db-")
+    dsn = f"sqlite+aiosqlite:///{os.path.join(directory, 'bench.db')}"
+    session_maker = await init_db(dsn)
+    try:
+        yield session_maker
+    finally:
+        await close_db(dsn)
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def _transaction(created_at, status="Pending", expected_amount=0, tx_id=None):
+    # id задаём сразу: сумма выдаётся до вставки, иначе ожидающие оплаты столкнутся на одной сумме
+    return Transaction(id=str(uuid.uuid4()), initiator=next(_telegram_ids), blockchain="TON", currency="TON",
+                       expected_amount=expected_amount, status=status, period="1m", with_chat=True,
+                       created_at=created_at, tx_id=tx_id)
+
+
+async def _crud(session_maker, operations):
+    params = {"operations": operations}
+    first_id = next(_telegram_ids) + 1
+
+    async def create_transactions():
+        async with session_maker() as session:
+            for _ in range(operations):
+                await create_transaction(session, next(_telegram_ids), 50, "", "", "1m", True)
+
+    async def get_transactions():
+        async with session_maker() as session:
+            for telegram_id in range(first_id, first_id + operations):
+                await get_transaction_by_telegram_id(session, telegram_id)
+
+    async def create_subscriptions():
+        async with session_maker() as session:
+            for _ in range(operations):
+                await create_subscription(session, next(_telegram_ids), "С чатом", 30)
+
+    return [
+        await measure("crud.create_transaction", create_transactions, params, operations, repeat=3),
+        await measure("crud.get_transaction_by_telegram_id", get_transactions, params, operations, repeat=3),
+        await measure("crud.create_subscription", create_subscriptions, params, operations, repeat=3),
+    ]
+
+
+async def _expiry(session_maker, size):
+    """
+    Проход monitor_transactions, когда истекли size ожидающих оплат.
+    Уведомления об отмене копятся в незапущенной очереди outbox.
+    """
+    stale = datetime.utcnow() - timedelta(hours=1)
+
+    async def setup():
+        transactions = [_transaction(stale, expected_amount=1 + n / 1000) for n in range(size)]
+        async with session_maker() as session:
+            session.add_all(transactions)
+            await session.commit()
+        amount_allocator.warm(transactions)
+
+    return await measure("expiry.expire_transactions", lambda _: expire_transactions(session_maker),
+                         {"pending": size}, size, repeat=3, setup=setup)
+
+
+async def _watch(session_maker, claimed):
+    """
+    Проход наблюдателя по журналу: незасчитанные переводы против WATCH_PENDING ожидающих
+    оплат, когда claimed переводов уже засчитаны (их отсекает индекс claimed_hashes).
+    """
+    rng = random.Random(claimed)
+    now = datetime.utcnow()
+    created_at = now - timedelta(minutes=10)
+    pending = [_transaction(created_at) for _ in range(WATCH_PENDING)]
+    for number, transaction in enumerate(pending):
+        base_amount = 50 * (1 + AMOUNT_STEP) ** number
+        transaction.expected_amount = amount_allocator.allocate("TON", "TON", base_amount, transaction.id)
+    async with session_maker() as session:
+        session.add_all(pending)
+
+        for number in range(claimed):
+            tx_hash = f"claimed-{number}"
+            session.add(LedgerTransfer(blockchain="TON", wallet_address="w", contract_address="", tx_hash=tx_hash,
+                                       amount=rng.uniform(1, 2000), timestamp=now))
+            session.add(_transaction(created_at, status="Success", tx_id=tx_hash))
+        # Новые переводы: каждый второй оплачивает ожидающую транзакцию
+        for number, transaction in enumerate(pending):
+            amount = transaction.expected_amount if number % 2 else rng.uniform(1, 2000)
+            session.add(LedgerTransfer(blockchain="TON", wallet_address="w", contract_address="",
+                                       tx_hash=f"new-{number}", amount=amount, timestamp=now))
+        await session.commit()
+    claimed_hashes.warm(f"claimed-{number}" for number in range(claimed))
+
+    async def watch():
+        async with session_maker() as session:
+            transfers = await get_unclaimed_transfers(session, "TON", None, created_at)
+        match_transfers(transfers, pending, "TON", "TON")
+
+    try:
+        return await measure("watch.unclaimed_and_match", watch, {"pending": WATCH_PENDING, "claimed": claimed},
+                             WATCH_PENDING, repeat=3)
+    finally:
+        for transaction in pending:
+            amount_allocator.release(transaction.id)
+        for number in range(claimed):
+            claimed_hashes.discard(f"claimed-{number}")
+
+
+@group("storage")
+async def run(quick):
+    results = []
+    async with temporary_database() as session_maker:
+        results.extend(await _crud(session_maker, QUICK_CRUD_OPERATIONS if quick else CRUD_OPERATIONS))
+    for size in QUICK_EXPIRY_SIZES if quick else EXPIRY_SIZES:
+        async with temporary_database() as session_maker:
+            results.append(await _expiry(session_maker, size))
+    for claimed in QUICK_WATCH_CLAIMED_SIZES if quick else WATCH_CLAIMED_SIZES:
+        async with temporary_database() as session_maker:
+            results.append(await _watch(session_maker, claimed))
+    return results
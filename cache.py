@@ -0,0 +1,111 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+
+from dotenv import load_dotenv
+
+from metrics import Gauge
+
+load_dotenv()
+
+# Отличает "в кэше нет" от закэшированного None (например, пользователя нет в базе)
+MISSING = object()
+
+
+class TTLCache:
+    """
+    LRU-кэш ограниченного размера, записи которого живут не дольше ttl секунд.
+    Считает попадания и промахи.
+    """
+
+    def __init__(self, maxsize=10000, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()  # ключ -> (значение, момент устаревания)
+
+    def get(self, key):
+        """
+        Значение из кэша или MISSING.
+        """
+        entry = self._data.get(key)
+        if entry is None or entry[1] < time.monotonic():
+            if entry is not None:
+                del self._data[key]
+            self.misses += 1
+            return MISSING
+        self._data.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def set(self, key, value):
+        self._data[key] = (value, time.monotonic() + self.ttl)
+        self._data.move_to_end(key)
+        if len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def invalidate(self, key):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._data)}
+
+
+class SingleFlight:
+    """
+    Объединяет одновременные вызовы с одним ключом: работу выполняет первый,
+    остальные дожидаются его результата (или исключения). name — метка в метриках.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.coalesced = 0
+        self._calls = {}  # ключ -> выполняющаяся задача
+        _flights.append(self)
+
+    async def do(self, key, func):
+        task = self._calls.get(key)
+        if task is None:
+            task = self._calls[key] = asyncio.ensure_future(func())
+            task.add_done_callback(lambda _: self._calls.pop(key, None) if self._calls.get(key) is task else None)
+        else:
+            self.coalesced += 1
+        # Отмена одного ожидающего не отменяет общую работу
+        return await asyncio.shield(task)
+
+    def __len__(self):
+        return len(self._calls)
+
+
+_flights = []
+
+CACHE_MAXSIZE = int(os.getenv("CACHE_MAXSIZE", 10000))
+CACHE_TTL = float(os.getenv("CACHE_TTL", 300))
+
+# telegram_id -> User или None, если пользователя нет
+user_cache = TTLCache(CACHE_MAXSIZE, CACHE_TTL)
+# telegram_id -> (chat_id, expiration_date) подписки или None, если подписки нет
+subscription_cache = TTLCache(CACHE_MAXSIZE, CACHE_TTL)
+
+_caches = {"user": user_cache, "subscription": subscription_cache}
+
+
+def _cache_gauge(field):
+    def collect():
+        return {(name,): cache.stats()[field] for name, cache in _caches.items()}
+    return collect
+
+
+Gauge("cache_hits", "Попадания в кэш с запуска процесса", ("cache",), collect=_cache_gauge("hits"))
+Gauge("cache_misses", "Промахи кэша с запуска процесса", ("cache",), collect=_cache_gauge("misses"))
+Gauge("cache_entries", "Записи в кэше", ("cache",), collect=_cache_gauge("size"))
+Gauge("singleflight_coalesced", "Вызовы, дождавшиеся чужого результата вместо своего запроса", ("flight",),
+      collect=lambda: {(flight.name,): flight.coalesced for flight in _flights})
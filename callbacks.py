@@ -2,6 +2,7 @@ from aiogram import Router
 from aiogram.enums import ParseMode
 from aiogram.filters import CommandStart, Command, ChatMemberUpdatedFilter, IS_NOT_MEMBER, MEMBER
 from aiogram.types import Message, ChatMemberUpdated, ChatPermissions
+from sqlalchemy.ext.asyncio import AsyncSession
 
 import strings
 
@@ -13,26 +14,40 @@ from keyboards import (
     get_main_inline_keyboard,
     get_back_to_main_menu_keyboard,
 )
-from main import bot, session
+from main import bot
 from dotenv import load_dotenv
 
 load_dotenv()
 
 router = Router()  # Создаем роутер для всех обработчиков
 
+# Имя бота не меняется, поэтому запрашиваем его один раз при запуске
+bot_username = None
+
+
+@router.startup()
+async def load_bot_identity(bot):
+    global bot_username
+    bot_username = (await bot.me()).username
+
+
+def _referral_text(telegram_id):
+    referral_link = f"https://t.me/{bot_username}?start={telegram_id}"
+    return strings.referral_template.format(referral_link=referral_link)
+
 
 @router.chat_member(
     ChatMemberUpdatedFilter(
         member_status_changed=IS_NOT_MEMBER >> MEMBER
     )
 )
-async def on_user_joined(update: ChatMemberUpdated):
+async def on_user_joined(update: ChatMemberUpdated, session: AsyncSession):
     user_id = update.from_user.id
     chat_id = update.chat.id
 
     if update.new_chat_member.status == "member":  # Пользователь только что присоединился
         # Проверяем, есть ли подписка "Без чата"
-        if is_user_muted(session, user_id):
+        if await is_user_muted(session, user_id):
             # Выдаем мут пользователю
             await bot.restrict_chat_member(
                 chat_id=chat_id,
@@ -47,7 +62,7 @@ async def on_user_joined(update: ChatMemberUpdated):
 
 
 @router.message(CommandStart())
-async def command_start_handler(message: Message):
+async def command_start_handler(message: Message, session: AsyncSession):
     telegram_id = message.from_user.id
     username = message.from_user.username
     # Извлекаем аргументы команды /start
@@ -55,12 +70,12 @@ async def command_start_handler(message: Message):
     args = text_parts[1] if len(text_parts) > 1 else None
 
     # Проверяем, есть ли пользователь в базе
-    user = get_user_by_telegram_id(session, telegram_id)
+    user = await get_user_by_telegram_id(session, telegram_id)
 
     if not user:
         # Если есть аргументы, записываем, кто пригласил
         invited_by = int(args) if args and args.isdigit() else None
-        if not create_user(session, telegram_id, username, invited_by):
+        if not await create_user(session, telegram_id, username, invited_by):
             await message.answer("Попытка не пытка")
 
     await message.answer(
@@ -79,14 +94,8 @@ async def back_to_main_callback(callback: CallbackQuery) -> None:
 
 @router.message(Command("referral"))
 async def referral_command_handler(message: Message):
-    telegram_id = message.from_user.id
-    bot_username = (await bot.me()).username
-    referral_link = f"https://t.me/{bot_username}?start={telegram_id}"
-
-    formatted_referral = strings.referral_template.format(referral_link=referral_link)
-
     await message.answer(
-        formatted_referral,
+        _referral_text(message.from_user.id),
         reply_markup=get_back_to_main_menu_keyboard(),
         parse_mode=ParseMode.HTML  # Указываем использование HTML
     )
@@ -94,14 +103,8 @@ async def referral_command_handler(message: Message):
 
 @router.callback_query(F.data == "referral_code")
 async def referral_command_callback_handler(callback: CallbackQuery):
-    telegram_id = callback.from_user.id
-    bot_username = (await bot.me()).username
-    referral_link = f"https://t.me/{bot_username}?start={telegram_id}"
-
-    formatted_referral = strings.referral_template.format(referral_link=referral_link)
-
     await callback.message.answer(
-        formatted_referral,
+        _referral_text(callback.from_user.id),
         reply_markup=get_back_to_main_menu_keyboard(),
         parse_mode=ParseMode.HTML  # Указываем использование HTML
     )
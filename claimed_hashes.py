@@ -0,0 +1,47 @@
+from metrics import Gauge
+
+
+class ClaimedHashIndex:
+    """
+    Хэши переводов, уже засчитанных в оплату (Transaction.tx_id).
+
+    Сканеры и поиск по журналу отбрасывают такие переводы за O(1), не запрашивая
+    детали и не сравнивая суммы. Индекс прогревается из базы при запуске и
+    пополняется при каждой подтверждённой оплате. Другие воркеры могут засчитать
+    перевод, о котором этот процесс ещё не знает: тогда его отсекает уникальность
+    tx_id в базе, и хэш попадает в индекс при неудачной попытке (см.
+    mark_transaction_paid). Обычное множество, а не фильтр Блума: ложное
+    срабатывание фильтра молча потеряло бы чужую оплату.
+    """
+
+    def __init__(self):
+        self._hashes = set()
+
+    def __contains__(self, tx_hash):
+        return tx_hash in self._hashes
+
+    def __len__(self):
+        return len(self._hashes)
+
+    def add(self, tx_hash):
+        self._hashes.add(tx_hash)
+
+    def discard(self, tx_hash):
+        self._hashes.discard(tx_hash)
+
+    def warm(self, tx_hashes):
+        """
+        Добавляет уже засчитанные хэши из базы.
+        """
+        self._hashes.update(tx_hashes)
+
+    def unclaimed(self, transfers):
+        """
+        Переводы (с атрибутом tx_hash), ещё не засчитанные ни в одну оплату.
+        """
+        return [transfer for transfer in transfers if transfer.tx_hash not in self._hashes]
+
+
+claimed_hashes = ClaimedHashIndex()
+
+Gauge("claimed_hashes", "Засчитанные хэши переводов в индексе процесса", collect=lambda: {(): len(claimed_hashes)})
@@ -1,8 +1,46 @@
+from types import MappingProxyType
+
 CHAT_ID = "-1002225835813"  # ID чата
-BASE_PRICES = {
+BASE_PRICES = MappingProxyType({
     "1m": 50,
     "3m": 130,
     "6m": 250,
     "1y": 490,
     "lt": 1500,
-}
+})
+# Допустимое отклонение полученной суммы от ожидаемой (доля)
+PAYMENT_TOLERANCE = 0.001
+# Не чаще, чем раз в столько секунд, подтягивать переводы кошелька по нажатию кнопки
+INGEST_MIN_INTERVAL = 5
+# Сколько секунд после неудачной проверки оплаты кнопка отвечает из кэша
+PAYMENT_CHECK_COOLDOWN = 10
+
+# Надписи периодов на кнопках тарифов
+PERIOD_LABELS = MappingProxyType({
+    "1m": "1M",
+    "3m": "3M",
+    "6m": "6M",
+    "1y": "1Y",
+    "lt": "Навсегда",
+})
+# Период в тексте сообщения
+PERIOD_TITLES = MappingProxyType({
+    "1m": "1 месяц",
+    "3m": "3 месяца",
+    "6m": "полгода",
+    "1y": "год",
+    "lt": "вечно",
+})
+# Сколько дней даёт каждый тариф
+PERIOD_DAYS = MappingProxyType({
+    "1m": 30,
+    "3m": 120,
+    "6m": 180,
+    "1y": 365,
+    "lt": 15000,
+})
+# Цена в USD по (с чатом, период); подписка без возможности писать вдвое дешевле
+TARIFF_PRICES = MappingProxyType({
+    **{(True, period): price for period, price in BASE_PRICES.items()},
+    **{(False, period): price / 2 for period, price in BASE_PRICES.items()},
+})
@@ -0,0 +1,38 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import update, delete, or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import Lease
+
+
+async def acquire_lease(session: AsyncSession, name: str, holder: str, ttl: float) -> bool:
+    """
+    Захватывает или продлевает аренду на ttl секунд.
+    Возвращает False, если аренду держит другой процесс и она ещё не истекла.
+    """
+    now = datetime.utcnow()
+    expires_at = now + timedelta(seconds=ttl)
+    result = await session.execute(
+        update(Lease)
+        .where(Lease.name == name, or_(Lease.holder == holder, Lease.expires_at < now))
+        .values(holder=holder, expires_at=expires_at)
+    )
+    await session.commit()
+    if result.rowcount == 1:
+        return True
+
+    # Записи ещё нет — первый, кто её вставит, и станет держателем
+    session.add(Lease(name=name, holder=holder, expires_at=expires_at))
+    try:
+        await session.commit()
+    except IntegrityError:
+        await session.rollback()
+        return False
+    return True
+
+
+async def release_lease(session: AsyncSession, name: str, holder: str) -> None:
+    await session.execute(delete(Lease).where(Lease.name == name, Lease.holder == holder))
+    await session.commit()
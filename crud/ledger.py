@@ -0,0 +1,131 @@
+from datetime import datetime
+
+from sqlalchemy import Select, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from claimed_hashes import claimed_hashes
+from database import ChainCursor, LedgerTransfer
+
+
+# Строк в одном INSERT: держимся ниже лимита параметров запроса SQLite
+INSERT_CHUNK = 500
+_TRANSFER_COLUMNS = ("blockchain", "wallet_address", "contract_address", "tx_hash", "amount", "timestamp")
+
+
+def _insert_ignoring_duplicates(session: AsyncSession, table, *index_elements):
+    # Кошелёк могут одновременно загружать несколько воркеров: чужая строка — не ошибка
+    dialect = postgresql if session.get_bind().dialect.name == "postgresql" else sqlite
+    return dialect.insert(table).on_conflict_do_nothing(index_elements=index_elements)
+
+
+async def get_cursor(session: AsyncSession, blockchain: str, wallet_address: str,
+                     contract_address: str | None) -> ChainCursor:
+    """
+    Возвращает курсор кошелька, создавая пустой при первом обращении.
+    """
+    contract_address = contract_address or ""
+    query = select(ChainCursor).filter_by(
+        blockchain=blockchain, wallet_address=wallet_address, contract_address=contract_address
+    )
+    cursor = (await session.execute(query)).scalars().first()
+    if cursor is None:
+        await session.execute(
+            _insert_ignoring_duplicates(session, ChainCursor, "blockchain", "wallet_address", "contract_address")
+            .values(blockchain=blockchain, wallet_address=wallet_address, contract_address=contract_address)
+        )
+        # Не держим блокировку записи, пока история кошелька загружается из сети
+        await session.commit()
+        cursor = (await session.execute(query)).scalars().one()
+    return cursor
+
+
+async def save_transfers(session: AsyncSession, cursor: ChainCursor, transfers, new_cursor) -> list[LedgerTransfer]:
+    """
+    Записывает новые переводы в журнал и сдвигает курсор в одной транзакции.
+    Уже записанные переводы (повторно пришедшие на границе курсора) пропускаются.
+    """
+    # Засчитанные переводы заведомо уже в журнале
+    known = {transfer.tx_hash for transfer in transfers if transfer.tx_hash in claimed_hashes}
+    fresh = [transfer.tx_hash for transfer in transfers if transfer.tx_hash not in known]
+    if fresh:
+        result = await session.execute(
+            select(LedgerTransfer.tx_hash).filter(
+                LedgerTransfer.blockchain == cursor.blockchain,
+                LedgerTransfer.tx_hash.in_(fresh),
+            )
+        )
+        known.update(result.scalars())
+
+    entries = []
+    for transfer in transfers:
+        if transfer.tx_hash in known:
+            continue
+        known.add(transfer.tx_hash)
+        entries.append(LedgerTransfer(
+            blockchain=cursor.blockchain,
+            wallet_address=cursor.wallet_address,
+            contract_address=cursor.contract_address,
+            tx_hash=transfer.tx_hash,
+            amount=transfer.amount,
+            timestamp=transfer.timestamp,
+        ))
+
+    inserted = set()
+    for start in range(0, len(entries), INSERT_CHUNK):
+        # Переводы, которые успел записать другой воркер, пропускаются базой
+        result = await session.execute(
+            _insert_ignoring_duplicates(session, LedgerTransfer, "blockchain", "tx_hash")
+            .values([
+                {column: getattr(entry, column) for column in _TRANSFER_COLUMNS}
+                for entry in entries[start:start + INSERT_CHUNK]
+            ])
+            .returning(LedgerTransfer.tx_hash)
+        )
+        inserted.update(result.scalars())
+    saved = [entry for entry in entries if entry.tx_hash in inserted]
+
+    cursor.cursor = new_cursor
+    cursor.updated_at = datetime.utcnow()
+    await session.commit()
+    return saved
+
+
+def payment_transfer_query(blockchain: str, contract_address: str | None, expected_amount: float,
+                           since: datetime, tolerance: float) -> Select:
+    return select(LedgerTransfer).filter(
+        LedgerTransfer.blockchain == blockchain,
+        LedgerTransfer.contract_address == (contract_address or ""),
+        LedgerTransfer.amount.between(expected_amount * (1 - tolerance), expected_amount * (1 + tolerance)),
+        LedgerTransfer.timestamp >= since,
+    ).order_by(LedgerTransfer.timestamp)
+
+
+async def find_payment_transfer(session: AsyncSession, blockchain: str, contract_address: str | None, expected_amount: float,
+                          since: datetime, tolerance: float, competing=()) -> LedgerTransfer | None:
+    """
+    Ищет в журнале незасчитанный перевод на ожидаемую сумму, пришедший после создания транзакции.
+    competing — суммы других ожидающих оплат рядом: перевод, который ближе к одной из них, не подходит.
+    """
+    result = await session.execute(payment_transfer_query(blockchain, contract_address, expected_amount, since,
+                                                          tolerance))
+    # Переводы, уже засчитанные в оплату какой-либо транзакции, не подходят
+    for transfer in claimed_hashes.unclaimed(result.scalars()):
+        distance = abs(transfer.amount - expected_amount)
+        if all(distance <= abs(transfer.amount - amount) for amount in competing):
+            return transfer
+    return None
+
+
+async def get_unclaimed_transfers(session: AsyncSession, blockchain: str, contract_address: str | None,
+                            since: datetime) -> list[LedgerTransfer]:
+    """
+    Незасчитанные переводы на кошелёк, пришедшие после since.
+    """
+    query = select(LedgerTransfer).filter(
+        LedgerTransfer.blockchain == blockchain,
+        LedgerTransfer.contract_address == (contract_address or ""),
+        LedgerTransfer.timestamp >= since,
+    )
+    result = await session.execute(query.order_by(LedgerTransfer.timestamp))
+    return claimed_hashes.unclaimed(result.scalars())
@@ -1,22 +1,38 @@
-from sqlalchemy.orm import Session
+from sqlalchemy import Select, select, delete
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import timedelta, datetime
 
-from database import Subscription
+from cache import subscription_cache, MISSING
+from database import Subscription, SubscriptionEvent
+from scheduler import subscription_scheduler
 
 
-def extend_subscription(session: Session, telegram_id: int) -> Subscription:
+def subscription_query(telegram_id: int) -> Select:
+    return select(Subscription).filter(Subscription.user_id == telegram_id)
+
+
+async def get_subscription(session: AsyncSession, telegram_id: int) -> Subscription | None:
+    result = await session.execute(subscription_query(telegram_id))
+    return result.scalars().first()
+
+
+def _subscription_changed(subscription: Subscription) -> None:
+    # Обновляем кэш статуса и планировщик после каждого изменения подписки
+    subscription_cache.set(subscription.user_id, (subscription.chat_id, subscription.expiration_date))
+    subscription_scheduler.schedule(subscription)
+
+
+async def extend_subscription(session: AsyncSession, telegram_id: int) -> Subscription:
     # Ищем существующую подписку пользователя
-    existing_subscription = (
-        session.query(Subscription)
-        .filter(Subscription.user_id == telegram_id)
-        .first()
-    )
+    existing_subscription = await get_subscription(session, telegram_id)
 
     if existing_subscription:
         # Продлеваем подписку на 10 дней
         existing_subscription.expiration_date += timedelta(days=10)
-        session.commit()
-        session.refresh(existing_subscription)
+        await session.commit()
+        await session.refresh(existing_subscription)
+        _subscription_changed(existing_subscription)
         return existing_subscription
     else:
         # Если подписки нет, создаем новую на 10 дней
@@ -26,36 +42,38 @@ def extend_subscription(session: Session, telegram_id: int) -> Subscription:
             chat_id="example_chat_id",  # Укажите реальный chat_id, если нужно
         )
         session.add(new_subscription)
-        session.commit()
-        session.refresh(new_subscription)
+        await session.commit()
+        await session.refresh(new_subscription)
+        _subscription_changed(new_subscription)
         return new_subscription
 
 
-def is_user_muted(session: Session, user_id: int) -> bool:
+async def is_user_muted(session: AsyncSession, user_id: int) -> bool:
     """
     Проверяет, есть ли у пользователя подписка 'Без чата'.
     """
-    subscription = (
-        session.query(Subscription)
-        .filter(Subscription.user_id == user_id, Subscription.expiration_date > datetime.utcnow())
-        .first()
-    )
-    return subscription and subscription.chat_id == "without_chat"
+    status = subscription_cache.get(user_id)
+    if status is MISSING:
+        subscription = await get_subscription(session, user_id)
+        status = (subscription.chat_id, subscription.expiration_date) if subscription else None
+        subscription_cache.set(user_id, status)
+    if status is None:
+        return False
+    chat_id, expiration_date = status
+    return expiration_date > datetime.utcnow() and chat_id == "without_chat"
 
 
-def create_subscription(session: Session, telegram_id: int, subscription_type: str, days: int) -> Subscription:
+async def create_subscription(session: AsyncSession, telegram_id: int, subscription_type: str,
+                              days: int) -> Subscription:
     chat_id = "without_chat" if subscription_type == "Без чата" else "with_chat"
 
-    existing_subscription = (
-        session.query(Subscription)
-        .filter(Subscription.user_id == telegram_id)
-        .first()
-    )
+    existing_subscription = await get_subscription(session, telegram_id)
 
     if existing_subscription:
         existing_subscription.expiration_date += timedelta(days)
-        session.commit()
-        session.refresh(existing_subscription)
+        await session.commit()
+        await session.refresh(existing_subscription)
+        _subscription_changed(existing_subscription)
         return existing_subscription
 
     else:
@@ -66,5 +84,57 @@ def create_subscription(session: Session, telegram_id: int, subscription_type: s
             muted=(subscription_type == "Без чата")
         )
         session.add(new_subscription)
-        session.commit()
+        await session.commit()
+        _subscription_changed(new_subscription)
         return new_subscription
+
+
+def subscriptions_query() -> Select:
+    return select(Subscription).order_by(Subscription.expiration_date)
+
+
+async def get_subscriptions(session: AsyncSession) -> list[Subscription]:
+    result = await session.execute(subscriptions_query())
+    return list(result.scalars())
+
+
+def subscriptions_changed_since_query(since: datetime) -> Select:
+    return select(Subscription).filter(Subscription.updated_at >= since)
+
+
+async def get_subscriptions_changed_since(session: AsyncSession, since: datetime) -> list[Subscription]:
+    """
+    Подписки, созданные или продлённые начиная с since.
+    """
+    result = await session.execute(subscriptions_changed_since_query(since))
+    return list(result.scalars())
+
+
+async def delete_subscription(session: AsyncSession, telegram_id: int,
+                              expiration_date: datetime | None = None) -> bool:
+    """
+    Удаляет подписку. С expiration_date — только если срок с тех пор не менялся.
+    Возвращает False, если удалять было нечего.
+    """
+    query = delete(Subscription).where(Subscription.user_id == telegram_id)
+    if expiration_date is not None:
+        query = query.where(Subscription.expiration_date == expiration_date)
+    result = await session.execute(query)
+    await session.commit()
+    if result.rowcount:
+        subscription_cache.set(telegram_id, None)
+    return result.rowcount > 0
+
+
+async def record_subscription_event(session: AsyncSession, telegram_id: int, kind: str,
+                                    expiration_date: datetime) -> bool:
+    """
+    Отмечает, что событие подписки сработало. Возвращает False, если оно уже было.
+    """
+    session.add(SubscriptionEvent(user_id=telegram_id, kind=kind, expiration_date=expiration_date))
+    try:
+        await session.commit()
+    except IntegrityError:
+        await session.rollback()
+        return False
+    return True
@@ -1,27 +1,135 @@
-from sqlalchemy.orm import Session
+from datetime import datetime
+
+from sqlalchemy import Select, Update, func, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from amount_slots import amount_allocator
+from claimed_hashes import claimed_hashes
 from database import Transaction
-import random
 
-def get_transaction_by_telegram_id(session: Session, telegram_id: int) -> Transaction | None:
-    return session.query(Transaction).filter_by(initiator=telegram_id, status="Pending").first()
+def transaction_by_telegram_id_query(telegram_id: int) -> Select:
+    return select(Transaction).filter_by(initiator=telegram_id, status="Pending")
+
+
+async def get_transaction_by_telegram_id(session: AsyncSession, telegram_id: int) -> Transaction | None:
+    result = await session.execute(transaction_by_telegram_id_query(telegram_id))
+    return result.scalars().first()
 
-def create_transaction(session, telegram_id, base_price, blockchain, currency, period, with_chat):
+async def create_transaction(session, telegram_id, base_price, blockchain, currency, period, with_chat):
     """
-    Создает транзакцию с плавающей суммой.
+    Создает транзакцию на сумму тарифа в USD.
+    Уникальная сумма в валюте оплаты выдаётся позже, при выборе валюты (см. amount_slots).
     """
-    # Уникальная поправка: ±0.01% от base_price
-    adjustment = random.uniform(-0.0001, 0.0001) * base_price
-    expected_amount = round(base_price + adjustment, 8)  # Уточняем до 6 знаков после запятой
-
     new_transaction = Transaction(
         initiator=telegram_id,
         blockchain=blockchain,
-        expected_amount=expected_amount,
+        expected_amount=base_price,
         currency=currency,
         period=period,
         with_chat=with_chat,
         status="Pending"
     )
     session.add(new_transaction)
-    session.commit()
+    await session.commit()
     return new_transaction
+
+
+def pending_transactions_query(blockchain: str | None = None, currency: str | None = None) -> Select:
+    query = select(Transaction).filter(Transaction.status == "Pending", Transaction.blockchain != "")
+    if blockchain is not None:
+        query = query.filter(Transaction.blockchain == blockchain, Transaction.currency == currency)
+    return query
+
+
+async def get_pending_transactions(session: AsyncSession, blockchain: str | None = None,
+                                   currency: str | None = None) -> list[Transaction]:
+    """
+    Ожидающие оплаты транзакции, для которых уже выбрана валюта (при желании — только в одной сети и валюте).
+    """
+    result = await session.execute(pending_transactions_query(blockchain, currency))
+    return list(result.scalars())
+
+
+def pending_amounts_query(blockchain: str, currency: str, low: float, high: float) -> Select:
+    # blockchain != "" — условие частичного индекса ix_transactions_pending_amount
+    return select(Transaction.expected_amount).filter(
+        Transaction.status == "Pending", Transaction.blockchain != "",
+        Transaction.blockchain == blockchain, Transaction.currency == currency,
+        Transaction.expected_amount.between(low, high),
+    )
+
+
+async def get_pending_amounts(session: AsyncSession, blockchain: str, currency: str,
+                              low: float, high: float) -> list[float]:
+    """
+    Суммы ожидающих оплат пары в диапазоне [low, high] — в том числе выданные другими воркерами.
+    """
+    result = await session.execute(pending_amounts_query(blockchain, currency, low, high))
+    return list(result.scalars())
+
+
+async def get_oldest_pending_time(session: AsyncSession, blockchain: str, currency: str) -> datetime | None:
+    """
+    Время создания самой ранней ожидающей оплаты в сети и валюте.
+    """
+    result = await session.execute(
+        select(func.min(Transaction.created_at))
+        .filter(Transaction.status == "Pending", Transaction.blockchain == blockchain, Transaction.currency == currency)
+    )
+    return result.scalar()
+
+
+async def mark_transaction_paid(session: AsyncSession, transaction: Transaction, tx_id: str) -> bool:
+    """
+    Отмечает транзакцию оплаченной, только если она всё ещё в статусе Pending.
+    Возвращает False, если оплату уже подтвердил другой обработчик или перевод
+    уже засчитан в другую оплату (например, другим воркером).
+    """
+    try:
+        # Точка сохранения: откат не сбрасывает остальные объекты сессии
+        async with session.begin_nested():
+            result = await session.execute(
+                update(Transaction)
+                .filter_by(id=transaction.id, status="Pending")
+                .values(status="Success", tx_id=tx_id)
+            )
+    except IntegrityError:
+        # tx_id уникален: перевод засчитан в другую транзакцию, которой этот процесс не видел
+        await session.commit()
+        claimed_hashes.add(tx_id)
+        return False
+    await session.commit()
+    amount_allocator.release(transaction.id)
+    if result.rowcount != 1:
+        return False
+    claimed_hashes.add(tx_id)
+    return True
+
+
+async def get_claimed_hashes(session: AsyncSession) -> list[str]:
+    """
+    Хэши всех переводов, уже засчитанных в оплату (для прогрева claimed_hashes).
+    """
+    result = await session.execute(select(Transaction.tx_id).filter(Transaction.tx_id.is_not(None)))
+    return list(result.scalars())
+
+
+def expire_stale_transactions_query(created_before: datetime) -> Update:
+    return (
+        update(Transaction)
+        .where(Transaction.status == "Pending", Transaction.created_at < created_before)
+        .values(status="Expired")
+        .returning(Transaction.id, Transaction.initiator)
+        .execution_options(synchronize_session=False)
+    )
+
+
+async def expire_stale_transactions(session: AsyncSession, created_before: datetime) -> list[tuple[str, int]]:
+    """
+    Одним UPDATE переводит в Expired все ожидающие транзакции, созданные раньше created_before.
+    Возвращает пары (id транзакции, telegram_id инициатора).
+    """
+    result = await session.execute(expire_stale_transactions_query(created_before))
+    expired = [tuple(row) for row in result]
+    await session.commit()
+    return expired
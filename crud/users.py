@@ -1,19 +1,42 @@
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from cache import user_cache, MISSING
 from database import User
 
 
-def get_user_by_telegram_id(session: Session, telegram_id: int) -> User | None:
-    return session.query(User).filter_by(telegram_id=telegram_id).first()
+async def get_user_by_telegram_id(session: AsyncSession, telegram_id: int) -> User | None:
+    """
+    Пользователь по telegram_id. Повторные чтения отдаются из кэша;
+    возвращаемый объект только для чтения.
+    """
+    user = user_cache.get(telegram_id)
+    if user is not MISSING:
+        return user
+    result = await session.execute(select(User).filter_by(telegram_id=telegram_id))
+    user = result.scalars().first()
+    user_cache.set(telegram_id, user)
+    return user
 
 
-def create_user(session, telegram_id, username=None, invited_by=None):
+async def create_user(session, telegram_id, username=None, invited_by=None):
     if telegram_id == invited_by:
         return False
+    # В /start можно передать любые цифры: бонус начисляется только существующему пользователю
+    if invited_by is not None and await get_user_by_telegram_id(session, invited_by) is None:
+        invited_by = None
     new_user = User(
         telegram_id=telegram_id,
         username=username,
         invited_by=invited_by
     )
     session.add(new_user)
-    session.commit()
+    try:
+        await session.commit()
+    except IntegrityError:
+        # Пользователя уже создал параллельный апдейт (в том числе в другом воркере)
+        await session.rollback()
+        user_cache.invalidate(telegram_id)
+        return True
+    user_cache.set(telegram_id, new_user)
     return True
@@ -0,0 +1,166 @@
+import asyncio
+import os
+import random
+import time
+from collections import deque
+
+from dotenv import load_dotenv
+
+from resilience import is_transient
+
+load_dotenv()
+
+# Сглаживание средней задержки (EWMA): доля нового замера
+LATENCY_SMOOTHING = 0.2
+# Сколько последних замеров хранить для перцентиля
+LATENCY_WINDOW = 200
+# Дублирующий запрос уходит, если ответа нет дольше этого перцентиля задержек
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", 0.95))
+# Пока замеров меньше, вместо перцентиля ждём HEDGE_DEFAULT_DELAY секунд
+HEDGE_MIN_SAMPLES = 20
+HEDGE_DEFAULT_DELAY = 1.0
+# Узел, ответивший ошибкой, уходит в конец очереди на 2^n секунд (не больше MAX_ENDPOINT_COOLDOWN)
+MAX_ENDPOINT_COOLDOWN = 60
+
+
+class Endpoint:
+    """
+    Один адрес провайдера и его статистика.
+    """
+
+    def __init__(self, url):
+        self.url = url
+        self.requests = 0
+        self.errors = 0
+        self.hedged = 0  # Сколько раз на него уходил дублирующий запрос
+        self.latency = None  # EWMA успешных ответов, секунды
+        self.last_error = None
+        self._samples = deque(maxlen=LATENCY_WINDOW)
+        self._failures = 0  # Ошибок подряд
+        self._down_until = 0.0
+
+    def is_healthy(self):
+        return self._down_until <= time.monotonic()
+
+    def record_success(self, elapsed):
+        self._samples.append(elapsed)
+        self.latency = elapsed if self.latency is None else (
+            LATENCY_SMOOTHING * elapsed + (1 - LATENCY_SMOOTHING) * self.latency
+        )
+        self._failures = 0
+        self._down_until = 0.0
+
+    def record_failure(self, error):
+        self.errors += 1
+        self._failures += 1
+        self.last_error = f"{type(error).__name__}: {error}"
+        self._down_until = time.monotonic() + min(MAX_ENDPOINT_COOLDOWN, 2 ** self._failures)
+
+    def percentile(self, q):
+        if len(self._samples) < HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def stats(self):
+        return {
+            "url": self.url,
+            "requests": self.requests,
+            "errors": self.errors,
+            "hedged": self.hedged,
+            "latency_ms": round(self.latency * 1000, 1) if self.latency is not None else None,
+            "p95_ms": round(self.percentile(0.95) * 1000, 1) if self.percentile(0.95) is not None else None,
+            "healthy": self.is_healthy(),
+            "last_error": self.last_error,
+        }
+
+
+class EndpointPool:
+    """
+    Упорядоченный список адресов одного провайдера.
+
+    Основной адрес выбирается случайно с весом, обратным средней задержке, среди
+    исправных узлов; остальные — запасные в порядке задержки. Если основной не
+    ответил за hedge_percentile своих задержек, тот же запрос уходит на следующий
+    узел, и берётся первый успешный ответ. Временная ошибка (сеть, 5xx, 429)
+    переводит запрос на следующий узел; ошибка клиента возвращается сразу.
+    """
+
+    def __init__(self, urls, hedge_percentile=HEDGE_PERCENTILE):
+        if isinstance(urls, str):
+            urls = [urls]
+        self.endpoints = [Endpoint(url.rstrip("/")) for url in urls]
+        self.hedge_percentile = hedge_percentile
+
+    def ranked(self):
+        """
+        Порядок попыток для очередного запроса.
+        """
+        healthy = [endpoint for endpoint in self.endpoints if endpoint.is_healthy()]
+        unhealthy = [endpoint for endpoint in self.endpoints if not endpoint.is_healthy()]
+        if not healthy:
+            return unhealthy
+
+        # Узлы без замеров получают вес самого быстрого, чтобы их тоже попробовали
+        known = [endpoint.latency for endpoint in healthy if endpoint.latency]
+        default = min(known) if known else 1.0
+        weights = [1 / (endpoint.latency or default) for endpoint in healthy]
+        primary = random.choices(healthy, weights)[0]
+        rest = sorted((e for e in healthy if e is not primary), key=lambda e: e.latency or default)
+        return [primary, *rest, *unhealthy]
+
+    def hedge_delay(self, endpoint):
+        delay = endpoint.percentile(self.hedge_percentile)
+        return HEDGE_DEFAULT_DELAY if delay is None else delay
+
+    async def _attempt(self, endpoint, send):
+        endpoint.requests += 1
+        started = time.monotonic()
+        try:
+            result = await send(endpoint.url)
+        except Exception as e:
+            if is_transient(e):
+                endpoint.record_failure(e)
+            raise
+        endpoint.record_success(time.monotonic() - started)
+        return result
+
+    async def call(self, send):
+        """
+        send(base_url) выполняет запрос к одному узлу. Возвращает первый успешный результат.
+        """
+        queue = self.ranked()
+        pending = set()
+        last_error = None
+        try:
+            while queue or pending:
+                if not pending:
+                    endpoint = queue.pop(0)
+                    pending.add(asyncio.ensure_future(self._attempt(endpoint, send)))
+                    timeout = self.hedge_delay(endpoint) if queue else None
+                else:
+                    timeout = None
+
+                done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # Основной узел медлит — дублируем запрос на следующий
+                    endpoint = queue.pop(0)
+                    endpoint.hedged += 1
+                    pending.add(asyncio.ensure_future(self._attempt(endpoint, send)))
+                    continue
+
+                errors = [task.exception() for task in done]
+                for task, error in zip(done, errors):
+                    if error is None:
+                        return task.result()
+                for error in errors:
+                    if not is_transient(error):
+                        raise error
+                    last_error = error
+            raise last_error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def stats(self):
+        return [endpoint.stats() for endpoint in self.endpoints]
@@ -0,0 +1,537 @@
+"""
+Офлайн-замена обозревателей блокчейнов для бенчмарков и нагрузочных прогонов.
+
+История кошелька генерируется детерминированно, а FakeExplorer отвечает на те
+же запросы, что и настоящие провайдеры (Solana RPC, Etherscan, Tronscan,
+toncenter), страницами в их формате. attach() подставляет его вместо
+HTTP-запросов клиента из api_calls, так что разбор и пагинация работают как
+в бою, но без сети. ExplorerStub — то же самое по HTTP, вместе с CoinGecko,
+записью и воспроизведением настоящих ответов и сбоями по заказу.
+
+    python fake_explorer.py --port 8090 --history 10000 --latency 0.05 --slow-share 0.02 --rate-limit 0.01
+    # напечатанные переменные (*_API_URLS, COINGECKO_API_URL, *_WALLET_ADDRESS) — в окружение бота
+
+    python fake_explorer.py --record ton.jsonl --upstream TON=https://toncenter.com/api/v2   # запись
+    python fake_explorer.py --replay ton.jsonl                                             # воспроизведение
+"""
+import argparse
+import asyncio
+import functools
+import json
+import random
+import time
+from collections import Counter, namedtuple
+
+import aiohttp
+from aiohttp import web
+
+from api_calls import SYSTEM_PROGRAM_ID
+from rates import COINGECKO_IDS
+
+# Кошельки и контракты по умолчанию (как в переменных окружения *_WALLET_ADDRESS и *_MINT_ADDRESS)
+WALLETS = {
+    "SOL": "FakeSo1Wa11et1111111111111111111111111111111",
+    "BSC": "0xfa4e000000000000000000000000000000000b5c",
+    "Base": "0xfa4e000000000000000000000000000000000ba5",
+    "TRON": "TFakeTronWa11et111111111111111111",
+    "TON": "EQFakeTonWa11et1111111111111111111111111111111",
+}
+TOKEN_CONTRACTS = {
+    "BSC": "0x55d398326f99059ff775485246999027b3197955",
+    "TRON": "TR7NHqjeKQxGTCi8q8ZY4pL8otSzgjLj6t",
+    "Base": "0x833589fcd6edb6e08f4c7c32d4f71b54bda02913",
+}
+OTHER_ADDRESS = "0x0ther000000000000000000000000000000000000"
+
+# Запись истории кошелька; index 0 — самая новая
+HistoryEntry = namedtuple("HistoryEntry", ["index", "tx_hash", "amount", "incoming", "failed", "timestamp"])
+
+
+def synthetic_history(count, seed=0, incoming_share=0.5, failed_share=0.02, start=None, interval=30):
+    """
+    count записей от новых к старым: входящие переводы вперемешку с исходящими и неуспешными.
+    """
+    rng = random.Random(seed)
+    start = int(start or time.time())
+    return [
+        HistoryEntry(
+            index=index,
+            tx_hash=f"{seed:08x}{index:056x}",
+            amount=round(rng.uniform(1, 500), 6),
+            incoming=rng.random() < incoming_share,
+            failed=rng.random() < failed_share,
+            timestamp=start - index * interval,
+        )
+        for index in range(count)
+    ]
+
+
+def history_with_amounts(amounts, count=None, seed=0, start=None, interval=30):
+    """
+    История, в которой на кошелёк пришли переводы на заданные суммы (самые новые записи),
+    дополненная до count записей синтетическими.
+    """
+    count = max(count or 0, len(amounts))
+    entries = synthetic_history(count, seed, start=start, interval=interval)
+    for index, amount in enumerate(amounts):
+        entries[index] = entries[index]._replace(amount=amount, incoming=True, failed=False)
+    return entries
+
+
+class FakeExplorer:
+    """
+    Отвечает на запросы клиента одной сети по истории entries.
+    """
+
+    def __init__(self, blockchain, entries, wallet_address=None, token=False):
+        self.blockchain = blockchain
+        self.entries = entries
+        self.wallet_address = wallet_address or WALLETS[blockchain]
+        self.token = token
+        self.requests = 0
+        self._positions = {entry.tx_hash: entry.index for entry in entries}
+
+    def add_transfer(self, amount, timestamp=None):
+        """
+        Новый входящий перевод на кошелёк (становится самой новой записью истории).
+        Блоки, lt и метки времени старых записей не меняются.
+        """
+        entry = HistoryEntry(0, f"new{len(self.entries):061x}", amount, True, False,
+                             int(timestamp or time.time()))
+        self.entries = [entry, *(old._replace(index=old.index + 1) for old in self.entries)]
+        self._positions = {entry.tx_hash: entry.index for entry in self.entries}
+        return entry
+
+    def attach(self, api):
+        """
+        Направляет запросы клиента api (экземпляра BlockchainAPI) в этот обозреватель.
+        """
+        api._request = self.request
+        return api
+
+    async def request(self, method, path, check=None, params=None, json=None):
+        self.requests += 1
+        data = self.respond(path, params or {}, json)
+        if check is not None:
+            check(data)
+        return data
+
+    def respond(self, path, params, payload=None):
+        if self.blockchain == "SOL":
+            if isinstance(payload, list):
+                return [self._solana(item) for item in payload]
+            return self._solana(payload)
+        if self.blockchain in ("BSC", "Base"):
+            return self._etherscan(params)
+        if self.blockchain == "TRON":
+            return self._tron(path, params)
+        if self.blockchain == "TON":
+            return self._ton(path, params)
+        raise ValueError(f"Блокчейн {self.blockchain} не поддерживается.")
+
+    def render(self, entry):
+        """
+        Запись истории в формате списка транзакций провайдера.
+        """
+        if self.blockchain == "SOL":
+            return self._solana_signature(entry)
+        if self.blockchain in ("BSC", "Base"):
+            return self._etherscan_tx(entry)
+        if self.blockchain == "TRON":
+            return self._tron_tx(entry)
+        return self._ton_tx(entry)
+
+    def _destination(self, entry):
+        return self.wallet_address if entry.incoming else OTHER_ADDRESS
+
+    # Solana JSON-RPC
+    def _solana(self, request):
+        method, params = request["method"], request["params"]
+        if method == "getSignaturesForAddress":
+            options = params[1]
+            start = self._positions[options["before"]] + 1 if options.get("before") else 0
+            stop = self._positions.get(options.get("until"), len(self.entries))
+            result = [self._solana_signature(entry) for entry in self.entries[start:min(stop, start + options["limit"])]]
+        elif method == "getTransaction":
+            position = self._positions.get(params[0])
+            result = self.render_details(self.entries[position]) if position is not None else None
+        else:
+            return {"jsonrpc": "2.0", "id": request["id"], "error": {"code": -32601, "message": "Method not found"}}
+        return {"jsonrpc": "2.0", "id": request["id"], "result": result}
+
+    @staticmethod
+    def _solana_signature(entry):
+        return {
+            "signature": entry.tx_hash,
+            "slot": 300_000_000 - entry.index,
+            "blockTime": entry.timestamp,
+            "err": {"InstructionError": [0, "Custom"]} if entry.failed else None,
+        }
+
+    def render_details(self, entry):
+        """
+        Ответ getTransaction (jsonParsed) для записи истории Solana.
+        """
+        return {
+            "blockTime": entry.timestamp,
+            "transaction": {"message": {"instructions": [{
+                "programId": SYSTEM_PROGRAM_ID,
+                "parsed": {"type": "transfer", "info": {
+                    "source": OTHER_ADDRESS,
+                    "destination": self._destination(entry),
+                    "lamports": int(entry.amount * 1e9),
+                }},
+            }]}},
+        }
+
+    # Etherscan (bscscan, basescan)
+    def _block(self, entry):
+        return 1_000_000 + len(self.entries) - entry.index
+
+    def _etherscan(self, params):
+        limit, page = int(params.get("offset", 10)), int(params.get("page", 1))
+        entries = self.entries
+        if params.get("startblock") is not None:
+            # Только записи с блоком не ниже startblock
+            entries = entries[:max(0, 1_000_000 + len(entries) - int(params["startblock"]) + 1)]
+        if params.get("endblock") is not None:
+            # Только записи с блоком не выше endblock
+            entries = [entry for entry in entries if self._block(entry) <= int(params["endblock"])]
+        if params.get("sort") == "asc":
+            entries = entries[::-1]
+        page = entries[(page - 1) * limit:page * limit]
+        return {"status": "1", "message": "OK", "result": [self._etherscan_tx(entry) for entry in page]}
+
+    def _etherscan_tx(self, entry):
+        tx = {
+            "blockNumber": str(self._block(entry)),
+            "timeStamp": str(entry.timestamp),
+            "hash": entry.tx_hash,
+            "from": OTHER_ADDRESS,
+            "to": self._destination(entry),
+            "value": str(int(entry.amount * 10 ** 18)),
+            "isError": "1" if entry.failed else "0",
+        }
+        if self.token:
+            tx["tokenDecimal"] = "18"
+        return tx
+
+    # Tronscan
+    def _tron(self, path, params):
+        if path.endswith("/transaction-info"):
+            position = self._positions.get(params.get("hash"))
+            return self._tron_tx(self.entries[position]) if position is not None else {}
+        start, limit = int(params.get("start", 0)), int(params.get("limit", 10))
+        entries = self.entries
+        if params.get("end_timestamp") is not None:
+            entries = [entry for entry in entries if entry.timestamp * 1000 <= int(params["end_timestamp"])]
+        page = [self._tron_tx(entry) for entry in entries[start:start + limit]]
+        key = "token_transfers" if path.endswith("/token_trc20/transfers") else "data"
+        return {"total": len(self.entries), key: page}
+
+    def _tron_tx(self, entry):
+        if self.token:
+            return {
+                "transaction_id": entry.tx_hash,
+                "block_ts": entry.timestamp * 1000,
+                "from_address": OTHER_ADDRESS,
+                "to_address": self._destination(entry),
+                "quant": str(int(entry.amount * 1e6)),
+            }
+        return {
+            "hash": entry.tx_hash,
+            "timestamp": entry.timestamp * 1000,
+            "contractData": {"owner_address": OTHER_ADDRESS, "to_address": self._destination(entry),
+                             "amount": int(entry.amount * 1e6)},
+        }
+
+    # toncenter
+    def _lt(self, entry):
+        return len(self.entries) - entry.index
+
+    def _ton(self, path, params):
+        if path.endswith("/getTransaction"):
+            position = self._positions.get(params.get("hash"))
+            return {"ok": True, "result": self._ton_tx(self.entries[position]) if position is not None else {}}
+        limit = int(params.get("limit", 10))
+        start = len(self.entries) - int(params["lt"]) if params.get("lt") else 0
+        to_lt = int(params.get("to_lt") or 0)
+        page = [
+            self._ton_tx(entry) for entry in self.entries[start:start + limit] if self._lt(entry) > to_lt
+        ]
+        return {"ok": True, "result": page}
+
+    def _ton_tx(self, entry):
+        return {
+            "utime": entry.timestamp,
+            "transaction_id": {"lt": str(self._lt(entry)), "hash": entry.tx_hash},
+            "in_msg": {
+                "source": OTHER_ADDRESS if entry.incoming else "",
+                "destination": self.wallet_address,
+                "value": str(int(entry.amount * 1e9)),
+            },
+        }
+
+
+# Курсы, которые отдаёт заглушка CoinGecko
+STUB_RATES = {"SOL": 150.0, "TON": 5.0, "BNB": 600.0, "ETH": 3000.0, "TRX": 0.2}
+# Префикс пути каждого провайдера на сервере-заглушке и переменная окружения бота с его адресом
+STUB_PROVIDERS = {
+    "SOL": ("/SOL", "SOL_API_URLS"),
+    "BSC": ("/BSC/api", "BSC_API_URLS"),
+    "Base": ("/Base/api", "BASE_API_URLS"),
+    "TRON": ("/TRON", "TRON_API_URLS"),
+    "TON": ("/TON", "TON_API_URLS"),
+    "CoinGecko": ("/CoinGecko", "COINGECKO_API_URL"),
+}
+# Параметры с ключами API не сохраняются в записях и не участвуют в поиске ответа
+SECRET_PARAMS = {"apikey", "api_key"}
+
+
+class Faults:
+    """
+    Поведение провайдера: задержка ответа (плюс равномерный jitter), доля медленных
+    ответов с задержкой slow_latency, доли ответов 429 (с Retry-After) и 5xx.
+    """
+
+    FIELDS = ("latency", "jitter", "slow_share", "slow_latency", "rate_limit", "retry_after", "errors")
+
+    def __init__(self, latency=0.0, jitter=0.0, slow_share=0.0, slow_latency=2.0, rate_limit=0.0, retry_after=1,
+                 errors=0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.slow_share = slow_share
+        self.slow_latency = slow_latency
+        self.rate_limit = rate_limit
+        self.retry_after = retry_after
+        self.errors = errors
+
+    def update(self, **values):
+        unknown = set(values) - set(self.FIELDS)
+        if unknown:
+            raise ValueError(f"Неизвестные параметры: {', '.join(sorted(unknown))}")
+        for name, value in values.items():
+            setattr(self, name, float(value))
+        return self
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.FIELDS}
+
+    def delay(self, rng):
+        if self.slow_share and rng.random() < self.slow_share:
+            return self.slow_latency
+        return self.latency + rng.uniform(0, self.jitter)
+
+    def failure(self, rng):
+        """
+        (статус, заголовки) ответа-ошибки или None.
+        """
+        roll = rng.random()
+        if roll < self.rate_limit:
+            return 429, {"Retry-After": str(int(self.retry_after))}
+        if roll < self.rate_limit + self.errors:
+            return rng.choice((500, 502, 503)), {}
+        return None
+
+
+def request_key(provider, method, path, params, payload=None):
+    params = {key: str(value) for key, value in params.items() if key not in SECRET_PARAMS}
+    return json.dumps([provider, method.upper(), path, params, payload], sort_keys=True)
+
+
+def load_recordings(path):
+    """
+    Записанные ответы: файл JSON Lines с полями provider, method, path, params, payload, status, body.
+    """
+    recordings = {}
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            if line.strip():
+                item = json.loads(line)
+                key = request_key(item["provider"], item["method"], item["path"], item["params"], item.get("payload"))
+                recordings[key] = (item["status"], item["body"])
+    return recordings
+
+
+class ExplorerStub:
+    """
+    HTTP-сервер, изображающий всех провайдеров сразу (пути из STUB_PROVIDERS).
+
+    Ответ на запрос берётся из записанных (replay), иначе с настоящего провайдера
+    с записью в файл (если задан upstream), иначе из синтетической истории
+    кошелька. Перед ответом выдерживается задержка и с заданной вероятностью
+    отдаётся 429 или 5xx (Faults — общие и по провайдерам). Управление на ходу:
+
+        GET  /_stats                   счётчики ответов по провайдерам и статусам
+        POST /_faults                  {"provider": "SOL", "latency": 0.2, "rate_limit": 0.1}
+        POST /_transfers               {"provider": "TON", "amount": 12.5, "token": false}
+    """
+
+    def __init__(self, history=1000, seed=0, faults=None, recordings=None, upstreams=None, record_to=None):
+        self.faults = faults or Faults()
+        self.provider_faults = {}
+        self.recordings = recordings or {}
+        self.upstreams = upstreams or {}
+        self.record_to = record_to
+        self.stats = Counter()
+        self.explorers = {
+            (blockchain, token): FakeExplorer(blockchain, synthetic_history(history, seed), token=token)
+            for blockchain in WALLETS
+            for token in ((False, True) if blockchain in TOKEN_CONTRACTS else (False,))
+        }
+        self._rng = random.Random(seed)
+        self._session = None
+
+    def app(self):
+        app = web.Application()
+        app.router.add_get("/_stats", self.handle_stats)
+        app.router.add_post("/_faults", self.handle_faults)
+        app.router.add_post("/_transfers", self.handle_transfers)
+        for provider, (prefix, _) in STUB_PROVIDERS.items():
+            app.router.add_route("*", prefix + "{path:.*}", functools.partial(self.handle, provider))
+        app.on_cleanup.append(self._close)
+        return app
+
+    @staticmethod
+    def environment(base_url):
+        """
+        Переменные окружения, направляющие бота на заглушку по адресу base_url.
+        """
+        return {variable: base_url.rstrip("/") + prefix for prefix, variable in STUB_PROVIDERS.values()}
+
+    def faults_for(self, provider):
+        return self.provider_faults.get(provider, self.faults)
+
+    async def handle(self, provider, request):
+        path = "/" + request.match_info["path"].lstrip("/") if request.match_info["path"] else ""
+        params = dict(request.query)
+        payload = await request.json() if request.can_read_body else None
+
+        faults = self.faults_for(provider)
+        delay = faults.delay(self._rng)
+        if delay:
+            await asyncio.sleep(delay)
+        failure = faults.failure(self._rng)
+        if failure is not None:
+            status, headers = failure
+            self.stats[(provider, status)] += 1
+            return web.json_response({"error": "injected"}, status=status, headers=headers)
+
+        key = request_key(provider, request.method, path, params, payload)
+        if key in self.recordings:
+            status, body = self.recordings[key]
+        elif provider in self.upstreams:
+            status, body = await self._record(provider, request.method, path, params, payload)
+        else:
+            status, body = 200, self.respond(provider, path, params, payload)
+        self.stats[(provider, status)] += 1
+        return web.json_response(body, status=status)
+
+    def respond(self, provider, path, params, payload=None):
+        if provider == "CoinGecko":
+            return {coin_id: {"usd": STUB_RATES[symbol]} for symbol, coin_id in COINGECKO_IDS.items()}
+        token = (params.get("action") == "tokentx") or "/token_trc20/" in path
+        return self.explorers[(provider, token)].respond(path, params, payload)
+
+    async def _record(self, provider, method, path, params, payload):
+        if self._session is None:
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=30))
+        async with self._session.request(method, self.upstreams[provider] + path, params=params,
+                                         json=payload) as response:
+            status, body = response.status, await response.json(content_type=None)
+        self.recordings[request_key(provider, method, path, params, payload)] = (status, body)
+        if self.record_to:
+            item = {
+                "provider": provider, "method": method.upper(), "path": path,
+                "params": {key: value for key, value in params.items() if key not in SECRET_PARAMS},
+                "payload": payload, "status": status, "body": body,
+            }
+            with open(self.record_to, "a", encoding="utf-8") as file:
+                file.write(json.dumps(item, ensure_ascii=False) + "\n")
+        return status, body
+
+    async def handle_stats(self, request):
+        stats = {}
+        for (provider, status), count in self.stats.items():
+            stats.setdefault(provider, {})[str(status)] = count
+        return web.json_response({
+            "responses": stats,
+            "faults": self.faults.as_dict(),
+            "provider_faults": {provider: faults.as_dict() for provider, faults in self.provider_faults.items()},
+        })
+
+    async def handle_faults(self, request):
+        values = await request.json()
+        provider = values.pop("provider", None)
+        try:
+            if provider is None:
+                self.faults.update(**values)
+            else:
+                faults = self.provider_faults.setdefault(provider, Faults(**self.faults.as_dict()))
+                faults.update(**values)
+        except ValueError as e:
+            return web.json_response({"error": str(e)}, status=400)
+        return await self.handle_stats(request)
+
+    async def handle_transfers(self, request):
+        values = await request.json()
+        explorer = self.explorers.get((values.get("provider"), bool(values.get("token"))))
+        if explorer is None:
+            return web.json_response({"error": "Неизвестный провайдер"}, status=400)
+        entry = explorer.add_transfer(float(values["amount"]), values.get("timestamp"))
+        return web.json_response({"tx_hash": entry.tx_hash, "wallet": explorer.wallet_address})
+
+    async def _close(self, app):
+        if self._session is not None:
+            await self._session.close()
+
+    async def start(self, host="127.0.0.1", port=0):
+        """
+        Запускает сервер в текущем event loop. Возвращает (runner, базовый адрес).
+        """
+        runner = web.AppRunner(self.app(), access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        host, port = runner.addresses[0][:2]
+        return runner, f"http://{host}:{port}"
+
+
+def _upstream(value):
+    provider, _, url = value.partition("=")
+    if provider not in STUB_PROVIDERS or not url:
+        raise argparse.ArgumentTypeError(f"Ожидается ПРОВАЙДЕР=URL, провайдеры: {', '.join(STUB_PROVIDERS)}")
+    return provider, url.rstrip("/")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--history", type=int, default=1000, help="записей в синтетической истории каждого кошелька")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--replay", help="файл записанных ответов (JSON Lines)")
+    parser.add_argument("--record", help="дописывать ответы настоящих провайдеров в этот файл")
+    parser.add_argument("--upstream", type=_upstream, action="append", default=[],
+                        help="ПРОВАЙДЕР=URL настоящего провайдера для записи, например TON=https://toncenter.com/api/v2")
+    for name in Faults.FIELDS:
+        parser.add_argument(f"--{name.replace('_', '-')}", type=float, default=getattr(Faults(), name))
+    args = parser.parse_args()
+
+    stub = ExplorerStub(
+        history=args.history,
+        seed=args.seed,
+        faults=Faults(**{name: getattr(args, name) for name in Faults.FIELDS}),
+        recordings=load_recordings(args.replay) if args.replay else None,
+        upstreams=dict(args.upstream),
+        record_to=args.record,
+    )
+    for variable, url in stub.environment(f"http://{args.host}:{args.port}").items():
+        print(f"{variable}={url}")
+    for blockchain in WALLETS:
+        # Имена как в ingestion.ingest_wallet
+        print(f"{blockchain}_WALLET_ADDRESS={WALLETS[blockchain]}")
+    web.run_app(stub.app(), host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
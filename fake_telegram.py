@@ -0,0 +1,178 @@
+"""
+Локальная замена Telegram для проверки режима webhook без сети.
+
+Сервер Bot API отвечает на вызовы бота правдоподобными объектами, а источник
+апдейтов шлёт на вебхук поток сообщений и нажатий кнопок от множества
+пользователей.
+
+    python fake_telegram.py api --port 8081
+    TELEGRAM_API_URL=http://127.0.0.1:8081 BOT_MODE=webhook WEBHOOK_WORKERS=4 python main.py
+    python fake_telegram.py updates --url http://127.0.0.1:8080/webhook --count 5000 --users 500
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import time
+from collections import Counter
+
+import aiohttp
+from aiohttp import web
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "Fake", "username": "fake_bot"}
+# Методы, которые возвращают Message
+MESSAGE_METHODS = {"sendmessage", "editmessagetext", "editmessagereplymarkup", "sendphoto", "senddocument"}
+
+# Сценарий пользователя: команды и кнопки в порядке обычного диалога
+SCENARIO = [
+    ("message", "/start"),
+    ("callback", "with_chat"),
+    ("callback", "with_chat_1m"),
+    ("callback", "pay_in_SOL"),
+    ("callback", "check_payment"),
+    ("message", "/referral"),
+    ("callback", "back_to_main"),
+]
+
+
+class FakeBotAPI:
+    """
+    Сервер Bot API: принимает любой метод и считает вызовы.
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = Counter()
+        self._message_ids = itertools.count(1)
+
+    def app(self):
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        app.router.add_get("/stats", self.stats)
+        return app
+
+    async def handle(self, request):
+        method = request.match_info["method"].lower()
+        self.calls[method] += 1
+        params = dict(await request.post())
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return web.json_response({"ok": True, "result": self._result(method, params)})
+
+    async def stats(self, request):
+        return web.json_response(dict(self.calls))
+
+    def _result(self, method, params):
+        if method == "getme":
+            return BOT_USER
+        if method in MESSAGE_METHODS:
+            chat_id = int(params.get("chat_id", 0) or 0)
+            return {
+                "message_id": next(self._message_ids),
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "text": params.get("text", ""),
+            }
+        if method == "createchatinvitelink":
+            return {
+                "invite_link": "https://t.me/+fake",
+                "creator": BOT_USER,
+                "creates_join_request": False,
+                "is_primary": False,
+                "is_revoked": False,
+            }
+        return True
+
+
+def make_update(update_id, user_id, kind, payload):
+    user = {"id": user_id, "is_bot": False, "first_name": f"user{user_id}", "username": f"user{user_id}"}
+    chat = {"id": user_id, "type": "private"}
+    message = {"message_id": update_id, "date": int(time.time()), "chat": chat, "from": user, "text": payload}
+    if kind == "message":
+        return {"update_id": update_id, "message": message}
+    return {
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id),
+            "from": user,
+            "chat_instance": str(user_id),
+            "data": payload,
+            "message": {**message, "from": BOT_USER, "text": "..."},
+        },
+    }
+
+
+def generate_updates(count, users, seed=0):
+    """
+    count апдейтов от users пользователей; каждый проходит SCENARIO по порядку.
+    """
+    rng = random.Random(seed)
+    steps = Counter()
+    for update_id in range(1, count + 1):
+        user_id = 100000 + rng.randrange(users)
+        kind, payload = SCENARIO[steps[user_id] % len(SCENARIO)]
+        steps[user_id] += 1
+        yield make_update(update_id, user_id, kind, payload)
+
+
+async def send_updates(url, count, users, concurrency, secret=None):
+    headers = {"Content-Type": "application/json"}
+    if secret:
+        headers["X-Telegram-Bot-Api-Secret-Token"] = secret
+    updates = generate_updates(count, users)
+    statuses = Counter()
+    latencies = []
+
+    async def sender(session):
+        for update in updates:
+            started = time.perf_counter()
+            try:
+                async with session.post(url, data=json.dumps(update), headers=headers) as response:
+                    statuses[response.status] += 1
+            except aiohttp.ClientError as e:
+                statuses[type(e).__name__] += 1
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    async with aiohttp.ClientSession() as session:
+        await asyncio.gather(*(sender(session) for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "updates": count,
+        "seconds": round(elapsed, 3),
+        "updates_per_second": round(count / elapsed, 1) if elapsed else None,
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 2) if latencies else None,
+        "p99_ms": round(latencies[int(len(latencies) * 0.99)] * 1000, 2) if latencies else None,
+        "statuses": {str(key): value for key, value in statuses.items()},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    api = commands.add_parser("api", help="фейковый сервер Bot API")
+    api.add_argument("--host", default="127.0.0.1")
+    api.add_argument("--port", type=int, default=8081)
+    api.add_argument("--latency", type=float, default=0.0, help="задержка ответа, секунды")
+
+    updates = commands.add_parser("updates", help="отправить апдейты на вебхук")
+    updates.add_argument("--url", default="http://127.0.0.1:8080/webhook")
+    updates.add_argument("--secret")
+    updates.add_argument("--count", type=int, default=1000)
+    updates.add_argument("--users", type=int, default=100)
+    updates.add_argument("--concurrency", type=int, default=50)
+
+    args = parser.parse_args()
+    if args.command == "api":
+        web.run_app(FakeBotAPI(args.latency).app(), host=args.host, port=args.port)
+    else:
+        result = asyncio.run(send_updates(args.url, args.count, args.users, args.concurrency, args.secret))
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
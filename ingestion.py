@@ -0,0 +1,43 @@
+import os
+import time
+
+from api_calls import BlockchainFactory
+from cache import SingleFlight
+from crud.ledger import get_cursor, save_transfers
+
+# Когда каждый кошелёк в последний раз синхронизировался (по time.monotonic())
+_last_ingested = {}
+# Одновременные синхронизации одного кошелька сводятся к одному запросу в сеть
+_ingest_flights = SingleFlight("ingest_wallet")
+
+
+async def ingest_wallet(session, blockchain, token_contract=None, max_age=0, since=None):
+    """
+    Загружает в журнал переводы кошелька, появившиеся после сохранённого курсора.
+
+    since — время самой ранней ожидающей оплаты на этот кошелёк: более старые
+    переводы ни к одной оплате не подходят, и история дальше не читается.
+    Если кошелёк синхронизировался не раньше чем max_age секунд назад, сеть не трогаем.
+    Возвращает только что записанные переводы.
+    """
+    wallet_address = os.environ.get(f"{blockchain}_WALLET_ADDRESS")
+    key = (blockchain, wallet_address, token_contract or "")
+    last = _last_ingested.get(key)
+    if max_age and last is not None and time.monotonic() - last < max_age:
+        return []
+
+    return await _ingest_flights.do(
+        key, lambda: _ingest(session, blockchain, wallet_address, token_contract, key, since)
+    )
+
+
+async def _ingest(session, blockchain, wallet_address, token_contract, key, since):
+    blockchain_api = BlockchainFactory.get_blockchain_api(blockchain)
+    cursor = await get_cursor(session, blockchain, wallet_address, token_contract)
+    # При ошибке сети курсор не сдвигается, и дельта будет запрошена повторно
+    transfers, new_cursor = await blockchain_api.fetch_transfers_since(
+        wallet_address, token_contract, cursor.cursor, since
+    )
+    saved = await save_transfers(session, cursor, transfers, new_cursor)
+    _last_ingested[key] = time.monotonic()
+    return saved
@@ -1,7 +1,12 @@
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 
+from constants import PERIOD_LABELS, TARIFF_PRICES
 
-def get_main_inline_keyboard():
+# Клавиатуры не меняются, поэтому собираются один раз при импорте.
+# Функции возвращают общие объекты — изменять их нельзя.
+
+
+def _build_main_inline_keyboard():
     builder = InlineKeyboardBuilder()
     builder.button(text="С возможностью писать", callback_data="with_chat")
     builder.button(text="Без возможности писать", callback_data="without_chat")
@@ -10,43 +15,25 @@ def get_main_inline_keyboard():
     return builder.as_markup()
 
 
-def get_with_chat_inline_keyboard():
-    """
-    Inline-клавиатура для выбора тарифа 'С чатом'.
-    """
+def _build_tariff_inline_keyboard(with_chat):
+    prefix = "with_chat" if with_chat else "without_chat"
     builder = InlineKeyboardBuilder()
-    builder.button(text="1M=50$", callback_data="with_chat_1m")
-    builder.button(text="3M=130$", callback_data="with_chat_3m")
-    builder.button(text="6M=250$", callback_data="with_chat_6m")
-    builder.button(text="1Y=490$", callback_data="with_chat_1y")
-    builder.button(text="Навсегда=1500$", callback_data="with_chat_lt")
+    for period, label in PERIOD_LABELS.items():
+        builder.button(text=f"{label}={TARIFF_PRICES[(with_chat, period)]:g}$", callback_data=f"{prefix}_{period}")
     builder.button(text="Назад", callback_data="back_to_main")
     builder.adjust(1)
     return builder.as_markup()
 
 
-def get_without_chat_inline_keyboard():
-    """
-    Inline-клавиатура для выбора тарифа 'Без чата'.
-    """
-    builder = InlineKeyboardBuilder()
-    builder.button(text="1M=25$", callback_data="without_chat_1m")
-    builder.button(text="3M=65$", callback_data="without_chat_3m")
-    builder.button(text="6M=125$", callback_data="without_chat_6m")
-    builder.button(text="1Y=245$", callback_data="without_chat_1y")
-    builder.button(text="Навсегда=750$", callback_data="without_chat_lt")
-    builder.button(text="Назад", callback_data="back_to_main")
-    builder.adjust(1)
-    return builder.as_markup()
-
-def get_check_payment_keyboard(cancel_button=False):
+def _build_check_payment_keyboard(cancel_button):
     builder = InlineKeyboardBuilder()
     builder.button(text="Проверить оплату", callback_data="check_payment")
     if cancel_button:
         builder.button(text="Отмена", callback_data="cancel_payment")
     return builder.as_markup()
 
-def get_currency_selection_keyboard():
+
+def _build_currency_selection_keyboard():
     builder = InlineKeyboardBuilder()
     builder.button(text="SOL", callback_data="pay_in_SOL")
     builder.button(text="BNB", callback_data="pay_in_BNB")
@@ -59,8 +46,44 @@ def get_currency_selection_keyboard():
     builder.adjust(2)
     return builder.as_markup()
 
-def get_back_to_main_menu_keyboard():
+
+def _build_back_to_main_menu_keyboard():
     builder = InlineKeyboardBuilder()
     builder.button(text="Назад", callback_data="back_to_main")
     return builder.as_markup()
 
+
+MAIN_INLINE_KEYBOARD = _build_main_inline_keyboard()
+WITH_CHAT_INLINE_KEYBOARD = _build_tariff_inline_keyboard(with_chat=True)
+WITHOUT_CHAT_INLINE_KEYBOARD = _build_tariff_inline_keyboard(with_chat=False)
+CHECK_PAYMENT_KEYBOARD = _build_check_payment_keyboard(cancel_button=False)
+CHECK_PAYMENT_WITH_CANCEL_KEYBOARD = _build_check_payment_keyboard(cancel_button=True)
+CURRENCY_SELECTION_KEYBOARD = _build_currency_selection_keyboard()
+BACK_TO_MAIN_MENU_KEYBOARD = _build_back_to_main_menu_keyboard()
+
+
+def get_main_inline_keyboard():
+    return MAIN_INLINE_KEYBOARD
+
+
+def get_with_chat_inline_keyboard():
+    """
+    Inline-клавиатура для выбора тарифа 'С чатом'.
+    """
+    return WITH_CHAT_INLINE_KEYBOARD
+
+
+def get_without_chat_inline_keyboard():
+    """
+    Inline-клавиатура для выбора тарифа 'Без чата'.
+    """
+    return WITHOUT_CHAT_INLINE_KEYBOARD
+
+def get_check_payment_keyboard(cancel_button=False):
+    return CHECK_PAYMENT_WITH_CANCEL_KEYBOARD if cancel_button else CHECK_PAYMENT_KEYBOARD
+
+def get_currency_selection_keyboard():
+    return CURRENCY_SELECTION_KEYBOARD
+
+def get_back_to_main_menu_keyboard():
+    return BACK_TO_MAIN_MENU_KEYBOARD
@@ -0,0 +1,106 @@
+import asyncio
+import logging
+import os
+import socket
+import uuid
+
+from sqlalchemy.exc import SQLAlchemyError
+
+from crud.leases import acquire_lease, release_lease
+
+logger = logging.getLogger(__name__)
+
+# Сколько секунд действует аренда без продления
+LEASE_TTL = 30
+
+
+class LeaderElection:
+    """
+    Выбор ведущего воркера через аренду в базе.
+
+    Каждый процесс раз в треть ttl пытается захватить или продлить аренду.
+    Ведущий запускает фоновые задачи (истечение транзакций, исключения из чата,
+    наблюдение за кошельками), а потеряв аренду — останавливает их. Если какая-то
+    задача завершилась, при следующем продлении задачи перезапускаются. Если ведущий
+    упал, аренда истекает через ttl и её забирает другой воркер.
+    """
+
+    def __init__(self, name="background", ttl=LEASE_TTL, holder=None):
+        self.name = name
+        self.ttl = ttl
+        self.holder = holder or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._tasks = []
+        self._election_task = None
+
+    @property
+    def is_leader(self):
+        return bool(self._tasks)
+
+    def start(self, session_maker, start_tasks):
+        """
+        start_tasks() вызывается при получении роли и возвращает список запущенных задач.
+        """
+        self._election_task = asyncio.create_task(self._run(session_maker, start_tasks))
+
+    async def stop(self):
+        """
+        Останавливает фоновые задачи и отдаёт аренду другому воркеру.
+        """
+        if self._election_task is not None:
+            self._election_task.cancel()
+            await asyncio.gather(self._election_task, return_exceptions=True)
+            self._election_task = None
+
+    async def _run(self, session_maker, start_tasks):
+        try:
+            while True:
+                try:
+                    async with session_maker() as session:
+                        leading = await acquire_lease(session, self.name, self.holder, self.ttl)
+                except SQLAlchemyError as e:
+                    # Не смогли продлить — считаем роль потерянной, чтобы не работать вдвоём
+                    logger.warning("Не удалось продлить аренду %s: %s", self.name, e)
+                    leading = False
+
+                if leading and self._tasks and self._report_finished():
+                    # Задачи запускаются вместе (планировщик загружает подписки), поэтому и перезапускаются вместе
+                    await self._stop_tasks()
+                    self._tasks = await start_tasks()
+                elif leading and not self._tasks:
+                    logger.info("Воркер %s стал ведущим", self.holder)
+                    self._tasks = await start_tasks()
+                elif not leading and self._tasks:
+                    logger.warning("Воркер %s потерял роль ведущего", self.holder)
+                    await self._stop_tasks()
+
+                await asyncio.sleep(self.ttl / 3)
+        finally:
+            await self._stop_tasks()
+            await self._release(session_maker)
+
+    def _report_finished(self):
+        """
+        Логирует завершившиеся фоновые задачи; True, если такие есть.
+        """
+        finished = [task for task in self._tasks if task.done()]
+        for task in finished:
+            if task.cancelled():
+                logger.error("Фоновая задача %s отменена, перезапускаем", task.get_name())
+            else:
+                logger.error("Фоновая задача %s завершилась, перезапускаем", task.get_name(),
+                             exc_info=task.exception())
+        return bool(finished)
+
+    async def _stop_tasks(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _release(self, session_maker):
+        # Освобождаем аренду сразу, чтобы другой воркер не ждал её истечения
+        try:
+            async with session_maker() as session:
+                await release_lease(session, self.name, self.holder)
+        except SQLAlchemyError as e:
+            logger.warning("Не удалось освободить аренду %s: %s", self.name, e)
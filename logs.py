@@ -0,0 +1,160 @@
+"""
+Неблокирующее логирование.
+
+Обработчики событий и фоновые задачи только кладут запись в очередь
+(QueueHandler); форматирование и запись в stdout делает отдельный поток
+(QueueListener), поэтому медленный вывод не задерживает event loop.
+
+Настройка через переменные окружения:
+  LOG_LEVEL   — общий уровень (по умолчанию INFO);
+  LOG_LEVELS  — уровни подсистем: "api_calls=DEBUG,aiogram.event=WARNING";
+  LOG_SAMPLE  — доля записей ниже WARNING, которые пишутся для шумных логгеров:
+                "sqlalchemy.engine=0.01" (по умолчанию так и есть);
+  LOG_FORMAT  — text (по умолчанию) или json, по строке JSON на запись;
+  SQL_ECHO    — включить журнал SQL-запросов (с учётом LOG_SAMPLE).
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+from datetime import datetime, timezone
+
+from metrics import Counter
+
+TEXT_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+DEFAULT_SAMPLE = "sqlalchemy.engine=0.01"
+
+log_records_sampled_out = Counter("log_records_sampled_out_total", "Записи лога, отброшенные выборкой",
+                                  ("logger",))
+
+# Атрибуты LogRecord; всё остальное в записи — поля из extra=
+_RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+_listener = None
+
+
+def _parse_pairs(value):
+    """
+    "a=1,b.c=2" -> {"a": "1", "b.c": "2"}.
+    """
+    pairs = {}
+    for item in (value or "").split(","):
+        name, separator, setting = item.partition("=")
+        if separator and name.strip():
+            pairs[name.strip()] = setting.strip()
+    return pairs
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Пропускает долю rate записей ниже WARNING от логгера prefix и его потомков.
+    Предупреждения и ошибки не отбрасываются никогда.
+    """
+
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = rates
+        self._by_logger = {}  # имя логгера -> доля или None; логгеров немного
+
+    def _rate(self, name):
+        prefix = name
+        while prefix and prefix not in self.rates:
+            prefix = prefix.rpartition(".")[0]
+        return self.rates.get(prefix)
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        try:
+            rate = self._by_logger[record.name]
+        except KeyError:
+            rate = self._by_logger[record.name] = self._rate(record.name)
+        if rate is None or random.random() < rate:
+            return True
+        log_records_sampled_out.inc(record.name)
+        return False
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Строка JSON на запись: время, уровень, логгер, сообщение и поля из extra=.
+    """
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "process": record.process,
+            "message": record.getMessage(),
+        }
+        entry.update((key, value) for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES)
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record):
+        # В потоке вызывающего только подставляем аргументы и превращаем исключение в текст,
+        # чтобы запись не держала ссылки на изменяемые объекты. Остальное — в потоке записи.
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def setup_logging(stream=None):
+    """
+    Настраивает корневой логгер на запись через очередь и фоновый поток.
+    Повторный вызов в том же процессе ничего не меняет.
+    """
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    levels = {"sqlalchemy.engine": "INFO"} if os.getenv("SQL_ECHO", "").lower() in ("1", "true", "yes") else {}
+    levels.update(_parse_pairs(os.getenv("LOG_LEVELS")))
+    rates = {name: float(rate) for name, rate in _parse_pairs(os.getenv("LOG_SAMPLE", DEFAULT_SAMPLE)).items()}
+
+    output = logging.StreamHandler(stream or sys.stdout)
+    if os.getenv("LOG_FORMAT", "text").lower() == "json":
+        output.setFormatter(JsonFormatter())
+    else:
+        output.setFormatter(logging.Formatter(TEXT_FORMAT))
+
+    records = queue.SimpleQueue()
+    handler = _QueueHandler(records)
+    handler.addFilter(SamplingFilter(rates))
+
+    root = logging.getLogger()
+    for existing in root.handlers[:]:
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+    for name, level in levels.items():
+        logging.getLogger(name).setLevel(level.upper())
+
+    _listener = logging.handlers.QueueListener(records, output, respect_handler_level=True)
+    _listener.start()
+    # Дописываем очередь при выходе
+    atexit.register(stop_logging)
+    return _listener
+
+
+def stop_logging():
+    """
+    Дописывает накопленные записи и останавливает поток записи.
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
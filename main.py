@@ -1,43 +1,123 @@
 import asyncio
-import logging
-import sys
 
 from aiogram import Bot, Dispatcher, html
 from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.enums import ParseMode
 from dotenv import load_dotenv
 import os
 
-from async_tasks import check_expired_subscriptions, monitor_transactions
-from database import init_db
+from database import close_db, init_db
+from logs import setup_logging
 
 load_dotenv()
 
 # Bot token can be obtained via https://t.me/BotFather
 TOKEN = os.getenv('BOT_TOKEN')
+# Сколько апдейтов обрабатывается одновременно (апдейты одного пользователя — по очереди)
+MAX_CONCURRENT_UPDATES = int(os.getenv('MAX_CONCURRENT_UPDATES', 100))
+# Порт HTTP-сервера с /metrics (Prometheus); без него сервер не запускается
+METRICS_PORT = int(os.getenv('METRICS_PORT')) if os.getenv('METRICS_PORT') else None
+# Свой адрес Bot API (локальный сервер или fake_telegram.py для нагрузочных прогонов)
+TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL')
 
-Session = init_db()
-session = Session()
-bot = Bot(token=TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
+bot = Bot(
+    token=TOKEN,
+    session=AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL)) if TELEGRAM_API_URL else None,
+    default=DefaultBotProperties(parse_mode=ParseMode.HTML),
+)
 dp = Dispatcher()
 
 
+async def start_background_tasks(session_maker, workers=1):
+    """
+    Фоновые задачи, которые должны работать ровно в одном процессе (на ведущем воркере).
+    """
+    from async_tasks import monitor_transactions, watch_payments
+    from scheduler import subscription_scheduler
 
-async def main():
-    # Инициализация
+    # Планируем напоминания и исключения по всем подпискам
+    async with session_maker() as session:
+        await subscription_scheduler.load(session)
+
+    tasks = [
+        asyncio.create_task(subscription_scheduler.run(session_maker), name="subscription_scheduler"),
+        asyncio.create_task(monitor_transactions(session_maker, bot), name="monitor_transactions"),
+        asyncio.create_task(watch_payments(session_maker, bot), name="watch_payments"),
+    ]
+    if workers > 1:
+        # Подписки, созданные другими воркерами; в одном процессе планировщик узнаёт о них сразу
+        tasks.append(asyncio.create_task(subscription_scheduler.resync(session_maker), name="subscription_resync"))
+    return tasks
+
+
+async def setup(metrics_port=METRICS_PORT, workers=1):
+    """
+    Общая инициализация процесса для polling и webhook. Возвращает фабрику сессий.
+    workers — сколько процессов обслуживают бота (пересинхронизация подписок нужна только при нескольких).
+    """
     from callbacks import router
     from routers import payments_router
-    init_db()
+    from api_calls import BlockchainFactory
+    from rates import rate_service
+    from amount_slots import amount_allocator
+    from claimed_hashes import claimed_hashes
+    from crud.transactions import get_claimed_hashes, get_pending_transactions
+    from middlewares import DbSessionMiddleware, MetricsMiddleware, UserSerializationMiddleware
+    from metrics import Gauge, start_metrics_server
+    from outbox import outbox
+    from leader import LeaderElection
+    session_maker = await init_db()
+    # Восстанавливаем индекс выданных сумм по ожидающим оплатам и индекс засчитанных переводов
+    async with session_maker() as session:
+        amount_allocator.warm(await get_pending_transactions(session))
+        claimed_hashes.warm(await get_claimed_hashes(session))
+    dp.update.outer_middleware(MetricsMiddleware())
+    # Апдейты одного пользователя — по очереди, разных пользователей — параллельно
+    serialization = UserSerializationMiddleware(MAX_CONCURRENT_UPDATES)
+    dp.update.outer_middleware(serialization)
+    Gauge("bot_active_users", "Пользователи с апдейтами в обработке или в очереди",
+          collect=lambda: {(): serialization.active_users()})
+    # Каждый апдейт получает собственную сессию БД
+    dp.update.outer_middleware(DbSessionMiddleware(session_maker))
     dp.include_routers(router, payments_router)
 
-    # Запуск проверки подписок
-    asyncio.create_task(check_expired_subscriptions(session, bot))
-    asyncio.create_task(monitor_transactions(session, bot))
+    # Фоновые задачи запускает только тот процесс, который держит аренду в базе
+    election = LeaderElection()
+
+    # Сначала останавливаем фоновые задачи, чтобы их сообщения успели уйти из очереди,
+    # затем закрываем пулы соединений к обозревателям и к базе
+    dp.shutdown.register(election.stop)
+    dp.shutdown.register(BlockchainFactory.close_all)
+    dp.shutdown.register(rate_service.close)
+    dp.shutdown.register(outbox.stop)
+    dp.shutdown.register(close_db)
+
+    # Очередь исходящих сообщений с учётом лимитов Telegram
+    outbox.start(bot)
 
+    if metrics_port is not None:
+        metrics_runner = await start_metrics_server(metrics_port)
+        dp.shutdown.register(metrics_runner.cleanup)
+
+    election.start(session_maker, lambda: start_background_tasks(session_maker, workers))
+    # Фоновое обновление курсов валют (нужно каждому процессу)
+    asyncio.create_task(rate_service.run())
+    return session_maker
+
+
+async def main():
+    await setup()
     # Запуск бота
     await dp.start_polling(bot)
 
 
 if __name__ == "__main__":
-    logging.basicConfig(level=logging.INFO, stream=sys.stdout)
-    asyncio.run(main())
+    setup_logging()
+    if os.getenv("BOT_MODE") == "webhook":
+        from webhook import run_webhook
+
+        run_webhook()
+    else:
+        asyncio.run(main())
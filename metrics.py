@@ -0,0 +1,196 @@
+import bisect
+import logging
+import time
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограмм задержек, секунды
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [*zip(names, values), *extra]
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        REGISTRY.append(self)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return lines
+
+    def _samples(self):
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    """
+    Монотонный счётчик; значения хранятся по кортежу значений меток.
+    """
+    kind = "counter"
+
+    def __init__(self, name, documentation, labels=()):
+        super().__init__(name, documentation, labels)
+        self._values = {}
+
+    def inc(self, *label_values, amount=1):
+        self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values):
+        return self._values.get(label_values, 0)
+
+    def _samples(self):
+        for label_values, value in self._values.items():
+            yield f"{self.name}{_format_labels(self.labels, label_values)} {value}"
+
+
+class Gauge(Metric):
+    """
+    Текущее значение. Если задана collect, значения берутся из неё в момент выдачи:
+    collect() возвращает {кортеж значений меток: значение}.
+    """
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labels=(), collect=None):
+        super().__init__(name, documentation, labels)
+        self.collect = collect
+        self._values = {}
+
+    def set(self, value, *label_values):
+        self._values[label_values] = value
+
+    def inc(self, *label_values, amount=1):
+        self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def dec(self, *label_values, amount=1):
+        self.inc(*label_values, amount=-amount)
+
+    def _samples(self):
+        values = self._values
+        if self.collect is not None:
+            try:
+                values = self.collect()
+            except Exception:
+                logger.exception("Не удалось собрать метрику %s", self.name)
+                return
+        for label_values, value in values.items():
+            yield f"{self.name}{_format_labels(self.labels, label_values)} {value}"
+
+
+class Histogram(Metric):
+    """
+    Гистограмма с фиксированными корзинами: observe стоит один bisect и пару сложений.
+    """
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+        self._series = {}  # значения меток -> [счётчики корзин..., +Inf], сумма
+
+    def observe(self, value, *label_values):
+        series = self._series.get(label_values)
+        if series is None:
+            series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def time(self, *label_values):
+        return _Timer(self, label_values)
+
+    def count(self, *label_values):
+        series = self._series.get(label_values)
+        return sum(series[0]) if series else 0
+
+    def _samples(self):
+        for label_values, (counts, total) in self._series.items():
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += count
+                labels = _format_labels(self.labels, label_values, (("le", bound),))
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.labels, label_values)
+            yield f"{self.name}_sum{labels} {total}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+class _Timer:
+    def __init__(self, histogram, label_values):
+        self.histogram = histogram
+        self.label_values = label_values
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, *self.label_values)
+
+
+REGISTRY = []
+
+
+def render():
+    """
+    Все метрики в текстовом формате Prometheus.
+    """
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+async def _metrics_handler(request):
+    return web.Response(text=render(), content_type="text/plain", charset="utf-8", headers={"Cache-Control": "no-cache"})
+
+
+async def start_metrics_server(port, host="0.0.0.0"):
+    """
+    HTTP-сервер с GET /metrics. Возвращает runner для остановки (runner.cleanup()).
+    """
+    app = web.Application()
+    app.router.add_get("/metrics", _metrics_handler)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info("Метрики доступны на http://%s:%s/metrics", host, port)
+    return runner
+
+
+# Обработка апдейтов
+updates_in_progress = Gauge("bot_updates_in_progress", "Апдейты в обработке")
+update_seconds = Histogram(
+    "bot_update_duration_seconds", "Время обработки апдейта", ("event", "status")
+)
+
+# Запросы к провайдерам блокчейнов и курсов
+chain_request_seconds = Histogram(
+    "chain_request_duration_seconds", "Время одного HTTP-запроса к провайдеру", ("provider", "status")
+)
+chain_request_errors = Counter(
+    "chain_request_errors_total", "Ошибки запросов к провайдерам по типу", ("provider", "error")
+)
+
+# База данных
+db_query_seconds = Histogram("db_query_duration_seconds", "Время SQL-запроса", ("operation", "table"))
+db_query_errors = Counter("db_query_errors_total", "Ошибки SQL-запросов", ("operation", "table"))
+
+# Платежи
+transactions_expired = Counter("transactions_expired_total", "Транзакции, закрытые по истечении срока")
+transactions_paid = Counter("transactions_paid_total", "Подтверждённые оплаты", ("source",))
+pending_transactions = Gauge(
+    "transactions_pending", "Ожидающие оплаты транзакции с выбранной валютой (по последнему проходу наблюдателя)"
+)
@@ -0,0 +1,103 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from metrics import update_seconds, updates_in_progress
+
+
+class DbSessionMiddleware(BaseMiddleware):
+    """
+    Открывает отдельную короткую сессию БД на каждый апдейт и передаёт её
+    обработчику аргументом session. Сессия закрывается после обработки.
+    """
+
+    def __init__(self, session_maker: async_sessionmaker):
+        self.session_maker = session_maker
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+            event: TelegramObject,
+            data: Dict[str, Any],
+    ) -> Any:
+        async with self.session_maker() as session:
+            data["session"] = session
+            return await handler(event, data)
+
+
+class UserSerializationMiddleware(BaseMiddleware):
+    """
+    Обрабатывает апдейты одного пользователя строго по очереди, разных — параллельно.
+
+    Обработчики оплаты читают и меняют ожидающую транзакцию пользователя, поэтому
+    два одновременных нажатия не должны выполняться вперемешку. Всего одновременно
+    обрабатывается не больше max_concurrency апдейтов; блокировка пользователя
+    удаляется, как только его апдейты закончились.
+    Регистрируется до DbSessionMiddleware, чтобы ожидающий апдейт не держал соединение с БД.
+    """
+
+    def __init__(self, max_concurrency: int = 100):
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._locks: Dict[int, list] = {}  # telegram_id -> [блокировка, сколько апдейтов её ждёт или держит]
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+            event: TelegramObject,
+            data: Dict[str, Any],
+    ) -> Any:
+        user = data.get("event_from_user")
+        if user is None:
+            async with self._semaphore:
+                return await handler(event, data)
+
+        entry = self._locks.get(user.id)
+        if entry is None:
+            entry = self._locks[user.id] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            # Сначала очередь пользователя, потом общий лимит: ожидающие не занимают слоты
+            async with entry[0], self._semaphore:
+                return await handler(event, data)
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._locks[user.id]
+
+    def active_users(self) -> int:
+        """
+        Пользователи, чьи апдейты сейчас обрабатываются или ждут очереди.
+        """
+        return len(self._locks)
+
+
+class MetricsMiddleware(BaseMiddleware):
+    """
+    Время обработки каждого апдейта по типу события и исходу, число апдейтов в работе.
+    Регистрируется первым, поэтому учитывает и ожидание в очереди пользователя.
+    """
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+            event: TelegramObject,
+            data: Dict[str, Any],
+    ) -> Any:
+        try:
+            event_type = event.event_type
+        except (AttributeError, LookupError):
+            event_type = "unknown"
+        status = "error"
+        updates_in_progress.inc()
+        started = time.perf_counter()
+        try:
+            result = await handler(event, data)
+            status = "ok"
+            return result
+        finally:
+            updates_in_progress.dec()
+            update_seconds.observe(time.perf_counter() - started, event_type, status)
@@ -0,0 +1,161 @@
+"""
+Встроенные версионные миграции схемы.
+
+create_all создаёт только недостающие таблицы, поэтому новые индексы и прочие
+изменения уже существующих таблиц применяются здесь, при старте бота. Номер
+последней применённой миграции хранится в таблице schema_version.
+"""
+import asyncio
+import logging
+import sys
+from datetime import datetime, timedelta
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, func, insert, inspect, select, text
+
+from constants import PAYMENT_TOLERANCE
+from crud.ledger import payment_transfer_query
+from crud.subscriptions import subscription_query, subscriptions_changed_since_query, subscriptions_query
+from crud.transactions import (
+    expire_stale_transactions_query,
+    pending_amounts_query,
+    pending_transactions_query,
+    transaction_by_telegram_id_query,
+)
+from database import LedgerTransfer, Subscription, Transaction
+
+logger = logging.getLogger(__name__)
+
+schema_version = Table(
+    "schema_version",
+    MetaData(),
+    Column("version", Integer, primary_key=True),
+    Column("description", String, nullable=False),
+    Column("applied_at", DateTime, default=datetime.utcnow),
+)
+
+
+def _create_indexes(connection, table, *names):
+    # Индексы перечисляются по именам: миграция не должна создавать индексы, добавленные в модель позже
+    for index in table.indexes:
+        if index.name in names:
+            index.create(connection, checkfirst=True)
+
+
+def _hot_path_indexes(connection):
+    _create_indexes(connection, Transaction.__table__,
+                    "ix_transactions_initiator_status", "ix_transactions_status_created_at")
+    _create_indexes(connection, Subscription.__table__, "ix_subscriptions_expiration_date")
+    _create_indexes(connection, LedgerTransfer.__table__, "ix_ledger_transfers_lookup")
+
+
+def _subscription_updated_at(connection):
+    # В новой базе колонку уже создал create_all
+    if "updated_at" not in {column["name"] for column in inspect(connection).get_columns("subscriptions")}:
+        connection.execute(text("ALTER TABLE subscriptions ADD COLUMN updated_at TIMESTAMP"))
+    _create_indexes(connection, Subscription.__table__, "ix_subscriptions_updated_at")
+
+
+def _drop_subscription_user_index(connection):
+    # Подписка ищется только по user_id, а его уже покрывает уникальный индекс
+    connection.execute(text("DROP INDEX IF EXISTS ix_subscriptions_user_id_expiration_date"))
+
+
+def _unique_pending_amounts(connection):
+    # Раньше одну сумму могли выдать два воркера: оставляем самую раннюю оплату, остальные отменяем
+    result = connection.execute(text("""
+        UPDATE transactions SET status = 'Expired'
+        WHERE status = 'Pending' AND blockchain != '' AND EXISTS (
+            SELECT 1 FROM transactions AS other
+            WHERE other.status = 'Pending' AND other.blockchain = transactions.blockchain
+              AND other.currency = transactions.currency AND other.expected_amount = transactions.expected_amount
+              AND (other.created_at < transactions.created_at
+                   OR (other.created_at = transactions.created_at AND other.id < transactions.id))
+        )
+    """))
+    if result.rowcount:
+        logger.warning("Отменено ожидающих оплат с повторяющейся суммой: %s", result.rowcount)
+    _create_indexes(connection, Transaction.__table__, "ix_transactions_pending_amount")
+
+
+# (версия, описание, функция применения). Новые миграции добавляются только в конец.
+MIGRATIONS = [
+    (1, "Составные индексы для горячих запросов", _hot_path_indexes),
+    (2, "Время изменения подписки для пересинхронизации планировщика", _subscription_updated_at),
+    (3, "Удалён индекс подписок, дублирующий уникальный индекс user_id", _drop_subscription_user_index),
+    (4, "Уникальность суммы среди ожидающих оплат пары", _unique_pending_amounts),
+]
+
+
+def run_migrations(connection):
+    """
+    Применяет ещё не применённые миграции. Вызывается через AsyncConnection.run_sync.
+    """
+    schema_version.create(connection, checkfirst=True)
+    current = connection.execute(select(func.max(schema_version.c.version))).scalar() or 0
+
+    for version, description, upgrade in MIGRATIONS:
+        if version <= current:
+            continue
+        upgrade(connection)
+        connection.execute(insert(schema_version).values(
+            version=version, description=description, applied_at=datetime.utcnow()
+        ))
+        logger.info("Применена миграция %s: %s", version, description)
+
+
+def hot_queries():
+    """
+    Запросы горячих путей, которые обязаны идти по индексу, — те же выражения, что выполняют функции crud.
+    """
+    now = datetime.utcnow()
+    return {
+        "get_transaction_by_telegram_id": transaction_by_telegram_id_query(1),
+        "expire_stale_transactions": expire_stale_transactions_query(now - timedelta(minutes=15)),
+        "get_pending_transactions": pending_transactions_query(),
+        "get_pending_transactions(pair)": pending_transactions_query("SOL", "SOL"),
+        "get_pending_amounts": pending_amounts_query("SOL", "SOL", 0.998, 1.002),
+        "get_subscriptions": subscriptions_query(),
+        "get_subscriptions_changed_since": subscriptions_changed_since_query(now - timedelta(minutes=1)),
+        # is_user_muted при промахе кэша читает подписку через get_subscription
+        "get_subscription": subscription_query(1),
+        "find_payment_transfer": payment_transfer_query("SOL", None, 1.0, now - timedelta(minutes=15),
+                                                        PAYMENT_TOLERANCE),
+    }
+
+
+def find_full_scans(connection):
+    """
+    Прогоняет EXPLAIN QUERY PLAN (SQLite) для горячих запросов и возвращает
+    {имя запроса: строки плана}, где таблица читается целиком без индекса.
+    """
+    full_scans = {}
+    for name, query in hot_queries().items():
+        sql = str(query.compile(connection, compile_kwargs={"literal_binds": True}))
+        plan = [row[-1] for row in connection.execute(text(f"EXPLAIN QUERY PLAN {sql}"))]
+        scans = [line for line in plan if line.startswith("SCAN") and "INDEX" not in line]
+        if scans:
+            full_scans[name] = scans
+    return full_scans
+
+
+async def _check_query_plans(db_path):
+    from database import close_db, init_db
+
+    session_maker = await init_db(db_path)
+    engine = session_maker.kw["bind"]
+    full_scans = {}
+    # EXPLAIN QUERY PLAN есть только в SQLite; на других СУБД только применяются миграции
+    if engine.dialect.name == "sqlite":
+        async with engine.connect() as conn:
+            full_scans = await conn.run_sync(find_full_scans)
+    await close_db(db_path)
+    for name, scans in full_scans.items():
+        print(f"{name}: полный просмотр таблицы — {'; '.join(scans)}")
+    return not full_scans
+
+
+if __name__ == "__main__":
+    # python migrations.py [DSN] — применяет миграции и проверяет планы горячих запросов
+    # (DSN по умолчанию — DATABASE_URL)
+    ok = asyncio.run(_check_query_plans(sys.argv[1] if len(sys.argv) > 1 else None))
+    sys.exit(0 if ok else 1)
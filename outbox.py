@@ -0,0 +1,201 @@
+import asyncio
+import itertools
+import logging
+import random
+import time
+
+from aiogram.exceptions import (
+    TelegramBadRequest,
+    TelegramForbiddenError,
+    TelegramNetworkError,
+    TelegramRetryAfter,
+    TelegramServerError,
+)
+from aiogram.methods import BanChatMember, SendMessage
+
+from metrics import Counter, Gauge
+
+logger = logging.getLogger(__name__)
+
+# Приоритеты: меньше — раньше
+PRIORITY_HIGH = 0  # Подтверждения оплаты
+PRIORITY_NORMAL = 5  # Уведомления об отмене, бонусы, исключения из чата
+PRIORITY_LOW = 10  # Массовые напоминания
+
+# Лимиты Telegram: около 30 сообщений в секунду на бота и 1 в секунду в один чат
+GLOBAL_RATE = 25
+PER_CHAT_RATE = 1
+# Сколько раз повторять вызов при сетевых ошибках и ошибках сервера
+MAX_RETRIES = 5
+
+outbox_sent = Counter("outbox_calls_total", "Вызовы Telegram API из очереди по методу и исходу", ("method", "status"))
+
+
+class TokenBucket:
+    """
+    Корзина токенов: rate токенов в секунду, не больше capacity про запас.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def try_acquire(self):
+        """
+        Берёт токен и возвращает 0, либо возвращает, сколько секунд ждать до следующего.
+        """
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    def is_full(self):
+        self._refill()
+        return self.tokens >= self.capacity
+
+
+class Outbox:
+    """
+    Очередь исходящих вызовов Telegram API.
+
+    Фоновые задачи только кладут сюда сообщения и идут дальше, а воркеры
+    отправляют их по приоритету, соблюдая общий лимит бота и лимит на чат,
+    выжидая TelegramRetryAfter и повторяя временные ошибки с backoff.
+    """
+
+    def __init__(self, global_rate=GLOBAL_RATE, per_chat_rate=PER_CHAT_RATE, workers=4, max_retries=MAX_RETRIES):
+        self.per_chat_rate = per_chat_rate
+        self.workers = workers
+        self.max_retries = max_retries
+        self._global_bucket = TokenBucket(global_rate)
+        self._chat_buckets = {}
+        self._queue = asyncio.PriorityQueue()
+        self._counter = itertools.count()  # сохраняет порядок внутри одного приоритета
+        self._paused_until = 0.0
+        self._pending = 0  # Поставлено в очередь и ещё не отправлено (включая отложенные)
+        self._drained = asyncio.Event()
+        self._drained.set()
+        self._tasks = []
+        self._bot = None
+
+    def qsize(self):
+        return self._pending
+
+    def enqueue(self, method, chat_id=None, priority=PRIORITY_NORMAL):
+        """
+        Ставит вызов (TelegramMethod) в очередь, не дожидаясь отправки.
+        """
+        self._pending += 1
+        self._drained.clear()
+        self._put(priority, next(self._counter), (method, chat_id, 0))
+
+    def send_message(self, chat_id, text, priority=PRIORITY_NORMAL, **kwargs):
+        self.enqueue(SendMessage(chat_id=chat_id, text=text, **kwargs), chat_id, priority)
+
+    def ban_chat_member(self, chat_id, user_id, priority=PRIORITY_NORMAL):
+        self.enqueue(BanChatMember(chat_id=chat_id, user_id=user_id), chat_id, priority)
+
+    def _put(self, priority, seq, item):
+        self._queue.put_nowait((priority, seq, item))
+
+    def _put_later(self, delay, priority, seq, item):
+        # Отложенный вызов возвращается со своим порядковым номером и не обгоняет более ранние
+        asyncio.get_running_loop().call_later(delay, self._put, priority, seq, item)
+
+    def _chat_bucket(self, chat_id):
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            # Корзины простаивающих чатов полны и ничего не ограничивают — выбрасываем их
+            if len(self._chat_buckets) > 10000:
+                self._chat_buckets = {key: b for key, b in self._chat_buckets.items() if not b.is_full()}
+            bucket = self._chat_buckets[chat_id] = TokenBucket(self.per_chat_rate)
+        return bucket
+
+    def start(self, bot):
+        self._bot = bot
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self, timeout=5):
+        """
+        Даёт очереди до timeout секунд на отправку остатка и останавливает воркеров.
+        """
+        try:
+            await asyncio.wait_for(self._drained.wait(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Очередь сообщений остановлена, не отправлено: %s", self._pending)
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+    async def _worker(self):
+        while True:
+            priority, seq, item = await self._queue.get()
+            try:
+                done = await self._process(priority, seq, item)
+            except Exception:
+                logger.exception("Ошибка в очереди исходящих сообщений")
+                done = True
+            if done:
+                self._pending -= 1
+                if not self._pending:
+                    self._drained.set()
+
+    async def _process(self, priority, seq, item):
+        """
+        Возвращает False, если вызов отложен и вернётся в очередь позже.
+        """
+        method, chat_id, attempt = item
+
+        # Пауза после RetryAfter действует на всего бота
+        pause = self._paused_until - time.monotonic()
+        if pause > 0:
+            await asyncio.sleep(pause)
+
+        # Чат ещё не готов — откладываем только это сообщение, воркер берёт следующее
+        if chat_id is not None:
+            wait = self._chat_bucket(chat_id).try_acquire()
+            if wait:
+                self._put_later(wait, priority, seq, item)
+                return False
+
+        wait = self._global_bucket.try_acquire()
+        while wait:
+            await asyncio.sleep(wait)
+            wait = self._global_bucket.try_acquire()
+
+        method_name = type(method).__name__
+        try:
+            await self._bot(method)
+        except TelegramRetryAfter as e:
+            outbox_sent.inc(method_name, "retry_after")
+            self._paused_until = max(self._paused_until, time.monotonic() + e.retry_after)
+            self._put_later(e.retry_after, priority, seq, item)
+            return False
+        except (TelegramNetworkError, TelegramServerError) as e:
+            outbox_sent.inc(method_name, "error")
+            if attempt >= self.max_retries:
+                logger.warning("Не удалось выполнить %s для %s: %s", method_name, chat_id, e)
+                return True
+            delay = min(60, 2 ** attempt) * (1 + random.random() / 2)
+            self._put_later(delay, priority, seq, (method, chat_id, attempt + 1))
+            return False
+        except (TelegramForbiddenError, TelegramBadRequest) as e:
+            # Пользователь заблокировал бота, чат не найден и т.п. — повтор не поможет
+            outbox_sent.inc(method_name, "rejected")
+            logger.info("Telegram отклонил %s для %s: %s", method_name, chat_id, e)
+            return True
+        outbox_sent.inc(method_name, "ok")
+        return True
+
+
+outbox = Outbox()
+
+Gauge("outbox_queue_depth", "Вызовы в очереди, включая отложенные", collect=lambda: {(): outbox.qsize()})
@@ -0,0 +1,129 @@
+import asyncio
+import logging
+import os
+import time
+
+import aiohttp
+from dotenv import load_dotenv
+
+from metrics import chain_request_errors, chain_request_seconds
+from resilience import ExplorerError, ProviderUnavailableError, call_with_breaker, get_breaker
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Идентификаторы монет в CoinGecko
+COINGECKO_IDS = {
+    "SOL": "solana",
+    "TON": "the-open-network",
+    "BNB": "binancecoin",
+    "ETH": "ethereum",
+    "TRX": "tron",
+}
+
+
+class RateService:
+    """
+    Кэш курсов валют к USD.
+
+    Все курсы запрашиваются одним вызовом CoinGecko simple/price и обновляются
+    в фоне. Обработчики читают значения из памяти: в пределах ttl курс свежий,
+    ещё stale_grace секунд отдаётся устаревший курс с фоновым обновлением,
+    после этого курс считается недоступным.
+    """
+
+    def __init__(self, ttl=60, stale_grace=300, api_url="https://api.coingecko.com/api/v3", timeout=10):
+        self.ttl = ttl
+        self.stale_grace = stale_grace
+        self.api_url = api_url
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.breaker = get_breaker("CoinGecko")
+        self._rates = {}  # symbol -> (курс, время обновления по time.monotonic())
+        self._refresh_task = None
+        self._session = None
+
+    def get_rate(self, symbol):
+        """
+        Возвращает курс из кэша без обращения к сети или -1, если курса нет.
+        """
+        cached = self._rates.get(symbol)
+        if cached is None:
+            self._schedule_refresh()
+            return -1
+
+        rate, updated_at = cached
+        age = time.monotonic() - updated_at
+        if age > self.ttl:
+            self._schedule_refresh()
+        if age > self.ttl + self.stale_grace:
+            return -1
+        return rate
+
+    def _schedule_refresh(self):
+        if self._refresh_task is not None and not self._refresh_task.done():
+            return
+        try:
+            self._refresh_task = asyncio.get_running_loop().create_task(self.refresh())
+        except RuntimeError:
+            # Вне event loop обновлять нечем, курс подтянет фоновая задача
+            pass
+
+    def _get_session(self):
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(timeout=self.timeout)
+        return self._session
+
+    async def refresh(self):
+        """
+        Обновляет все курсы одним запросом.
+        """
+        params = {"ids": ",".join(COINGECKO_IDS.values()), "vs_currencies": "usd"}
+
+        async def fetch():
+            started = time.perf_counter()
+            try:
+                async with self._get_session().get(f"{self.api_url}/simple/price", params=params) as response:
+                    response.raise_for_status()
+                    data = await response.json(content_type=None)
+            except Exception as e:
+                chain_request_seconds.observe(time.perf_counter() - started, self.breaker.name, "error")
+                chain_request_errors.inc(self.breaker.name, type(e).__name__)
+                raise
+            chain_request_seconds.observe(time.perf_counter() - started, self.breaker.name, "ok")
+            return data
+
+        try:
+            # Без повторов: фоновый цикл и так перезапросит курс
+            data = await call_with_breaker(self.breaker, fetch, max_retries=0)
+        except ProviderUnavailableError:
+            # Автомат разомкнут (например, после 429) — квоту CoinGecko не тратим
+            return
+        except (aiohttp.ClientError, asyncio.TimeoutError, ExplorerError) as e:
+            logger.warning("Не удалось обновить курсы валют: %s", e)
+            return
+
+        now = time.monotonic()
+        for symbol, coin_id in COINGECKO_IDS.items():
+            usd = data.get(coin_id, {}).get("usd")
+            if usd:
+                self._rates[symbol] = (float(usd), now)
+
+    async def run(self):
+        """
+        Фоновое обновление: курс перезапрашивается до того, как истечёт ttl.
+        """
+        while True:
+            await self.refresh()
+            await asyncio.sleep(self.ttl / 2)
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+
+rate_service = RateService(
+    ttl=float(os.getenv("RATES_TTL", 60)),
+    stale_grace=float(os.getenv("RATES_STALE_GRACE", 300)),
+    api_url=os.getenv("COINGECKO_API_URL", "https://api.coingecko.com/api/v3"),
+)
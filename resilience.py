@@ -0,0 +1,245 @@
+import asyncio
+import logging
+import random
+import time
+
+import aiohttp
+
+from metrics import Gauge
+
+logger = logging.getLogger(__name__)
+
+# Сколько ошибок подряд размыкают автомат
+FAILURE_THRESHOLD = 5
+# На сколько секунд размыкается автомат; при неудачной пробе срок удваивается до MAX_OPEN_TIME
+OPEN_TIME = 15
+MAX_OPEN_TIME = 300
+# Повторы одного запроса: экспоненциальная задержка с jitter, не дольше MAX_RETRY_DELAY
+MAX_RETRIES = 2
+BASE_RETRY_DELAY = 0.5
+MAX_RETRY_DELAY = 8
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class ExplorerError(Exception):
+    """
+    Обозреватель вернул ошибку в теле ответа (лимит запросов, неверный ключ и т.п.).
+    """
+
+
+class RateLimitError(ExplorerError):
+    """
+    Провайдер ответил 429 или сообщил о превышении лимита.
+    """
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class ProviderUnavailableError(ExplorerError):
+    """
+    Автомат провайдера разомкнут: запрос не отправлялся.
+    """
+
+    def __init__(self, provider, retry_in):
+        super().__init__(f"{provider} временно недоступен, повтор через {retry_in:.0f} с")
+        self.provider = provider
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    """
+    Автомат на провайдера: после FAILURE_THRESHOLD ошибок подряд или ответа 429
+    запросы к провайдеру не отправляются open_time секунд и сразу завершаются
+    ProviderUnavailableError. Затем пропускается один пробный запрос: успех
+    замыкает автомат, ошибка размыкает его снова на вдвое больший срок.
+    """
+
+    def __init__(self, name, failure_threshold=FAILURE_THRESHOLD, open_time=OPEN_TIME, max_open_time=MAX_OPEN_TIME):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.open_time = open_time
+        self.max_open_time = max_open_time
+        self.state = CLOSED
+        self.failures = 0  # Ошибок подряд
+        self.last_error = None
+        self._opened_for = open_time
+        self._retry_at = 0.0
+        self._probe_in_flight = False
+
+    def retry_in(self):
+        return max(0.0, self._retry_at - time.monotonic())
+
+    def is_available(self):
+        """
+        Можно ли сейчас отправить запрос (без учёта занятой пробы).
+        """
+        return self.state == CLOSED or self.retry_in() == 0
+
+    def before_call(self):
+        """
+        Пропускает запрос или поднимает ProviderUnavailableError. True, если запрос — пробный.
+        """
+        if self.state == CLOSED:
+            return False
+        if self.retry_in() > 0 or self._probe_in_flight:
+            raise ProviderUnavailableError(self.name, max(self.retry_in(), 1))
+        # Срок вышел — пропускаем один пробный запрос
+        self.state = HALF_OPEN
+        self._probe_in_flight = True
+        return True
+
+    def abandon_probe(self):
+        """
+        Пробный запрос отменён, не дав ответа: следующий запрос станет новой пробой.
+        """
+        self._probe_in_flight = False
+
+    def record_success(self):
+        if self.state != CLOSED:
+            logger.info("Провайдер %s снова доступен", self.name)
+        self.state = CLOSED
+        self.failures = 0
+        self._opened_for = self.open_time
+        self._probe_in_flight = False
+
+    def record_failure(self, error, retry_after=None):
+        self.failures += 1
+        self.last_error = f"{type(error).__name__}: {error}"
+        if self.state == HALF_OPEN:
+            self._open(min(self._opened_for * 2, self.max_open_time))
+        elif retry_after is not None or isinstance(error, RateLimitError):
+            # Провайдер сам попросил подождать — не тратим квоту до истечения срока
+            self._open(retry_after or self._opened_for)
+        elif self.failures >= self.failure_threshold:
+            self._open(self._opened_for)
+
+    def _open(self, seconds):
+        if self.state != OPEN:
+            logger.warning("Провайдер %s недоступен на %.0f с: %s", self.name, seconds, self.last_error)
+        self.state = OPEN
+        self._opened_for = seconds
+        self._retry_at = time.monotonic() + seconds
+        self._probe_in_flight = False
+
+    def reset(self):
+        """
+        Возвращает автомат в исходное состояние (между прогонами нагрузочных тестов).
+        """
+        self.record_success()
+        self.last_error = None
+        self._retry_at = 0.0
+
+    def health(self):
+        return {
+            "state": self.state if self.state == CLOSED or self.retry_in() else HALF_OPEN,
+            "failures": self.failures,
+            "retry_in": round(self.retry_in(), 1),
+            "last_error": self.last_error,
+        }
+
+
+_breakers = {}
+
+
+def get_breaker(name):
+    """
+    Общий автомат провайдера: все клиенты одного провайдера видят одно состояние.
+    """
+    breaker = _breakers.get(name)
+    if breaker is None:
+        breaker = _breakers[name] = CircuitBreaker(name)
+    return breaker
+
+
+def is_available(name):
+    breaker = _breakers.get(name)
+    return breaker is None or breaker.is_available()
+
+
+def reset_breakers():
+    for breaker in _breakers.values():
+        breaker.reset()
+
+
+def provider_health():
+    """
+    Состояние всех провайдеров, к которым уже были запросы.
+    """
+    return {name: breaker.health() for name, breaker in _breakers.items()}
+
+
+Gauge(
+    "provider_circuit_open", "Автомат провайдера разомкнут (1) или замкнут (0)", ("provider",),
+    collect=lambda: {(name,): float(health["state"] != CLOSED) for name, health in provider_health().items()},
+)
+Gauge(
+    "provider_consecutive_failures", "Ошибки провайдера подряд с последнего успешного запроса", ("provider",),
+    collect=lambda: {(name,): health["failures"] for name, health in provider_health().items()},
+)
+
+
+def _retry_after(error):
+    if isinstance(error, RateLimitError):
+        return error.retry_after
+    headers = getattr(error, "headers", None) or {}
+    try:
+        return float(headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+
+def is_transient(error):
+    if isinstance(error, aiohttp.ClientResponseError):
+        return error.status == 429 or error.status >= 500
+    return isinstance(error, (aiohttp.ClientError, asyncio.TimeoutError, RateLimitError))
+
+
+def backoff_delay(attempt, base=BASE_RETRY_DELAY, cap=MAX_RETRY_DELAY):
+    """
+    Экспоненциальная задержка с полным jitter: случайная величина от 0 до base * 2^attempt.
+    """
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+async def call_with_breaker(breaker, request, max_retries=MAX_RETRIES):
+    """
+    Выполняет request() через автомат провайдера. Временные ошибки (сеть, 5xx, 429)
+    повторяются с экспоненциальной задержкой; если автомат разомкнут дольше чем на
+    MAX_RETRY_DELAY (например, по Retry-After), ошибка сразу уходит вызывающему.
+    Ошибки клиента (4xx, кроме 429) не считаются сбоем провайдера.
+    """
+    attempt = 0
+    while True:
+        probe = breaker.before_call()
+        try:
+            result = await request()
+        except asyncio.CancelledError:
+            # Отмену (остановка фоновой задачи, завершение процесса) не считаем ни успехом, ни сбоем,
+            # но пробу освобождаем, иначе автомат навсегда останется полуоткрытым
+            if probe:
+                breaker.abandon_probe()
+            raise
+        except Exception as e:
+            if not is_transient(e):
+                breaker.record_success()
+                raise
+            retry_after = _retry_after(e)
+            error = e
+            if isinstance(e, aiohttp.ClientResponseError) and e.status == 429:
+                error = RateLimitError(f"{breaker.name}: 429 Too Many Requests", retry_after)
+            breaker.record_failure(error, retry_after)
+            # Короткое окно (Retry-After в пределах MAX_RETRY_DELAY) выжидаем, длинное — нет
+            if attempt >= max_retries or breaker.retry_in() > MAX_RETRY_DELAY:
+                if error is e:
+                    raise
+                raise error from e
+            await asyncio.sleep(max(breaker.retry_in(), backoff_delay(attempt)))
+            attempt += 1
+        else:
+            breaker.record_success()
+            return result
@@ -1,4 +1,5 @@
-import asyncio
+import math
+import time
 from datetime import datetime
 
 import os
@@ -7,17 +8,22 @@ from aiogram import Router
 
 from api_calls import get_sol_usd_rate, get_ton_usd_rate, \
     get_bnb_usd_rate, get_eth_usd_rate, get_trx_usd_rate
-from crud.subscriptions import extend_subscription, create_subscription
-from crud.transactions import get_transaction_by_telegram_id, create_transaction
-from crud.users import get_user_by_telegram_id
+from activation import activate_subscription
+from amount_slots import amount_allocator
+from cache import MISSING, TTLCache
+from metrics import transactions_paid
+from sqlalchemy.exc import IntegrityError
+from resilience import is_available
+from crud.transactions import get_transaction_by_telegram_id, create_transaction, get_pending_transactions
 from aiogram import F
 from aiogram.types import CallbackQuery
+from sqlalchemy.ext.asyncio import AsyncSession
 from keyboards import (
     get_check_payment_keyboard, get_currency_selection_keyboard, get_with_chat_inline_keyboard,
     get_without_chat_inline_keyboard,
 
 )
-from main import bot, session
+from main import bot
 from dotenv import load_dotenv
 from api_calls import validate_payment
 
@@ -25,6 +31,11 @@ from constants import *
 
 load_dotenv()
 
+# id транзакции -> когда можно проверять снова (по time.monotonic()) после неудачной проверки.
+# Повторные нажатия одного пользователя и так идут по очереди (UserSerializationMiddleware),
+# поэтому сеть за окно проверяется один раз
+payment_check_cooldowns = TTLCache(ttl=PAYMENT_CHECK_COOLDOWN)
+
 CURRENCY_HANDLERS = {
     "SOL": ("SOL", "SOL", get_sol_usd_rate),
     "TON": ("TON", "TON", get_ton_usd_rate),
@@ -40,12 +51,12 @@ payments_router = Router()  # Создаем роутер для всех обр
 
 
 @payments_router.callback_query(F.data.startswith("with_chat_") | F.data.startswith("without_chat_"))
-async def tariff_callback(callback: CallbackQuery) -> None:
+async def tariff_callback(callback: CallbackQuery, session: AsyncSession) -> None:
     """
     Обработчик выбора тарифа.
     """
     user_id = callback.from_user.id
-    existing_transaction = get_transaction_by_telegram_id(session, user_id)
+    existing_transaction = await get_transaction_by_telegram_id(session, user_id)
 
     if existing_transaction and existing_transaction.status == "Pending" and \
             (datetime.utcnow() - existing_transaction.created_at).total_seconds() < 15 * 60:
@@ -60,19 +71,12 @@ async def tariff_callback(callback: CallbackQuery) -> None:
     period = callback.data.split("_")[-1]  # Например, "1w", "1m", "3m"
 
     # Определяем цену
-    base_prices = {
-        "1m": 50,  # Базовая цена "С чатом" за месяц
-        "3m": 130,  # Базовая цена "С чатом" за три месяца
-        "6m": 250,
-        "1y": 490,
-        "lt": 1500,
-    }
-    amount = base_prices.get(period, 0) / 2 if not is_with_chat else base_prices.get(period, 0)
+    amount = TARIFF_PRICES.get((is_with_chat, period), 0)
 
     subscription_type = "с возможность писать" if is_with_chat else "без возможности писать"
 
     # Создаём транзакцию
-    create_transaction(
+    await create_transaction(
         session=session,
         telegram_id=user_id,
         blockchain="",  # Укажите конкретную блокчейн-сеть
@@ -82,16 +86,8 @@ async def tariff_callback(callback: CallbackQuery) -> None:
         period=period,
     )
 
-    str_period = {
-        "1m": "1 месяц",
-        "3m": "3 месяца",
-        "6m": "полгода",
-        "1y": "год",
-        "lt": "вечно",
-    }
-
     await callback.message.edit_text(
-        f"Вы выбрали подписку {subscription_type} на {str_period.get(period)}. Стоимость: USD {amount}.\nВыберите валюту для оплаты.",
+        f"Вы выбрали подписку {subscription_type} на {PERIOD_TITLES.get(period)}. Стоимость: USD {amount}.\nВыберите валюту для оплаты.",
         reply_markup=get_currency_selection_keyboard()
     )
 
@@ -125,11 +121,34 @@ def calculate_expected_amount(transaction, rate_func):
     return expected_amount, rate
 
 
-def update_transaction(session, transaction, blockchain, currency, expected_amount):
-    transaction.blockchain = blockchain
-    transaction.currency = currency
-    transaction.expected_amount = expected_amount
-    session.commit()
+# Сколько раз подбирать другую сумму, если выбранную уже занял другой воркер
+AMOUNT_ALLOCATION_ATTEMPTS = 5
+
+
+async def update_transaction(session, transaction, blockchain, currency, base_amount):
+    """
+    Закрепляет за транзакцией уникальную сумму около base_amount.
+    Уникальность среди воркеров обеспечивает индекс ix_transactions_pending_amount:
+    если сумму уже занял другой процесс, индекс сверяется с базой и подбирается следующая.
+    """
+    transaction_id = transaction.id
+    for _ in range(AMOUNT_ALLOCATION_ATTEMPTS):
+        expected_amount = amount_allocator.allocate(blockchain, currency, base_amount, transaction_id)
+        try:
+            async with session.begin_nested():
+                transaction.blockchain = blockchain
+                transaction.currency = currency
+                transaction.expected_amount = expected_amount
+        except IntegrityError:
+            amount_allocator.release(transaction_id)
+            await session.refresh(transaction)
+            snapshot_at = time.monotonic()
+            amount_allocator.sync(blockchain, currency, await get_pending_transactions(session, blockchain, currency),
+                                  snapshot_at)
+            continue
+        await session.commit()
+        return expected_amount
+    raise ValueError("Не удалось подобрать уникальную сумму оплаты, попробуйте позже.")
 
 
 async def send_payment_instruction(callback, transaction, wallet_address):
@@ -147,9 +166,9 @@ async def send_payment_instruction(callback, transaction, wallet_address):
 
 
 @payments_router.callback_query(F.data.startswith("pay_in_"))
-async def handle_payment(callback: CallbackQuery):
+async def handle_payment(callback: CallbackQuery, session: AsyncSession):
     user_id = callback.from_user.id
-    transaction = get_transaction_by_telegram_id(session, user_id)
+    transaction = await get_transaction_by_telegram_id(session, user_id)
 
     if not transaction:
         await callback.message.edit_text("Активная транзакция не найдена или уже выбрана валюта.")
@@ -164,14 +183,27 @@ async def handle_payment(callback: CallbackQuery):
 
     blockchain, currency, rate_func = handler
 
+    # Сеть недоступна — не выдаём сумму, которую сейчас нельзя проверить
+    if not is_available(blockchain):
+        await callback.message.edit_text(
+            f"Сеть {blockchain} сейчас недоступна. Выберите другую валюту или попробуйте позже.",
+            reply_markup=get_currency_selection_keyboard(),
+        )
+        return
+
+    # Суммы могли выдать другие воркеры — сверяем индекс с базой
+    snapshot_at = time.monotonic()
+    amount_allocator.sync(blockchain, currency, await get_pending_transactions(session, blockchain, currency),
+                          snapshot_at)
     try:
         expected_amount, rate = calculate_expected_amount(transaction, rate_func)
+        # Закрепляем за транзакцией уникальную сумму, чтобы перевод однозначно указывал на неё
+        await update_transaction(session, transaction, blockchain, currency, expected_amount)
     except ValueError as e:
         await callback.message.edit_text(str(e))
         return
 
     wallet_address = os.environ.get(f"{blockchain}_WALLET_ADDRESS")
-    update_transaction(session, transaction, blockchain, currency, expected_amount)
 
     await send_payment_instruction(
         callback, transaction, wallet_address
@@ -179,68 +211,61 @@ async def handle_payment(callback: CallbackQuery):
 
 
 @payments_router.callback_query(F.data == "cancel_payment")
-async def cancel_payment_callback(callback: CallbackQuery) -> None:
+async def cancel_payment_callback(callback: CallbackQuery, session: AsyncSession) -> None:
     """
     Обработка отмены платежа.
     """
     user_id = callback.from_user.id
-    transaction = get_transaction_by_telegram_id(session, user_id)
+    transaction = await get_transaction_by_telegram_id(session, user_id)
 
     if transaction and transaction.status == "Pending":
         # Удаляем транзакцию из базы
         transaction.status = "Canceled"
-        session.commit()
+        await session.commit()
+        amount_allocator.release(transaction.id)
         await callback.message.edit_text("Оплата отменена.")
     else:
         await callback.message.edit_text("Активная заявка на оплату не найдена.")
 
 
+async def _check_payment(session, transaction):
+    """
+    Проверяет оплату и выдаёт подписку. Возвращает текст для пользователя или None, если оплаты нет.
+    """
+    if await validate_payment(session, transaction):
+        transactions_paid.inc("button")
+        return await activate_subscription(session, bot, transaction)
+    payment_check_cooldowns.set(transaction.id, time.monotonic() + PAYMENT_CHECK_COOLDOWN)
+    return None
+
+
 @payments_router.callback_query(F.data == "check_payment")
-async def check_payment_callback(callback: CallbackQuery) -> None:
+async def check_payment_callback(callback: CallbackQuery, session: AsyncSession) -> None:
     user_id = callback.from_user.id
-    transaction = get_transaction_by_telegram_id(session, user_id)
+    transaction = await get_transaction_by_telegram_id(session, user_id)
 
     if not transaction or transaction.status != "Pending":
         await callback.message.edit_text("Не найдена активная транзакция для проверки.")
         return
 
-    if validate_payment(transaction):
-        user = get_user_by_telegram_id(session, user_id)
-
-        # Если у пользователя есть пригласивший, продлеваем подписку пригласившему
-        if user.invited_by:
-            extend_subscription(session, user.invited_by)
-            await bot.send_message(chat_id=user.invited_by, text="Ваша подписка была продлена благодаря рефералу!")
-
-        # Определяем тип подписки
-        subscription_type = "Без чата" if not transaction.with_chat else "С чатом"
-
-        base_time = {
-            "1m": 30,
-            "3m": 120,
-            "6m": 180,
-            "1y": 365,
-            "lt": 15000,
-        }
-
-        days = base_time.get(transaction.period, 30)
-
-        # Создаем подписку
-        subscription = create_subscription(session, user_id, subscription_type, days)
-        session.commit()
-
-        # Отправляем ссылку на чат, если подписка "С чатом"
-        invite_link = await bot.create_chat_invite_link(CHAT_ID, expire_date=None, member_limit=1)
-        if subscription_type == "С чатом":
-            await callback.message.edit_text(
-                f"Оплата успешно выполнена! Вот ваша одноразовая ссылка на чат:\n\n{invite_link.invite_link}"
-            )
-        else:
-            await callback.message.edit_text(
-                f"Оплата успешно выполнена! Ваша подписка без возможности писать активирована до {subscription.expiration_date.strftime('%Y-%m-%d')}."
-                f"\n\nСсылка: {invite_link.invite_link}"
-            )
+    if not transaction.blockchain:
+        await callback.answer("Сначала выберите валюту оплаты.")
+        return
+
+    # Недавно проверяли и оплаты не было — отвечаем без обращения к сети
+    retry_at = payment_check_cooldowns.get(transaction.id)
+    if retry_at is not MISSING:
+        seconds = max(1, math.ceil(retry_at - time.monotonic()))
+        await callback.answer(f"Оплата еще не поступила. Повторная проверка через {seconds} с.")
+        return
+
+    text = await _check_payment(session, transaction)
+    if text:
+        await callback.message.edit_text(text)
+    elif not is_available(transaction.blockchain):
+        await callback.answer(
+            f"Сеть {transaction.blockchain} сейчас недоступна, проверить оплату не получилось. Попробуйте позже.",
+            show_alert=True,
+        )
     else:
-        temp_message = await callback.message.answer("Оплата еще не поступила, попробуйте позже.")
-        await asyncio.sleep(5)
-        await temp_message.delete()
+        await callback.answer(f"Оплата еще не поступила, попробуйте через {PAYMENT_CHECK_COOLDOWN} с.")
@@ -0,0 +1,140 @@
+import asyncio
+import heapq
+import logging
+from datetime import datetime, timedelta
+
+from constants import CHAT_ID
+from metrics import Gauge
+from outbox import outbox, PRIORITY_LOW
+
+logger = logging.getLogger(__name__)
+
+# За сколько до окончания подписки напоминать о продлении
+REMINDER_BEFORE = timedelta(days=3)
+# Как часто ведущий воркер перечитывает подписки, созданные или продлённые другими воркерами
+RESYNC_INTERVAL = 60
+
+REMINDER = "reminder"
+KICK = "kick"
+
+
+class SubscriptionScheduler:
+    """
+    Планировщик событий подписок на куче таймеров.
+
+    В куче лежат ближайшие события (напоминание, исключение из чата), цикл спит
+    ровно до следующего из них. При создании или продлении подписки события
+    перепланируются; устаревшие записи кучи пропускаются при извлечении.
+    Каждое событие записывается в subscription_events и срабатывает один раз.
+    """
+
+    def __init__(self):
+        self._heap = []  # (срок, вид события, user_id, дата окончания подписки)
+        self._current = {}  # user_id -> актуальная дата окончания подписки
+        self._wakeup = asyncio.Event()
+
+    def schedule(self, subscription):
+        """
+        Планирует события подписки (вызывается из crud при изменении даты окончания).
+        """
+        user_id, expiration_date = subscription.user_id, subscription.expiration_date
+        if self._current.get(user_id) == expiration_date:
+            return
+        self._current[user_id] = expiration_date
+        earliest = self._heap[0][0] if self._heap else None
+
+        heapq.heappush(self._heap, (expiration_date - REMINDER_BEFORE, REMINDER, user_id, expiration_date))
+        heapq.heappush(self._heap, (expiration_date, KICK, user_id, expiration_date))
+
+        # Будим цикл, только если новое событие раньше того, которого он ждёт
+        if earliest is None or self._heap[0][0] < earliest:
+            self._wakeup.set()
+
+    def unschedule(self, user_id):
+        self._current.pop(user_id, None)
+
+    async def load(self, session):
+        """
+        Заполняет кучу по подпискам из базы (при старте бота и при пересинхронизации).
+        Уже запланированные подписки не дублируются.
+        """
+        from crud.subscriptions import get_subscriptions
+
+        for subscription in await get_subscriptions(session):
+            self.schedule(subscription)
+
+    async def resync(self, session_maker, interval=RESYNC_INTERVAL):
+        """
+        Подхватывает подписки, изменённые в других процессах (нужно только при нескольких воркерах).
+        Читаются лишь строки, изменённые с прошлого прохода; окно берётся с запасом в один
+        интервал на транзакции, закоммиченные позже, чем была проставлена метка.
+        """
+        from crud.subscriptions import get_subscriptions_changed_since
+
+        since = datetime.utcnow()
+        while True:
+            await asyncio.sleep(interval)
+            started = datetime.utcnow()
+            try:
+                async with session_maker() as session:
+                    for subscription in await get_subscriptions_changed_since(session, since):
+                        self.schedule(subscription)
+            except Exception:
+                logger.exception("Не удалось перечитать подписки")
+                continue
+            since = started - timedelta(seconds=interval)
+
+    async def run(self, session_maker):
+        while True:
+            self._wakeup.clear()
+            now = datetime.utcnow()
+            while self._heap and self._heap[0][0] <= now:
+                _, kind, user_id, expiration_date = heapq.heappop(self._heap)
+                # Подписку продлили или удалили после постановки события
+                if self._current.get(user_id) != expiration_date:
+                    continue
+                # Напоминать о подписке, которая уже закончилась, поздно
+                if kind == REMINDER and expiration_date <= now:
+                    continue
+                try:
+                    async with session_maker() as session:
+                        await self._fire(session, kind, user_id, expiration_date)
+                except Exception:
+                    logger.exception("Не удалось обработать событие %s для пользователя %s", kind, user_id)
+
+            timeout = (self._heap[0][0] - datetime.utcnow()).total_seconds() if self._heap else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _fire(self, session, kind, user_id, expiration_date):
+        from crud.subscriptions import delete_subscription, record_subscription_event, get_subscription
+
+        # Запись события уникальна: повторно (после рестарта) оно не сработает
+        if not await record_subscription_event(session, user_id, kind, expiration_date):
+            return
+
+        if kind == REMINDER:
+            outbox.send_message(
+                user_id,
+                "Ваша подписка истекает через 3 дня! Пожалуйста, продлите её, чтобы не потерять доступ.",
+                priority=PRIORITY_LOW,
+            )
+        elif kind == KICK:
+            # Удаляем, только если подписку не продлили в другом процессе
+            if not await delete_subscription(session, user_id, expiration_date):
+                subscription = await get_subscription(session, user_id)
+                if subscription is not None:
+                    self.schedule(subscription)
+                return
+            self.unschedule(user_id)
+            # Исключаем пользователя из чата
+            outbox.ban_chat_member(CHAT_ID, user_id)
+            outbox.send_message(user_id, "Ваша подписка на чат истекла.")
+
+
+subscription_scheduler = SubscriptionScheduler()
+
+Gauge("scheduler_heap_size", "События подписок в куче планировщика (включая устаревшие)",
+      collect=lambda: {(): len(subscription_scheduler._heap)})
@@ -0,0 +1,97 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+from amount_slots import MAX_SLOT_DEVIATION, UNCONFIRMED_SLOT_TTL, AmountAllocator
+from constants import PAYMENT_TOLERANCE
+from database import Transaction, close_db, init_db
+
+
+def _pending(transaction_id, amount):
+    return SimpleNamespace(id=transaction_id, blockchain="TON", currency="TON", expected_amount=amount)
+
+
+def test_allocated_amounts_are_unique_and_match_their_owner():
+    allocator = AmountAllocator()
+    amounts = [allocator.allocate("TON", "TON", 10.0, number) for number in range(500)]
+
+    assert len(set(amounts)) == len(amounts)
+    assert all(abs(amount - 10.0) <= 10.0 * MAX_SLOT_DEVIATION for amount in amounts)
+    for number, amount in enumerate(amounts):
+        assert allocator.match("TON", "TON", amount) == number
+
+
+def test_first_slots_have_disjoint_tolerance_windows():
+    allocator = AmountAllocator()
+    first = allocator.allocate("TON", "TON", 10.0, "first")
+    second = allocator.allocate("TON", "TON", 10.0, "second")
+
+    assert abs(first - second) > 2 * PAYMENT_TOLERANCE * first
+    # Перевод с округлением в пределах допуска всё ещё находит свою оплату
+    assert allocator.match("TON", "TON", first * (1 + PAYMENT_TOLERANCE * 0.9)) == "first"
+
+
+def test_sync_adds_amounts_issued_by_other_workers():
+    allocator = AmountAllocator()
+    allocator.sync("TON", "TON", [_pending("other", 10.0)], time.monotonic())
+
+    assert allocator.allocate("TON", "TON", 10.0, "mine") != 10.0
+    assert allocator.match("TON", "TON", 10.0) == "other"
+
+
+def test_sync_keeps_slot_allocated_after_snapshot():
+    allocator = AmountAllocator()
+    snapshot_at = time.monotonic()
+    amount = allocator.allocate("TON", "TON", 10.0, "mine")
+
+    # Снимок прочитан до выдачи суммы, поэтому её в нём нет
+    allocator.sync("TON", "TON", [], snapshot_at)
+
+    assert allocator.match("TON", "TON", amount) == "mine"
+
+
+def test_sync_releases_slot_that_left_pending():
+    allocator = AmountAllocator()
+    amount = allocator.allocate("TON", "TON", 10.0, "mine")
+    allocator.sync("TON", "TON", [_pending("mine", amount)], time.monotonic())
+
+    # Оплату подтвердил или отменил другой воркер: в следующем снимке её нет
+    allocator.sync("TON", "TON", [], time.monotonic())
+
+    assert allocator.match("TON", "TON", amount) is None
+
+
+def test_sync_releases_unconfirmed_slot_only_after_ttl():
+    allocator = AmountAllocator()
+    amount = allocator.allocate("TON", "TON", 10.0, "mine")
+
+    allocator.sync("TON", "TON", [], time.monotonic() + 1)
+    assert allocator.match("TON", "TON", amount) == "mine"
+
+    allocator.sync("TON", "TON", [], time.monotonic() + UNCONFIRMED_SLOT_TTL + 1)
+    assert allocator.match("TON", "TON", amount) is None
+
+
+def test_database_rejects_duplicate_pending_amounts(tmp_path):
+    dsn = f"sqlite+aiosqlite:///{tmp_path / 'database.db'}"
+
+    def pending(initiator, status="Pending"):
+        return Transaction(initiator=initiator, blockchain="TON", currency="TON", expected_amount=10.0,
+                           status=status, with_chat=True)
+
+    async def insert_duplicates():
+        session_maker = await init_db(dsn)
+        try:
+            async with session_maker() as session:
+                session.add_all([pending(1), pending(2, status="Success")])
+                await session.commit()
+                session.add(pending(3))
+                await session.commit()
+        finally:
+            await close_db(dsn)
+
+    with pytest.raises(IntegrityError):
+        asyncio.run(insert_duplicates())
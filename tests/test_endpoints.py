@@ -0,0 +1,71 @@
+import asyncio
+import time
+
+import aiohttp
+import pytest
+
+import endpoints
+from endpoints import EndpointPool
+
+
+def _response_error(status):
+    request_info = aiohttp.RequestInfo(url="http://node", method="GET", headers={}, real_url="http://node")
+    return aiohttp.ClientResponseError(request_info, (), status=status)
+
+
+def test_transient_error_fails_over_to_next_node():
+    pool = EndpointPool(["http://a", "http://b"])
+    called = []
+
+    async def send(url):
+        called.append(url)
+        if len(called) == 1:
+            raise aiohttp.ClientConnectionError("connection reset")
+        return url
+
+    result = asyncio.run(pool.call(send))
+
+    failed = next(endpoint for endpoint in pool.endpoints if endpoint.url == called[0])
+    assert result == called[1] != called[0]
+    assert failed.errors == 1 and not failed.is_healthy()
+    # Сбойный узел пробуется последним, пока не истечёт пауза
+    assert pool.ranked()[-1] is failed
+
+
+def test_client_error_is_not_retried_on_other_nodes():
+    pool = EndpointPool(["http://a", "http://b"])
+    called = []
+
+    async def send(url):
+        called.append(url)
+        raise _response_error(400)
+
+    with pytest.raises(aiohttp.ClientResponseError):
+        asyncio.run(pool.call(send))
+    assert len(called) == 1
+    assert all(endpoint.is_healthy() for endpoint in pool.endpoints)
+
+
+def test_slow_node_is_hedged(monkeypatch):
+    monkeypatch.setattr(endpoints, "HEDGE_DEFAULT_DELAY", 0.05)
+    pool = EndpointPool(["http://a", "http://b"])
+    called, cancelled = [], []
+
+    async def send(url):
+        called.append(url)
+        if len(called) == 1:
+            try:
+                await asyncio.sleep(5)
+            except asyncio.CancelledError:
+                cancelled.append(url)
+                raise
+        return url
+
+    started = time.monotonic()
+    result = asyncio.run(pool.call(send))
+
+    slow, fast = called
+    assert result == fast
+    assert time.monotonic() - started < 1
+    assert cancelled == [slow]
+    assert next(endpoint for endpoint in pool.endpoints if endpoint.url == fast).hedged == 1
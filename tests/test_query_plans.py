@@ -0,0 +1,18 @@
+import asyncio
+
+from database import close_db, init_db
+from migrations import find_full_scans
+
+
+def test_hot_queries_use_indexes(tmp_path):
+    dsn = f"sqlite+aiosqlite:///{tmp_path / 'database.db'}"
+
+    async def full_scans():
+        session_maker = await init_db(dsn)
+        try:
+            async with session_maker.kw["bind"].connect() as conn:
+                return await conn.run_sync(find_full_scans)
+        finally:
+            await close_db(dsn)
+
+    assert asyncio.run(full_scans()) == {}
@@ -0,0 +1,112 @@
+import asyncio
+
+import aiohttp
+import pytest
+
+from resilience import CLOSED, OPEN, CircuitBreaker, ProviderUnavailableError, call_with_breaker
+
+OPEN_TIME = 0.05
+
+
+def _breaker():
+    return CircuitBreaker("test", failure_threshold=2, open_time=OPEN_TIME, max_open_time=1)
+
+
+async def _fail():
+    raise aiohttp.ClientConnectionError("connection reset")
+
+
+async def _ok():
+    return "ok"
+
+
+async def _open(breaker):
+    for _ in range(breaker.failure_threshold):
+        with pytest.raises(aiohttp.ClientConnectionError):
+            await call_with_breaker(breaker, _fail, max_retries=0)
+
+
+def test_open_breaker_rejects_without_calling_provider():
+    breaker = _breaker()
+    calls = 0
+
+    async def request():
+        nonlocal calls
+        calls += 1
+        return "ok"
+
+    async def run():
+        await _open(breaker)
+        with pytest.raises(ProviderUnavailableError):
+            await call_with_breaker(breaker, request, max_retries=0)
+
+    asyncio.run(run())
+    assert breaker.state == OPEN
+    assert calls == 0
+
+
+def test_failed_probe_doubles_open_time():
+    breaker = _breaker()
+
+    async def run():
+        await _open(breaker)
+        await asyncio.sleep(OPEN_TIME)
+        with pytest.raises(aiohttp.ClientConnectionError):
+            await call_with_breaker(breaker, _fail, max_retries=0)
+
+    asyncio.run(run())
+    assert breaker.state == OPEN
+    assert OPEN_TIME < breaker.retry_in() <= 2 * OPEN_TIME
+
+
+def test_successful_probe_closes_breaker():
+    breaker = _breaker()
+
+    async def run():
+        await _open(breaker)
+        await asyncio.sleep(OPEN_TIME)
+        return await call_with_breaker(breaker, _ok, max_retries=0)
+
+    assert asyncio.run(run()) == "ok"
+    assert breaker.state == CLOSED
+    assert breaker.failures == 0
+
+
+def test_only_one_probe_in_flight():
+    breaker = _breaker()
+
+    async def run():
+        await _open(breaker)
+        await asyncio.sleep(OPEN_TIME)
+        release = asyncio.Event()
+
+        async def slow():
+            await release.wait()
+            return "ok"
+
+        probe = asyncio.create_task(call_with_breaker(breaker, slow, max_retries=0))
+        await asyncio.sleep(0)
+        with pytest.raises(ProviderUnavailableError):
+            await call_with_breaker(breaker, _ok, max_retries=0)
+        release.set()
+        return await probe
+
+    assert asyncio.run(run()) == "ok"
+    assert breaker.state == CLOSED
+
+
+def test_cancelled_probe_lets_next_call_probe():
+    breaker = _breaker()
+
+    async def run():
+        await _open(breaker)
+        await asyncio.sleep(OPEN_TIME)
+        probe = asyncio.create_task(call_with_breaker(breaker, asyncio.Event().wait, max_retries=0))
+        await asyncio.sleep(0)
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+        return await call_with_breaker(breaker, _ok, max_retries=0)
+
+    assert asyncio.run(run()) == "ok"
+    assert breaker.state == CLOSED
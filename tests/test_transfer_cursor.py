@@ -0,0 +1,79 @@
+import asyncio
+
+import pytest
+
+from api_calls import MAX_PAGES, PAGE_SIZE, BinanceSmartChainAPI, SolanaAPI, TonAPI, TronAPI
+from fake_explorer import TOKEN_CONTRACTS, WALLETS, FakeExplorer, synthetic_history
+
+CLIENTS = {
+    ("SOL", False): lambda: SolanaAPI(["http://sol.invalid"]),
+    ("BSC", False): lambda: BinanceSmartChainAPI(None),
+    ("BSC", True): lambda: BinanceSmartChainAPI(None),
+    ("TRON", False): lambda: TronAPI(None),
+    ("TRON", True): lambda: TronAPI(None),
+    ("TON", False): lambda: TonAPI(None),
+}
+# История длиннее, чем читается за один вызов: курсор догоняет её за несколько проходов
+HISTORY = MAX_PAGES * PAGE_SIZE * 2 + 100
+
+
+def _cursor_at(explorer, entry):
+    rendered = explorer.render(entry)
+    if explorer.blockchain == "SOL":
+        return entry.tx_hash
+    if explorer.blockchain == "BSC":
+        return rendered["blockNumber"]
+    if explorer.blockchain == "TRON":
+        return str(rendered["block_ts"] if explorer.token else rendered["timestamp"])
+    return f"{rendered['transaction_id']['lt']}:{entry.tx_hash}"
+
+
+@pytest.mark.parametrize("blockchain, token", CLIENTS)
+def test_truncated_scan_resumes_without_gaps(blockchain, token):
+    explorer = FakeExplorer(blockchain, synthetic_history(HISTORY), WALLETS[blockchain], token)
+    contract = TOKEN_CONTRACTS[blockchain] if token else None
+    cursor = _cursor_at(explorer, explorer.entries[-1])
+    # Записи после курсора; неуспешные переводы не все провайдеры помечают, поэтому они необязательны
+    after_cursor = [entry for entry in explorer.entries[:-1] if entry.incoming]
+    expected = {entry.tx_hash for entry in after_cursor if not entry.failed}
+
+    async def catch_up():
+        api = explorer.attach(CLIENTS[blockchain, token]())
+        nonlocal cursor
+        received, passes = [], 0
+        try:
+            while True:
+                transfers, cursor = await api.fetch_transfers_since(explorer.wallet_address, contract, cursor)
+                received.extend(transfers)
+                passes += 1
+                if passes == 1:
+                    # Пока дочитывается пропуск, приходят новые переводы: их тоже нельзя потерять
+                    new = [explorer.add_transfer(amount) for amount in (1.5, 2.5)]
+                    after_cursor.extend(new)
+                    expected.update(entry.tx_hash for entry in new)
+                if "|" not in cursor:
+                    return received, passes
+        finally:
+            await api.close()
+
+    received, passes = asyncio.run(catch_up())
+    received = {transfer.tx_hash for transfer in received}
+    assert passes > 1
+    assert expected <= received
+    assert received <= {entry.tx_hash for entry in after_cursor}
+
+
+def test_cursor_without_truncation_stays_plain():
+    explorer = FakeExplorer("TON", synthetic_history(PAGE_SIZE), WALLETS["TON"])
+    cursor = _cursor_at(explorer, explorer.entries[-1])
+
+    async def fetch():
+        api = explorer.attach(TonAPI(None))
+        try:
+            return await api.fetch_transfers_since(explorer.wallet_address, None, cursor)
+        finally:
+            await api.close()
+
+    transfers, new_cursor = asyncio.run(fetch())
+    assert "|" not in new_cursor
+    assert new_cursor == _cursor_at(explorer, explorer.entries[0])
@@ -0,0 +1,125 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+from multiprocessing.connection import wait
+
+from aiohttp import web
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from dotenv import load_dotenv
+
+from logs import setup_logging
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Публичный адрес бота, например https://bot.example.com. Без него вебхук не регистрируется
+# (удобно для локальных прогонов с fake_telegram.py)
+WEBHOOK_BASE_URL = os.getenv("WEBHOOK_BASE_URL")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+# Telegram присылает его в заголовке X-Telegram-Bot-Api-Secret-Token
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+WEBAPP_HOST = os.getenv("WEBAPP_HOST", "0.0.0.0")
+WEBAPP_PORT = int(os.getenv("WEBAPP_PORT", 8080))
+# Число процессов, слушающих один порт
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", os.cpu_count() or 1))
+
+
+async def prepare():
+    """
+    Выполняется один раз в главном процессе: схема БД и регистрация вебхука.
+    """
+    from main import bot
+    from database import close_db, init_db
+    from callbacks import router
+    from routers import payments_router
+
+    # Миграции — до запуска воркеров, чтобы они не применяли их наперегонки.
+    # Воркеры открывают собственные пулы, соединения главного процесса больше не нужны
+    await init_db()
+    await close_db()
+    if WEBHOOK_BASE_URL:
+        allowed_updates = set(router.resolve_used_update_types()) | set(payments_router.resolve_used_update_types())
+        await bot.set_webhook(
+            f"{WEBHOOK_BASE_URL}{WEBHOOK_PATH}",
+            secret_token=WEBHOOK_SECRET,
+            allowed_updates=sorted(allowed_updates),
+        )
+    await bot.session.close()
+
+
+async def serve(index=0, workers=1):
+    """
+    Один воркер: aiohttp-сервер на общем порту (SO_REUSEPORT), ядро делит соединения между воркерами.
+    Метрики у каждого воркера свои, поэтому воркер index отдаёт их на METRICS_PORT + index.
+    """
+    from main import METRICS_PORT, bot, dp, setup
+
+    await setup(METRICS_PORT + index if METRICS_PORT is not None else None, workers)
+    app = web.Application()
+    SimpleRequestHandler(dispatcher=dp, bot=bot, secret_token=WEBHOOK_SECRET).register(app, path=WEBHOOK_PATH)
+    # Запуск и остановка диспетчера (startup/shutdown роутеров) вместе с приложением
+    setup_application(app, dp, bot=bot)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, WEBAPP_HOST, WEBAPP_PORT, reuse_port=True)
+    await site.start()
+    logger.info("Воркер %s слушает %s:%s%s", os.getpid(), WEBAPP_HOST, WEBAPP_PORT, WEBHOOK_PATH)
+
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stopping.set)
+    try:
+        await stopping.wait()
+    finally:
+        await runner.cleanup()
+
+
+def _worker_main(index, workers):
+    setup_logging()
+    asyncio.run(serve(index, workers))
+
+
+def run_webhook(workers=WEBHOOK_WORKERS):
+    """
+    Запускает workers процессов и перезапускает упавшие до получения SIGTERM/SIGINT.
+    """
+    asyncio.run(prepare())
+    if workers <= 1:
+        asyncio.run(serve())
+        return
+
+    # spawn: воркеры не наследуют открытые в главном процессе соединения и event loop
+    context = multiprocessing.get_context("spawn")
+    processes = {}
+    stopping = False
+
+    def start_worker(index):
+        process = context.Process(target=_worker_main, args=(index, workers), daemon=False)
+        process.start()
+        processes[process.sentinel] = (index, process)
+
+    def stop(*_):
+        nonlocal stopping
+        stopping = True
+        for _, process in processes.values():
+            if process.is_alive():
+                process.terminate()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    for index in range(workers):
+        start_worker(index)
+    while processes:
+        for sentinel in wait(list(processes)):
+            index, process = processes.pop(sentinel)
+            process.join()
+            if not stopping:
+                logger.warning("Воркер %s завершился с кодом %s, перезапускаем", process.pid, process.exitcode)
+                # Тот же номер: порт метрик остаётся за воркером
+                start_worker(index)